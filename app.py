@@ -1,4 +1,10 @@
+import json
+import os
+import time
+
+import click
 from flask import Flask
+from flask.cli import with_appcontext
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
@@ -11,45 +17,192 @@ from vistas import \
 	VistaEntrenamiento, VistaEntrenamientos, \
   VistaRutinas, VistaRutina,VistaRutinaDiferente, VistaEntrenadores, \
   VistaRutinasEntrenamiento, VistaReporte, VistaRutinaEjercicio, VistaResultadosEntrenamientos
-from vistas.vistas import VistaEntrenador, VistaRutinaEntrenamientoPersona
-
-
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dbapp.sqlite'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'frase-secreta'
-app.config['PROPAGATE_EXCEPTIONS'] = True
-
-app_context = app.app_context()
-app_context.push()
-
-db.init_app(app)
-db.create_all()
-
-cors = CORS(app)
-
-api = Api(app)
-api.add_resource(VistaSignIn, '/signin')
-api.add_resource(VistaLogIn, '/login')
-api.add_resource(VistaPersonas, '/personas/<int:id_usuario>')
-api.add_resource(VistaPersona, '/persona/<int:id_persona>')
-api.add_resource(VistaEjercicios, '/ejercicios')
-api.add_resource(VistaEjercicio, '/ejercicio/<int:id_ejercicio>')
-api.add_resource(VistaEntrenamientos, '/entrenamientos/<int:id_persona>')
-api.add_resource(VistaEntrenamiento, '/entrenamiento/<int:id_entrenamiento>')
-api.add_resource(VistaReporte, '/persona/<int:id_persona>/reporte')
-api.add_resource(VistaEntrenadores, '/entrenadores')
-api.add_resource(VistaEntrenador, '/entrenador/<int:id_usuario>')
-api.add_resource(VistaRutinas, '/rutinas')
-api.add_resource(VistaRutina, '/rutina/<int:id_rutina>')
-api.add_resource(VistaRutinaDiferente, '/rutina/<int:id_rutina>/diferente')
-api.add_resource(VistaRutinaEjercicio, '/rutina/<int:id_rutina>/ejercicio/<int:id_ejercicio>')
-api.add_resource(VistaRutinasEntrenamiento, '/rutinasEntrenamiento')
-api.add_resource(VistaRutinaEntrenamientoPersona, '/rutinasEntrenamientoPersona/<int:id_persona>')
-api.add_resource(VistaResultadosEntrenamientos, '/resultadosEntrenamientos/<int:id_persona>')
-
-jwt = JWTManager(app)
+from vistas.vistas import VistaEntrenador, VistaRutinaEntrenamientoPersona, VistaCacheReportes, VistaReportesEntrenador, \
+  VistaExportaciones, VistaExportacion, VistaArchivoExportacion, VistaImportacion, VistaExportarDatos
+from vistas.utilidad_resumen import UtilidadResumen
+from vistas.utilidad_migraciones import migrar, migrar_total_ejercicios, verificar_planes
+from vistas.utilidad_cache import cache_reportes
+from vistas.utilidad_exportacion import gestor_exportaciones, ExportadorDatos, FORMATOS, TABLAS_EXPORTACION
+
+
+
+# Configuracion por defecto; cada llave se puede reemplazar con una variable de entorno del mismo nombre
+# (los valores que no son texto se leen como JSON) o con el diccionario que recibe create_app
+CONFIGURACION = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///dbapp.sqlite',
+    # Opciones de create_engine, por ejemplo {"pool_size": 5, "pool_pre_ping": true}
+    'SQLALCHEMY_ENGINE_OPTIONS': {},
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'JWT_SECRET_KEY': 'frase-secreta',
+    'PROPAGATE_EXCEPTIONS': True,
+    # Motor de agregacion del reporte de IMC: 'python' (mismo texto y orden de siempre), 'resumen' o 'numpy'
+    'REPORTE_MOTOR': 'python',
+    # Cache de reportes por persona: numero maximo de personas y vigencia en segundos. Es propia de cada proceso,
+    # asi que con varios trabajadores un reporte puede seguir desactualizado en los otros hasta que venza; 0 la desactiva
+    'REPORTES_CACHE_TAMANO': 256,
+    'REPORTES_CACHE_TTL': 300,
+    # Exportaciones asincronas: hilos de trabajo, trabajos en espera y carpeta de los archivos
+    'EXPORTACIONES_HILOS': 2,
+    'EXPORTACIONES_COLA': 20,
+    'EXPORTACIONES_DIRECTORIO': 'exportaciones',
+    # Tamano maximo de pagina de los listados paginados con limit/cursor
+    'PAGINACION_LIMITE_MAXIMO': 500,
+    # Importacion NDJSON: filas por lote (y maximo aceptado en ?lote=), errores reportados y bytes por linea
+    'IMPORTACION_LOTE': 500,
+    'IMPORTACION_LOTE_MAXIMO': 5000,
+    'IMPORTACION_ERRORES_MAXIMOS': 1000,
+    'IMPORTACION_LINEA_MAXIMA': 65536,
+    # Exportacion completa en flujo: filas por bloque (y maximo aceptado en ?lote=)
+    'EXPORTACION_LOTE': 1000,
+    'EXPORTACION_LOTE_MAXIMO': 10000,
+}
+
+
+def leer_entorno(configuracion):
+    valores = {}
+    for llave, defecto in configuracion.items():
+        valor = os.environ.get(llave)
+        if valor is not None:
+            valores[llave] = valor if isinstance(defecto, str) else json.loads(valor)
+    return valores
+
+
+def create_app(config=None):
+    # Crear la aplicacion no abre conexiones ni revisa el esquema: el motor se crea con la primera consulta
+    # y el esquema se crea o migra con `flask crear-esquema`
+    app = Flask(__name__)
+    app.config.from_mapping(CONFIGURACION)
+    app.config.from_mapping(leer_entorno(CONFIGURACION))
+    app.config.from_mapping(config or {})
+
+    db.init_app(app)
+    cache_reportes.configurar(app.config['REPORTES_CACHE_TAMANO'], app.config['REPORTES_CACHE_TTL'])
+    gestor_exportaciones.configurar(app.config['EXPORTACIONES_HILOS'], app.config['EXPORTACIONES_COLA'],
+                                    app.config['EXPORTACIONES_DIRECTORIO'])
+
+    # Los clientes del navegador leen el cursor de la pagina siguiente y el ETag de las respuestas
+    CORS(app, expose_headers=['X-Siguiente-Cursor', 'ETag'])
+
+    api = Api(app)
+    api.add_resource(VistaSignIn, '/signin')
+    api.add_resource(VistaLogIn, '/login')
+    api.add_resource(VistaPersonas, '/personas/<int:id_usuario>')
+    api.add_resource(VistaPersona, '/persona/<int:id_persona>')
+    api.add_resource(VistaEjercicios, '/ejercicios')
+    api.add_resource(VistaEjercicio, '/ejercicio/<int:id_ejercicio>')
+    api.add_resource(VistaEntrenamientos, '/entrenamientos/<int:id_persona>')
+    api.add_resource(VistaEntrenamiento, '/entrenamiento/<int:id_entrenamiento>')
+    api.add_resource(VistaReporte, '/persona/<int:id_persona>/reporte')
+    api.add_resource(VistaEntrenadores, '/entrenadores')
+    api.add_resource(VistaEntrenador, '/entrenador/<int:id_usuario>')
+    api.add_resource(VistaReportesEntrenador, '/entrenador/<int:id_usuario>/reportes')
+    api.add_resource(VistaRutinas, '/rutinas')
+    api.add_resource(VistaRutina, '/rutina/<int:id_rutina>')
+    api.add_resource(VistaRutinaDiferente, '/rutina/<int:id_rutina>/diferente')
+    api.add_resource(VistaRutinaEjercicio, '/rutina/<int:id_rutina>/ejercicio/<int:id_ejercicio>')
+    api.add_resource(VistaRutinasEntrenamiento, '/rutinasEntrenamiento')
+    api.add_resource(VistaRutinaEntrenamientoPersona, '/rutinasEntrenamientoPersona/<int:id_persona>')
+    api.add_resource(VistaResultadosEntrenamientos, '/resultadosEntrenamientos/<int:id_persona>')
+    api.add_resource(VistaCacheReportes, '/cache/reportes')
+    api.add_resource(VistaExportaciones, '/exportaciones')
+    api.add_resource(VistaExportacion, '/exportaciones/<int:id_exportacion>')
+    api.add_resource(VistaArchivoExportacion, '/exportaciones/<int:id_exportacion>/archivo')
+    api.add_resource(VistaImportacion, '/importar/<string:recurso>')
+    api.add_resource(VistaExportarDatos, '/exportar', '/exportar/<string:tabla>')
+
+    JWTManager(app)
+
+    for comando in (crear_esquema, reconstruir_resumen, reconstruir_total_ejercicios, verificar_indices, exportar_datos):
+        app.cli.add_command(comando)
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: reiniciar_proceso(app))
+    return app
+
+
+def reiniciar_proceso(app):
+    # En un servidor prefork cada trabajador descarta las conexiones y los hilos heredados del proceso padre
+    for bind in list(app.extensions['sqlalchemy'].connectors):
+        db.get_engine(app, bind).dispose()
+    gestor_exportaciones.reiniciar()
+
+
+@click.command('crear-esquema')
+@with_appcontext
+def crear_esquema():
+    """Crea las tablas que faltan y aplica las migraciones pendientes."""
+    db.create_all()
+    # create_all no modifica tablas existentes: las columnas e indices nuevos llegan por las migraciones
+    for numero, descripcion, avisos in migrar(db.engine):
+        print(f"Migracion {numero} aplicada: {descripcion}")
+        for aviso in avisos:
+            print(f"  {aviso}")
+    print("Esquema al dia")
+    # Se ejecuta antes de iniciar el servidor: las exportaciones que quedaron a medias ya no van a terminar
+    interrumpidas = gestor_exportaciones.marcar_interrumpidas()
+    if interrumpidas:
+        print(f"Exportaciones interrumpidas marcadas como fallidas: {interrumpidas}")
+
+
+@click.command('reconstruir-resumen')
+@with_appcontext
+def reconstruir_resumen():
+    """Recalcula desde cero la tabla resumen_entrenamiento."""
+    total = UtilidadResumen().reconstruir()
+    print(f"Resumen reconstruido con {total} registros")
+
+
+@click.command('reconstruir-total-ejercicios')
+@with_appcontext
+def reconstruir_total_ejercicios():
+    """Recalcula el contador total_ejercicios de todas las rutinas."""
+    # Tambien agrega la columna si falta, asi el comando sirve en una base de datos anterior al contador
+    with db.engine.begin() as conexion:
+        migrar_total_ejercicios(conexion)
+    print("Contador de ejercicios por rutina reconstruido")
+
+
+@click.command('verificar-indices')
+@with_appcontext
+def verificar_indices():
+    """Revisa con EXPLAIN QUERY PLAN que las consultas frecuentes usen sus indices."""
+    with db.engine.connect() as conexion:
+        resultados = verificar_planes(conexion)
+    for nombre, indice, plan, usa_indice in resultados:
+        print(f"{'OK   ' if usa_indice else 'FALLA'} {nombre}: {plan}")
+    if not all(usa_indice for nombre, indice, plan, usa_indice in resultados):
+        raise SystemExit(1)
+
+
+@click.command('exportar-datos')
+@click.option('--formato', type=click.Choice(FORMATOS), default='ndjson', help='Formato de los archivos.')
+@click.option('--directorio', default='exportaciones', help='Carpeta donde se escribe un archivo por tabla.')
+@click.option('--tabla', 'tablas', multiple=True, type=click.Choice(list(TABLAS_EXPORTACION)),
+              help='Tabla a exportar; se puede repetir. Por defecto todas.')
+@click.option('--lote', default=1000, help='Filas por bloque leido de la base de datos.')
+@with_appcontext
+def exportar_datos(formato, directorio, tablas, lote):
+    """Exporta las tablas en flujo, un archivo por tabla, e informa las filas por segundo."""
+    os.makedirs(directorio, exist_ok=True)
+    for tabla in tablas or TABLAS_EXPORTACION:
+        exportador = ExportadorDatos(formato, [tabla], lote)
+        ruta = os.path.join(directorio, '{}.{}'.format(tabla, formato))
+        inicio = time.monotonic()
+        with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+            for bloque in exportador.generar():
+                archivo.write(bloque)
+        duracion = time.monotonic() - inicio
+        print(f"{tabla}: {exportador.filas} filas en {duracion:.2f} s "
+              f"({exportador.filas / duracion if duracion else 0:.0f} filas/s) -> {ruta}")
+
+
+app = create_app()
+
 
 if __name__ == '__main__':
-    app.run(debug=True,host='0.0.0.0')
\ No newline at end of file
+    # Servidor de desarrollo: deja el esquema al dia antes de iniciar
+    with app.app_context():
+        db.create_all()
+        migrar(db.engine)
+        gestor_exportaciones.marcar_interrumpidas()
+    app.run(debug=True,host='0.0.0.0')
@@ -0,0 +1,70 @@
+# Compara el tiempo de los esquemas de marshmallow contra SerializadorRapido sobre datos sinteticos.
+# Uso, desde la raiz del proyecto: python -m benchmarks.benchmark_serializacion [personas] [entrenamientos]
+# Los datos se crean dentro de una transaccion que se revierte al terminar; el esquema debe existir
+# (flask crear-esquema).
+from datetime import date, time, timedelta
+from json import dumps
+import random
+import sys
+import timeit
+
+from app import app
+from modelos import \
+    db, \
+    Ejercicio, EjercicioSchema, \
+    Persona, PersonaSchema, \
+    Entrenamiento, EntrenamientoSchema, \
+    Rutina, RutinaSchema
+from vistas.utilidad_serializacion import SerializadorRapido
+
+
+def crear_datos(numero_personas, numero_entrenamientos):
+    ejercicios = [Ejercicio(nombre='Ejercicio {}'.format(i), descripcion='Descripcion {}'.format(i),
+                            video='https://videos/{}'.format(i), calorias=round(random.uniform(0.1, 0.99), 2))
+                  for i in range(0, 50)]
+    rutinas = [Rutina(nombre='Rutina {}'.format(i), descripcion='Descripcion {}'.format(i)) for i in range(0, 10)]
+    for rutina in rutinas:
+        rutina.ejercicios.extend(random.sample(ejercicios, 5))
+    personas = [Persona(nombre='Persona {}'.format(i), apellido='Apellido', talla=1.70, peso=70, edad=30,
+                        ingreso=date(2023, 1, 1), entrenando=True, entrenador=1)
+                for i in range(0, numero_personas)]
+    db.session.add_all(ejercicios + rutinas + personas)
+    db.session.flush()
+    db.session.bulk_insert_mappings(Entrenamiento, [
+        dict(fecha=date(2023, 1, 1) + timedelta(days=i % 90), tiempo=time(0, random.randint(1, 59), 0),
+             repeticiones=random.randint(1, 10), ejercicio=random.choice(ejercicios).id,
+             persona=random.choice(personas).id, rutina=random.choice(rutinas).id if i % 3 == 0 else None)
+        for i in range(0, numero_entrenamientos)])
+
+
+def medir(modelo, schema, repeticiones=3):
+    serializador = SerializadorRapido(schema)
+
+    def con_esquema():
+        db.session.expire_all()
+        return dumps([schema.dump(objeto) for objeto in modelo.query.order_by(modelo.id)])
+
+    def con_serializador():
+        db.session.expire_all()
+        return dumps(serializador.serializar_lista(modelo.query.order_by(modelo.id)))
+
+    if con_esquema() != con_serializador():
+        raise AssertionError('El JSON de {} no coincide con el del esquema'.format(modelo.__name__))
+    tiempo_esquema = min(timeit.repeat(con_esquema, number=1, repeat=repeticiones))
+    tiempo_serializador = min(timeit.repeat(con_serializador, number=1, repeat=repeticiones))
+    filas = modelo.query.count()
+    print('{:<14} {:>8} filas  esquema {:>8.3f}s  serializador {:>8.3f}s  x{:.1f}'.format(
+        modelo.__name__, filas, tiempo_esquema, tiempo_serializador, tiempo_esquema / tiempo_serializador))
+
+
+if __name__ == '__main__':
+    numero_personas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    numero_entrenamientos = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    with app.app_context():
+        try:
+            crear_datos(numero_personas, numero_entrenamientos)
+            for modelo, schema in ((Ejercicio, EjercicioSchema()), (Persona, PersonaSchema()),
+                                   (Entrenamiento, EntrenamientoSchema()), (Rutina, RutinaSchema())):
+                medir(modelo, schema)
+        finally:
+            db.session.rollback()
@@ -1,14 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import fields, Schema
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+from sqlalchemy.orm import validates
 import enum
 
 
 db = SQLAlchemy()
 
 
+def normalizar_nombre(nombre):
+    # casefold tambien iguala letras fuera de ASCII ("Ñandú" y "ÑANDÚ"), a diferencia de lower() de SQLite
+    return None if nombre is None else nombre.casefold()
+
+
 rutinas_ejercicios = db.Table('rutina_ejercicio', db.Column('rutina_id', db.Integer, db.ForeignKey('rutina.id'), primary_key=True), \
-                              db.Column('ejercicio_id', db.Integer, db.ForeignKey('ejercicio.id'), primary_key=True))
+                              db.Column('ejercicio_id', db.Integer, db.ForeignKey('ejercicio.id'), primary_key=True), \
+                              db.Index('ix_rutina_ejercicio_ejercicio', 'ejercicio_id'))
 
 class Ejercicio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,15 +23,29 @@ class Ejercicio(db.Model):
     descripcion = db.Column(db.String(512))
     video = db.Column(db.String(512))
     calorias = db.Column(db.Numeric)
-    entrenamientos = db.relationship('Entrenamiento')
-    rutinas = db.relationship('Rutina', secondary='rutina_ejercicio', back_populates='ejercicios')
+    entrenamientos = db.relationship('Entrenamiento', order_by='Entrenamiento.id')
+    rutinas = db.relationship('Rutina', secondary='rutina_ejercicio', back_populates='ejercicios', order_by='Rutina.id')
 
 class Rutina(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(128))
     descripcion = db.Column(db.String(512))
-    entrenamientos = db.relationship('Entrenamiento')
-    ejercicios = db.relationship('Ejercicio', secondary='rutina_ejercicio', back_populates='rutinas')
+    entrenamientos = db.relationship('Entrenamiento', order_by='Entrenamiento.id')
+    ejercicios = db.relationship('Ejercicio', secondary='rutina_ejercicio', back_populates='rutinas',
+                                 order_by='Ejercicio.id')
+    # Cantidad de filas en rutina_ejercicio, mantenida al hacer flush (vistas/utilidad_rutinas.py)
+    total_ejercicios = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Los nombres de rutina no se repiten sin importar mayusculas y minusculas: el indice unico va sobre el
+    # nombre normalizado, que se asigna cada vez que cambia el nombre
+    nombre_normalizado = db.Column(db.String(128))
+    __table_args__ = (
+        db.Index('ix_rutina_nombre_normalizado', nombre_normalizado, unique=True),
+    )
+
+    @validates('nombre')
+    def asignar_nombre_normalizado(self, llave, nombre):
+        self.nombre_normalizado = normalizar_nombre(nombre)
+        return nombre
 
 class Persona(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,9 +62,9 @@ class Persona(db.Model):
     entrenando = db.Column(db.Boolean, default=True)
     razon = db.Column(db.String(512))
     terminado = db.Column(db.Date)
-    entrenamientos = db.relationship('Entrenamiento', cascade='all, delete, delete-orphan')
-    usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'))
-    entrenador = db.Column(db.Integer, db.ForeignKey('persona.id'))
+    entrenamientos = db.relationship('Entrenamiento', cascade='all, delete, delete-orphan', order_by='Entrenamiento.id')
+    usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), index=True)
+    entrenador = db.Column(db.Integer, db.ForeignKey('persona.id'), index=True)
 
 
 class RolType(enum.Enum):
@@ -54,19 +75,56 @@ class RolType(enum.Enum):
 
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    usuario = db.Column(db.String(50))
+    usuario = db.Column(db.String(50), index=True)
     contrasena = db.Column(db.String(50))
-    rol = db.Column(db.String(3))
+    rol = db.Column(db.String(3), index=True)
 
 
 class Entrenamiento(db.Model):
+    __table_args__ = (
+        db.Index('ix_entrenamiento_persona_fecha_rutina', 'persona', 'fecha', 'rutina'),
+        # Indice parcial para el historial de entrenamientos sueltos, que se pagina por (fecha, id)
+        db.Index('ix_entrenamiento_persona_sin_rutina', 'persona', 'fecha', 'id', sqlite_where=db.text('rutina IS NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tiempo = db.Column(db.Time)
     repeticiones = db.Column(db.Numeric)
     fecha = db.Column(db.Date)
-    ejercicio = db.Column(db.Integer, db.ForeignKey('ejercicio.id'))
+    ejercicio = db.Column(db.Integer, db.ForeignKey('ejercicio.id'), index=True)
     persona = db.Column(db.Integer, db.ForeignKey('persona.id'))
-    rutina = db.Column(db.Integer, db.ForeignKey('rutina.id'))
+    rutina = db.Column(db.Integer, db.ForeignKey('rutina.id'), index=True)
+
+
+class ResumenEntrenamiento(db.Model):
+    # Acumulado diario por persona y tipo de entrenamiento, se mantiene al escribir entrenamientos
+    __tablename__ = 'resumen_entrenamiento'
+    persona = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, primary_key=True)
+    tipo = db.Column(db.String(9), primary_key=True)
+    repeticiones = db.Column(db.Numeric)
+    segundos = db.Column(db.Integer)
+    calorias = db.Column(db.Numeric)
+    calorias_consumidas = db.Column(db.Numeric)
+
+
+class Exportacion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    estado = db.Column(db.String(10))
+    formato = db.Column(db.String(6))
+    persona = db.Column(db.Integer)
+    entrenador = db.Column(db.Integer)
+    archivo = db.Column(db.String(512))
+    filas = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(512))
+    creada = db.Column(db.DateTime)
+    terminada = db.Column(db.DateTime)
+
+
+class VersionTabla(db.Model):
+    # Contador de escrituras por tabla, con el que se calculan los ETag de los catalogos
+    __tablename__ = 'version_tabla'
+    tabla = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 
 class EjercicioSchema(SQLAlchemyAutoSchema):
@@ -111,6 +169,10 @@ class ReporteGeneralSchema(Schema):
     imc = fields.Float()
     clasificacion_imc = fields.String()
 
+class ReporteVentanaSchema(ReporteGeneralSchema):
+    # Las paginas del reporte no incluyen las relaciones de la persona, que crecen con su historial
+    persona = fields.Nested(PersonaSchema(exclude=('entrenamientos', 'usuario')))
+
 class ReporteDetalladoSchema(Schema):
     fecha = fields.String()
     repeticiones = fields.Float()
@@ -131,7 +193,16 @@ class RutinaSchema(SQLAlchemyAutoSchema):
         model = Rutina
         include_relationships = True        
         load_instance = True
+        exclude = ('total_ejercicios', 'nombre_normalizado')
         
     id = fields.String()
     #entrenamientos = fields.Nested(EntrenamientoSchema, many=True)
-    ejercicios = fields.Nested(EjercicioSchema, many=True)
\ No newline at end of file
+    ejercicios = fields.Nested(EjercicioSchema, many=True)
+
+class ExportacionSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Exportacion
+        load_instance = True
+        exclude = ('archivo',)
+
+    id = fields.String()
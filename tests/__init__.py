@@ -0,0 +1,15 @@
+# Las pruebas comparten una aplicacion con su propia base de datos temporal, el esquema creado y el
+# contexto de aplicacion activo. Se ejecutan desde la raiz: python -m unittest discover -s tests -t .
+import os
+import tempfile
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI',
+                      'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='pruebas_'), 'pruebas.sqlite'))
+
+from app import app  # noqa: E402
+from modelos import db  # noqa: E402
+from vistas.utilidad_migraciones import migrar  # noqa: E402
+
+app.app_context().push()
+db.create_all()
+migrar(db.engine)
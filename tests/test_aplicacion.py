@@ -0,0 +1,52 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from app import create_app
+
+
+class TestAplicacion(TestCase):
+
+    def test_configuracion_por_entorno_y_parametro(self):
+        directorio = tempfile.mkdtemp()
+        ruta = os.path.join(directorio, 'aplicacion.sqlite')
+        entorno = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + ruta, 'PAGINACION_LIMITE_MAXIMO': '50',
+                   'SQLALCHEMY_ENGINE_OPTIONS': '{"pool_pre_ping": true}'}
+        with patch.dict(os.environ, entorno):
+            aplicacion = create_app({'JWT_SECRET_KEY': 'otra-frase', 'PAGINACION_LIMITE_MAXIMO': 20})
+        self.assertEqual('sqlite:///' + ruta, aplicacion.config['SQLALCHEMY_DATABASE_URI'])
+        self.assertEqual({'pool_pre_ping': True}, aplicacion.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        # El diccionario de create_app tiene prioridad sobre el entorno
+        self.assertEqual(20, aplicacion.config['PAGINACION_LIMITE_MAXIMO'])
+        self.assertEqual('otra-frase', aplicacion.config['JWT_SECRET_KEY'])
+        # Crear la aplicacion no abre la base de datos ni crea el esquema
+        self.assertFalse(os.path.exists(ruta))
+        self.assertEqual({}, aplicacion.extensions['sqlalchemy'].connectors)
+        self.assertIn('crear-esquema', aplicacion.cli.commands)
+
+    def test_reconstruir_total_ejercicios_en_base_de_datos_anterior(self):
+        # Base de datos anterior al contador: rutina sin la columna total_ejercicios
+        directorio = tempfile.mkdtemp()
+        ruta = os.path.join(directorio, 'anterior.sqlite')
+        motor = create_engine('sqlite:///' + ruta)
+        with motor.begin() as conexion:
+            conexion.exec_driver_sql('CREATE TABLE rutina (id INTEGER PRIMARY KEY, nombre VARCHAR(128), '
+                                     'descripcion VARCHAR(512))')
+            conexion.exec_driver_sql('CREATE TABLE rutina_ejercicio (rutina_id INTEGER, ejercicio_id INTEGER, '
+                                     'PRIMARY KEY (rutina_id, ejercicio_id))')
+            conexion.exec_driver_sql("INSERT INTO rutina (id, nombre, descripcion) VALUES (1, 'Fuerza', ''), (2, 'Cardio', '')")
+            conexion.exec_driver_sql('INSERT INTO rutina_ejercicio VALUES (1, 1), (1, 2)')
+        aplicacion = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + ruta})
+        resultado = aplicacion.test_cli_runner().invoke(args=['reconstruir-total-ejercicios'])
+        self.assertEqual(0, resultado.exit_code, resultado.output)
+        with motor.connect() as conexion:
+            self.assertEqual([(1, 2), (2, 0)], conexion.exec_driver_sql(
+                'SELECT id, total_ejercicios FROM rutina ORDER BY id').all())
+        motor.dispose()
+
+    def test_cors_expone_cursor_y_etag(self):
+        aplicacion = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        resultado = aplicacion.test_client().get('/signin', headers={'Origin': 'http://localhost:4200'})
+        expuestos = {encabezado.strip() for encabezado in resultado.headers['Access-Control-Expose-Headers'].split(',')}
+        self.assertEqual({'X-Siguiente-Cursor', 'ETag'}, expuestos)
@@ -6,6 +6,7 @@ from faker import Faker
 from faker.generator import random
 from modelos import db, Usuario, Ejercicio
 
+from sqlalchemy import event
 from app import app
 from modelos.modelos import PersonaSchema
 
@@ -259,3 +260,77 @@ class TestEjercicio(TestCase):
                     self.assertEqual(ejercicio['video'], ejercicio_creado.video)
                     self.assertEqual(float(ejercicio['calorias']), float(ejercicio_creado.calorias))
                     self.assertEqual(ejercicio['id'], str(ejercicio_creado.id))
+
+    def test_listar_ejercicios_paginados(self):
+        #Generar 7 ejercicios, 3 de ellos con un nombre comun
+        for i in range(0,7):
+            nombre = ("Sentadilla_{} " if i % 2 else "Plancha {} ").format(i) + self.data_factory.word()
+            ejercicio = Ejercicio(nombre=nombre,
+                                  descripcion=self.data_factory.sentence(),
+                                  video=self.data_factory.sentence(),
+                                  calorias=round(random.uniform(0.1, 0.99), 2))
+            db.session.add(ejercicio)
+            db.session.commit()
+            self.ejercicios_creados.append(ejercicio)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        #Recorrer las paginas con el cursor siguiente
+        paginas = []
+        parametros = {"limit": 3}
+        while True:
+            resultado = self.client.get("/ejercicios", query_string=parametros, headers=headers)
+            self.assertEqual(resultado.status_code, 200)
+            paginas.append(json.loads(resultado.get_data()))
+            if 'X-Siguiente-Cursor' not in resultado.headers:
+                break
+            parametros = {"limit": 3, "cursor": resultado.headers['X-Siguiente-Cursor']}
+        ids = [int(ejercicio['id']) for pagina in paginas for ejercicio in pagina]
+        self.assertEqual(sorted(ejercicio.id for ejercicio in Ejercicio.query.all()), ids)
+        self.assertTrue(all(len(pagina) <= 3 for pagina in paginas))
+
+        #Filtrar por nombre sin distinguir mayusculas, con el _ como caracter literal
+        resultado = self.client.get("/ejercicios", query_string={"nombre": "sentadilla_"}, headers=headers)
+        nombres = [ejercicio['nombre'] for ejercicio in json.loads(resultado.get_data())]
+        self.assertEqual([ejercicio.nombre for ejercicio in self.ejercicios_creados if ejercicio.nombre.startswith("Sentadilla_")],
+                         nombres)
+
+        #Un cursor invalido se rechaza
+        resultado = self.client.get("/ejercicios", query_string={"limit": 3, "cursor": "no-es-un-cursor"}, headers=headers)
+        self.assertEqual(resultado.status_code, 400)
+
+    def test_listar_ejercicios_campos(self):
+        for i in range(0,3):
+            ejercicio = Ejercicio(nombre=self.data_factory.sentence(),
+                                  descripcion=self.data_factory.sentence(),
+                                  video=self.data_factory.sentence(),
+                                  calorias=round(random.uniform(0.1, 0.99), 2))
+            db.session.add(ejercicio)
+            db.session.commit()
+            self.ejercicios_creados.append(ejercicio)
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        #Solo se consultan las columnas pedidas y ninguna relacion
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        resultado = self.client.get("/ejercicios", query_string={"fields": "id,nombre"}, headers=headers)
+        event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertEqual(resultado.status_code, 200)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.assertTrue(all(set(ejercicio) == {"id", "nombre"} for ejercicio in datos_respuesta))
+        self.assertEqual({str(ejercicio.id): ejercicio.nombre for ejercicio in self.ejercicios_creados},
+                         {ejercicio["id"]: ejercicio["nombre"] for ejercicio in datos_respuesta})
+        consultas_ejercicio = [consulta for consulta in consultas if "FROM ejercicio" in consulta]
+        self.assertEqual(1, len(consultas_ejercicio))
+        self.assertNotIn("descripcion", consultas_ejercicio[0])
+        self.assertFalse(any("rutina_ejercicio" in consulta or "FROM entrenamiento" in consulta for consulta in consultas))
+
+        #Las relaciones se cargan cuando se piden explicitamente
+        resultado = self.client.get(f"/ejercicio/{self.ejercicios_creados[0].id}", query_string={"fields": "nombre,rutinas"},
+                                    headers=headers)
+        self.assertEqual({"nombre": self.ejercicios_creados[0].nombre, "rutinas": []}, json.loads(resultado.get_data()))
+
+        #Un campo desconocido se rechaza
+        resultado = self.client.get("/ejercicios", query_string={"fields": "id,contrasena"}, headers=headers)
+        self.assertEqual(resultado.status_code, 400)
@@ -4,6 +4,7 @@ from datetime import datetime
 from unittest import TestCase
 from faker import Faker
 from faker.generator import random
+from sqlalchemy import event
 from modelos import db, Usuario, Persona, PersonaSchema
 from app import app
 
@@ -76,6 +77,41 @@ class TestEntrenadores(TestCase):
         self.assertEqual(datos_respuesta[-1]["apellido"], self.apellido_entrenador)
         self.assertIsNotNone(datos_respuesta[-1]["id"])
 
+    def test_get_entrenadores_paginados(self):
+        for i in range(0, 2):
+            self.client.post("/signin", data=json.dumps({"nombre": self.data_factory.name(), "apellido": self.data_factory.name(),
+                                                         "usuario": "test_" + self.data_factory.user_name(),
+                                                         "contrasena": "Entrenador123", "rol": "ENT"}),
+                             headers={"Content-Type": "application/json"})
+        # Las personas con otro rol no se listan
+        cliente = Usuario(usuario="cliente_" + self.data_factory.user_name(), contrasena="", rol="CLI")
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(Persona(nombre="Cliente", apellido="Cliente", usuario=cliente.id))
+        db.session.commit()
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+
+        consultas = []
+        def contar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar)
+        try:
+            resultado = self.client.get("/entrenadores", query_string={"limit": 2, "fields": "id,nombre"}, headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar)
+        pagina = json.loads(resultado.get_data())
+        # Una sola consulta, sin leer las filas de usuario
+        self.assertEqual(1, len(consultas))
+        self.assertIn("JOIN usuario", consultas[0])
+        self.assertNotIn("contrasena", consultas[0])
+
+        resultado = self.client.get("/entrenadores", query_string={"limit": 2, "cursor": resultado.headers["X-Siguiente-Cursor"]},
+                                    headers=headers)
+        pagina.extend(json.loads(resultado.get_data()))
+        self.assertNotIn("X-Siguiente-Cursor", resultado.headers)
+        entrenadores = Persona.query.join(Usuario, Persona.usuario == Usuario.id).filter(Usuario.rol == "ENT").all()
+        self.assertEqual(sorted(str(persona.id) for persona in entrenadores), sorted(persona["id"] for persona in pagina))
+
     def test_eliminar_entrenador(self):
         # Se generan los datos para crear el entrenador
         usuario = "test_" + self.data_factory.first_name()
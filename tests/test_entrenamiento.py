@@ -3,7 +3,8 @@ from unittest import TestCase
 from faker import Faker
 from faker.generator import random
 from modelos import db, Usuario, Ejercicio, Entrenamiento
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import event
 from app import app
 from modelos.modelos import Persona
 
@@ -127,6 +128,78 @@ class TestEntrenamiento(TestCase):
             self.assertTrue(item['id'] == self.entrenamientos_creados[index])
             index += 1
 
+    def test_listar_entrenamientos_paginados(self):
+        # Se crean los ejercicios y varios entrenamientos por cada uno en fechas distintas
+        for indexEjercicio in range(0, 3):
+            ejercicio_nuevo = Ejercicio(nombre=self.data_factory.sentence(),
+                                        descripcion=self.data_factory.sentence(),
+                                        video=self.data_factory.image_url(),
+                                        calorias=round(random.uniform(0.1, 0.99), 2))
+            db.session.add(ejercicio_nuevo)
+            db.session.commit()
+            self.ejercicios_creados.append(ejercicio_nuevo.id)
+        headers = {'Content-Type': 'application/json',
+                   "Authorization": "Bearer {}".format(self.token)}
+        for indexEntrenamiento in range(0, 7):
+            nuevo_entrenamiento = {
+                "ejercicio": self.ejercicios_creados[indexEntrenamiento % 3],
+                "fecha": (datetime.today() - timedelta(days=indexEntrenamiento % 4)).strftime('%Y-%m-%d'),
+                "tiempo": f"00:{random.randint(10, 59)}:{random.randint(10, 59)}",
+                "repeticiones": random.randint(1, 10)
+            }
+            resultado_nuevo_entrenamiento = self.client.post(f"/entrenamientos/{self.usuario_id}",
+                                                             data=json.dumps(nuevo_entrenamiento),
+                                                             headers=headers)
+            self.entrenamientos_creados.append(json.loads(resultado_nuevo_entrenamiento.get_data())['id'])
+
+        # Un entrenamiento de rutina no se lista
+        entrenamiento_rutina = Entrenamiento(tiempo=datetime.strptime("00:10:00", '%H:%M:%S').time(), repeticiones=3,
+                                             fecha=datetime.today().date(), ejercicio=self.ejercicios_creados[0],
+                                             persona=self.usuario_id, rutina=1)
+        db.session.add(entrenamiento_rutina)
+        db.session.commit()
+        self.entrenamientos_creados.append(entrenamiento_rutina.id)
+
+        # Se recorren las paginas contando las consultas de cada llamado
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        paginas = []
+        parametros = {"limit": 3}
+        while True:
+            resultado = self.client.get(f"/entrenamientos/{self.usuario_id}", query_string=parametros, headers=headers)
+            self.assertEqual(resultado.status_code, 200)
+            paginas.append(json.loads(resultado.get_data()))
+            if 'X-Siguiente-Cursor' not in resultado.headers:
+                break
+            parametros = {"limit": 3, "cursor": resultado.headers['X-Siguiente-Cursor']}
+        event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertLessEqual(len(consultas), 4 * len(paginas))
+
+        # Las paginas cubren los entrenamientos libres ordenados por fecha e id
+        entrenamientos_paginados = [item for pagina in paginas for item in pagina]
+        esperados = Entrenamiento.query.filter(Entrenamiento.persona == self.usuario_id, Entrenamiento.rutina == None) \
+            .order_by(Entrenamiento.fecha, Entrenamiento.id).all()
+        self.assertEqual([str(entrenamiento.id) for entrenamiento in esperados],
+                         [item['id'] for item in entrenamientos_paginados])
+        self.assertEqual([3, 3, 1], [len(pagina) for pagina in paginas])
+        for item in entrenamientos_paginados:
+            self.assertEqual(item['ejercicio']['id'], str(Entrenamiento.query.get(int(item['id'])).ejercicio))
+
+        # En el formato normalizado cada ejercicio se entrega una sola vez
+        resultado = self.client.get(f"/entrenamientos/{self.usuario_id}", query_string={"formato": "normalizado"},
+                                    headers=headers)
+        normalizado = json.loads(resultado.get_data())
+        self.assertEqual({str(ejercicio) for ejercicio in self.ejercicios_creados}, set(normalizado["ejercicios"]))
+        self.assertEqual([item['id'] for item in entrenamientos_paginados],
+                         [item['id'] for item in normalizado["entrenamientos"]])
+        for item, item_normalizado in zip(entrenamientos_paginados, normalizado["entrenamientos"]):
+            # Las referencias tienen el tipo de las llaves del mapa, y el mapa solo las columnas del ejercicio
+            ejercicio = normalizado["ejercicios"][item_normalizado['ejercicio']]
+            self.assertEqual({llave: valor for llave, valor in item['ejercicio'].items()
+                              if llave not in ('entrenamientos', 'rutinas')}, ejercicio)
+
     def registrar_rutina_realizada(self):
         self.data_factory = Faker()
         self.client = app.test_client()
@@ -2,8 +2,10 @@ import json
 from unittest import TestCase
 from faker import Faker
 from faker.generator import random
-from modelos import db, Usuario, Ejercicio, Entrenamiento
-from datetime import datetime
+from modelos import db, Usuario, Ejercicio, Entrenamiento, Rutina
+from datetime import datetime, timedelta, time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from app import app
 from modelos.modelos import Persona
 
@@ -47,6 +49,7 @@ class TestEntrenamiento(TestCase):
         self.usuario_id = respuesta_login["id"]
         self.ejercicios_creados = []
         self.entrenamientos_creados = []
+        self.rutinas_creadas = []
 
     def tearDown(self):
         # Eliminamos los ejericicios creados en la prueba
@@ -61,6 +64,10 @@ class TestEntrenamiento(TestCase):
             db.session.delete(entrenamiento)
             db.session.commit()
 
+        for rutina_creada in self.rutinas_creadas:
+            db.session.delete(Rutina.query.get(rutina_creada))
+            db.session.commit()
+
         # Eliminamos el usuario creado en la prueba
         users = db.session.query(Usuario).all()
         for user in users:
@@ -135,3 +142,125 @@ class TestEntrenamiento(TestCase):
         for item in json.loads(resultado_consulta_entrenamientos.get_data()):
             self.assertTrue(item["id"] == self.entrenamientos_creados[index])
             index += 1
+
+    def test_registrar_sesion_rutina(self):
+        ejercicio = Ejercicio(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.image_url(), calorias=round(random.uniform(0.1, 0.99), 2))
+        rutina = Rutina(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence())
+        db.session.add_all([ejercicio, rutina])
+        db.session.commit()
+        self.ejercicios_creados.append(ejercicio.id)
+        self.rutinas_creadas.append(rutina.id)
+        headers = {"Content-Type": "application/json", "Authorization": "Bearer {}".format(self.token)}
+        sesion = {"idRutina": rutina.id, "fecha": "2023-03-02", "idPersona": self.usuario_id,
+                  "entrenamientos": [{"tiempo": "00:10:{:02d}".format(i), "repeticiones": i % 5 + 1,
+                                      "ejercicio": ejercicio.id} for i in range(0, 30)]}
+
+        # Una sesion con un tiempo invalido no escribe ningun entrenamiento
+        sesion_invalida = dict(sesion, entrenamientos=sesion["entrenamientos"] + [{"tiempo": "10 minutos", "repeticiones": 3,
+                                                                                 "ejercicio": ejercicio.id}])
+        resultado = self.client.post("/rutinasEntrenamiento", data=json.dumps(sesion_invalida), headers=headers)
+        self.assertEqual(resultado.status_code, 400)
+        self.assertEqual([30], [error["indice"] for error in json.loads(resultado.get_data())["errores"]])
+        self.assertEqual(0, Entrenamiento.query.filter(Entrenamiento.rutina == rutina.id).count())
+
+        # Las 30 filas se guardan con un solo commit
+        commits = []
+        def contar_commit(session):
+            commits.append(session)
+        event.listen(Session, 'after_commit', contar_commit)
+        resultado = self.client.post("/rutinasEntrenamiento", data=json.dumps(sesion), headers=headers)
+        event.remove(Session, 'after_commit', contar_commit)
+        self.assertEqual(resultado.status_code, 200)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.entrenamientos_creados.extend(datos_respuesta["ids"])
+        self.assertEqual("proceso exitoso", datos_respuesta["mensaje"])
+        self.assertEqual(1, len(commits))
+        self.assertEqual(sorted(datos_respuesta["ids"]),
+                         [entrenamiento.id for entrenamiento in Entrenamiento.query.filter(Entrenamiento.rutina == rutina.id)
+                          .order_by(Entrenamiento.id)])
+
+    def test_listar_sesiones_rutina_agrupadas(self):
+        # Se crean dos rutinas con un ejercicio cada una
+        for indexRutina in range(0, 2):
+            ejercicio = Ejercicio(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence(),
+                                  video=self.data_factory.image_url(), calorias=round(random.uniform(0.1, 0.99), 2))
+            rutina = Rutina(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence())
+            rutina.ejercicios.append(ejercicio)
+            db.session.add(rutina)
+            db.session.commit()
+            self.ejercicios_creados.append(ejercicio.id)
+            self.rutinas_creadas.append(rutina.id)
+
+        # Tres sesiones: una de cada rutina hoy y una de la primera rutina ayer que supera las 24 horas.
+        # La segunda rutina tiene repeticiones fraccionarias
+        hoy = datetime.today().date()
+        ayer = hoy - timedelta(days=1)
+        datos = [(ayer, 0, time(9, 0, 0), 4), (ayer, 0, time(9, 30, 0), 5), (ayer, 0, time(9, 45, 30), 6),
+                 (hoy, 0, time(0, 10, 0), 2), (hoy, 1, time(0, 20, 15), 2.5), (hoy, 1, time(0, 0, 50), 2.5)]
+        for fecha, indexRutina, tiempo, repeticiones in datos:
+            entrenamiento = Entrenamiento(fecha=fecha, tiempo=tiempo, repeticiones=repeticiones,
+                                          persona=self.usuario_id, ejercicio=self.ejercicios_creados[indexRutina],
+                                          rutina=self.rutinas_creadas[indexRutina])
+            db.session.add(entrenamiento)
+            db.session.commit()
+            self.entrenamientos_creados.append(entrenamiento.id)
+
+        headers = {"Content-Type": "application/json", "Authorization": "Bearer {}".format(self.token)}
+        endpoint_entrenamiento = f"/rutinasEntrenamientoPersona/{self.usuario_id}"
+        resultado = self.client.get(endpoint_entrenamiento, headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        sesiones = json.loads(resultado.get_data())
+        self.assertEqual([(str(ayer), str(self.rutinas_creadas[0])), (str(hoy), str(self.rutinas_creadas[0])),
+                          (str(hoy), str(self.rutinas_creadas[1]))],
+                         [(sesion["fecha"], sesion["rutina"]["id"]) for sesion in sesiones])
+        self.assertEqual(15, sesiones[0]["repeticionesTotales"])
+        self.assertEqual("28:15:30", sesiones[0]["tiempoTotal"])
+        self.assertEqual(28*3600 + 15*60 + 30, sesiones[0]["segundosTotales"])
+        self.assertEqual("00:21:05", sesiones[2]["tiempoTotal"])
+        # Cada entrenamiento se trunca antes de sumar, como en el listado original: 2 + 2 y no int(2.5 + 2.5)
+        self.assertEqual(4, sesiones[2]["repeticionesTotales"])
+        self.assertEqual([str(self.entrenamientos_creados[4]), str(self.entrenamientos_creados[5])],
+                         [entrenamiento["id"] for entrenamiento in sesiones[2]["entrenamientos"]])
+        self.assertEqual(str(self.ejercicios_creados[1]), sesiones[2]["entrenamientos"][0]["ejercicio"]["id"])
+
+        # Las paginas recorren las mismas sesiones con un numero fijo de consultas
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        paginas = []
+        parametros = {"limit": 2}
+        while True:
+            resultado = self.client.get(endpoint_entrenamiento, query_string=parametros, headers=headers)
+            self.assertEqual(resultado.status_code, 200)
+            paginas.append(json.loads(resultado.get_data()))
+            if 'X-Siguiente-Cursor' not in resultado.headers:
+                break
+            parametros = {"limit": 2, "cursor": resultado.headers['X-Siguiente-Cursor']}
+        event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertEqual(sesiones, [sesion for pagina in paginas for sesion in pagina])
+        self.assertEqual([2, 1], [len(pagina) for pagina in paginas])
+        self.assertLessEqual(len(consultas), 10 * len(paginas))
+
+        # El formato normalizado referencia rutinas y ejercicios por id y los entrega una sola vez
+        resultado = self.client.get(endpoint_entrenamiento, query_string={"formato": "normalizado"}, headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        normalizado = json.loads(resultado.get_data())
+        self.assertEqual({str(rutina) for rutina in self.rutinas_creadas}, set(normalizado["rutinas"]))
+        self.assertEqual({str(ejercicio) for ejercicio in self.ejercicios_creados}, set(normalizado["ejercicios"]))
+        for sesion, sesion_normalizada in zip(sesiones, normalizado["sesiones"]):
+            rutina = normalizado["rutinas"][sesion_normalizada["rutina"]]
+            self.assertEqual(sesion["rutina"]["nombre"], rutina["nombre"])
+            self.assertNotIn("entrenamientos", rutina)
+            self.assertEqual([ejercicio["id"] for ejercicio in sesion["rutina"]["ejercicios"]], rutina["ejercicios"])
+            for ejercicio in rutina["ejercicios"]:
+                self.assertIn(ejercicio, normalizado["ejercicios"])
+            for entrenamiento, entrenamiento_normalizado in zip(sesion["entrenamientos"], sesion_normalizada["entrenamientos"]):
+                # Solo las columnas del ejercicio, bajo la misma llave de texto que usa la referencia
+                ejercicio = normalizado["ejercicios"][entrenamiento_normalizado["ejercicio"]]
+                self.assertEqual({llave: valor for llave, valor in entrenamiento["ejercicio"].items()
+                                  if llave not in ("entrenamientos", "rutinas")}, ejercicio)
+                self.assertEqual(sesion_normalizada["rutina"], entrenamiento_normalizado["rutina"])
+            self.assertEqual(sesion["tiempoTotal"], sesion_normalizada["tiempoTotal"])
+        self.assertEqual(400, self.client.get(endpoint_entrenamiento, query_string={"formato": "xml"}, headers=headers).status_code)
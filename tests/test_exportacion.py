@@ -0,0 +1,154 @@
+import csv
+import json
+import os
+import time as reloj
+from unittest import TestCase
+from unittest.mock import patch
+from faker import Faker
+from faker.generator import random
+from modelos import db, Usuario, Ejercicio, Entrenamiento, Persona, Exportacion
+from datetime import datetime, timedelta, time
+from app import app
+from vistas.utilidad_exportacion import gestor_exportaciones
+
+
+class TestExportacion(TestCase):
+
+    def setUp(self):
+        # Instanciamos la librerias a usar
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        # Se crea el entrenador y se realiza el login
+        usuario = "test_" + self.data_factory.first_name()
+        contrasena = self.data_factory.password(length=10, special_chars=False, upper_case=True, lower_case=True, digits=True)
+        nueva_persona = {
+            "nombre": self.data_factory.name(),
+            "apellido": self.data_factory.name(),
+            "usuario": usuario,
+            "contrasena": contrasena
+        }
+        self.client.post("/signin", data=json.dumps(nueva_persona), headers={"Content-Type": "application/json"})
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps({"usuario": usuario, "contrasena": contrasena}),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        self.token = respuesta_login["token"]
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        # Se crean dos clientes del entrenador con entrenamientos
+        self.ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                                   video=self.data_factory.image_url(), calorias=round(random.uniform(0.1, 0.99), 2))
+        db.session.add(self.ejercicio)
+        self.personas = [Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                                 talla=1.70, peso=70, entrenador=self.usuario_id) for i in range(0, 2)]
+        db.session.add_all(self.personas)
+        db.session.commit()
+        for persona in self.personas:
+            for i in range(0, 4):
+                db.session.add(Entrenamiento(fecha=datetime.now().date()-timedelta(days=i), persona=persona.id,
+                                             ejercicio=self.ejercicio.id, repeticiones=random.randint(1, 10),
+                                             tiempo=time(0, random.randint(1, 59), 0)))
+        db.session.commit()
+
+    def tearDown(self):
+        for exportacion in db.session.query(Exportacion).all():
+            if exportacion.archivo and os.path.exists(exportacion.archivo):
+                os.remove(exportacion.archivo)
+            db.session.delete(exportacion)
+            db.session.commit()
+        for entrenamiento in db.session.query(Entrenamiento).all():
+            db.session.delete(entrenamiento)
+            db.session.commit()
+        for ejercicio in db.session.query(Ejercicio).all():
+            db.session.delete(ejercicio)
+            db.session.commit()
+        for usuario in db.session.query(Usuario).all():
+            db.session.delete(usuario)
+            db.session.commit()
+        for persona in db.session.query(Persona).all():
+            db.session.delete(persona)
+            db.session.commit()
+
+    def esperar_exportacion(self, id_exportacion):
+        # Se consulta el estado hasta que el trabajo termine
+        for intento in range(0, 100):
+            resultado = self.client.get(f"/exportaciones/{id_exportacion}", headers=self.headers)
+            self.assertEqual(resultado.status_code, 200)
+            datos_respuesta = json.loads(resultado.get_data())
+            if datos_respuesta['estado'] in ('TERMINADA', 'FALLIDA'):
+                return datos_respuesta
+            reloj.sleep(0.05)
+        self.fail("La exportacion no termino a tiempo")
+
+    def test_exportar_persona_csv(self):
+        resultado = self.client.post("/exportaciones", data=json.dumps({"formato": "csv", "persona": self.personas[0].id}),
+                                     headers=self.headers)
+        self.assertEqual(resultado.status_code, 202)
+        id_exportacion = json.loads(resultado.get_data())['id']
+
+        datos_respuesta = self.esperar_exportacion(id_exportacion)
+        self.assertEqual('TERMINADA', datos_respuesta['estado'])
+        self.assertEqual(4, datos_respuesta['filas'])
+
+        # Se descarga el archivo generado
+        resultado_archivo = self.client.get(f"/exportaciones/{id_exportacion}/archivo", headers=self.headers)
+        self.assertEqual(resultado_archivo.status_code, 200)
+        filas = list(csv.reader(resultado_archivo.get_data(as_text=True).splitlines()))
+        resultado_archivo.close()
+        self.assertEqual('id', filas[0][0])
+        self.assertEqual(5, len(filas))
+        self.assertTrue(all(fila[1] == str(self.personas[0].id) for fila in filas[1:]))
+
+    def test_exportar_entrenador_ndjson(self):
+        resultado = self.client.post("/exportaciones", data=json.dumps({"formato": "ndjson", "entrenador": self.usuario_id}),
+                                     headers=self.headers)
+        self.assertEqual(resultado.status_code, 202)
+        id_exportacion = json.loads(resultado.get_data())['id']
+
+        datos_respuesta = self.esperar_exportacion(id_exportacion)
+        self.assertEqual('TERMINADA', datos_respuesta['estado'])
+        resultado_archivo = self.client.get(f"/exportaciones/{id_exportacion}/archivo", headers=self.headers)
+        filas = [json.loads(linea) for linea in resultado_archivo.get_data(as_text=True).splitlines()]
+        resultado_archivo.close()
+        self.assertEqual(8, len(filas))
+        self.assertEqual({self.ejercicio.nombre}, {fila['ejercicio_nombre'] for fila in filas})
+
+    def test_exportacion_invalida(self):
+        resultado = self.client.post("/exportaciones", data=json.dumps({"formato": "xml", "persona": self.personas[0].id}),
+                                     headers=self.headers)
+        self.assertEqual(resultado.status_code, 400)
+
+    def test_exportacion_fallida_borra_el_archivo_parcial(self):
+        exportacion = Exportacion(estado='PENDIENTE', formato='csv', persona=self.personas[0].id, creada=datetime.now())
+        db.session.add(exportacion)
+        db.session.commit()
+        id_exportacion = exportacion.id
+        parcial = gestor_exportaciones.dar_ruta(exportacion) + '.parcial'
+
+        def escribir_y_fallar(archivo, formato, filas):
+            archivo.write('id\n')
+            raise IOError('Disco lleno')
+        with patch('vistas.utilidad_exportacion.escribir', escribir_y_fallar):
+            gestor_exportaciones.ejecutar(app, id_exportacion)
+
+        datos_respuesta = self.esperar_exportacion(id_exportacion)
+        self.assertEqual('FALLIDA', datos_respuesta['estado'])
+        self.assertEqual('Disco lleno', datos_respuesta['error'])
+        self.assertFalse(os.path.exists(parcial))
+
+    def test_marcar_exportaciones_interrumpidas(self):
+        exportaciones = [Exportacion(estado=estado, formato='ndjson', persona=self.personas[0].id, creada=datetime.now())
+                         for estado in ('PENDIENTE', 'EN_PROCESO', 'TERMINADA')]
+        db.session.add_all(exportaciones)
+        db.session.commit()
+        os.makedirs(gestor_exportaciones.directorio, exist_ok=True)
+        parcial = gestor_exportaciones.dar_ruta(exportaciones[1]) + '.parcial'
+        with open(parcial, 'w') as archivo:
+            archivo.write('{}\n')
+
+        self.assertEqual(2, gestor_exportaciones.marcar_interrumpidas())
+        self.assertEqual(['FALLIDA', 'FALLIDA', 'TERMINADA'],
+                         [Exportacion.query.get(exportacion.id).estado for exportacion in exportaciones])
+        self.assertFalse(os.path.exists(parcial))
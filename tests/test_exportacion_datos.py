@@ -0,0 +1,65 @@
+import csv
+import json
+from io import StringIO
+from unittest import TestCase
+from faker import Faker
+from faker.generator import random
+from modelos import db, Usuario, Ejercicio, Entrenamiento, Persona
+from app import app
+
+
+class TestExportacionDatos(TestCase):
+
+    def setUp(self):
+        # Instanciamos la librerias a usar
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        # Se crea el entrenador y se realiza el login
+        usuario = "test_" + self.data_factory.first_name()
+        contrasena = self.data_factory.password(length=10, special_chars=False, upper_case=True, lower_case=True, digits=True)
+        nueva_persona = {
+            "nombre": self.data_factory.name(),
+            "apellido": self.data_factory.name(),
+            "usuario": usuario,
+            "contrasena": contrasena
+        }
+        self.client.post("/signin", data=json.dumps(nueva_persona), headers={"Content-Type": "application/json"})
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps({"usuario": usuario, "contrasena": contrasena}),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        self.headers = {"Authorization": "Bearer {}".format(respuesta_login["token"])}
+
+        for i in range(0, 3):
+            db.session.add(Ejercicio(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence(),
+                                     video=self.data_factory.image_url(), calorias=round(random.uniform(0.1, 0.99), 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        for modelo in (Entrenamiento, Ejercicio, Persona, Usuario):
+            for objeto in db.session.query(modelo).all():
+                db.session.delete(objeto)
+                db.session.commit()
+
+    def test_exportar_todas_las_tablas_ndjson(self):
+        resultado = self.client.get("/exportar", query_string={"lote": 2}, headers=self.headers)
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual("application/x-ndjson", resultado.mimetype)
+        filas = [json.loads(linea) for linea in resultado.get_data(as_text=True).splitlines()]
+        ejercicios = [fila for fila in filas if fila["tabla"] == "ejercicio"]
+        self.assertEqual([ejercicio.id for ejercicio in Ejercicio.query.order_by(Ejercicio.id)],
+                         [fila["id"] for fila in ejercicios])
+        self.assertEqual({"usuario"} & {fila["tabla"] for fila in filas}, set())
+
+    def test_exportar_tabla_csv(self):
+        resultado = self.client.get("/exportar/ejercicio", query_string={"formato": "csv"}, headers=self.headers)
+        self.assertEqual(resultado.status_code, 200)
+        filas = list(csv.DictReader(StringIO(resultado.get_data(as_text=True))))
+        self.assertEqual(sorted(ejercicio.nombre for ejercicio in Ejercicio.query.all()),
+                         sorted(fila["nombre"] for fila in filas))
+
+        # Sin tabla el CSV no tiene un encabezado unico
+        self.assertEqual(400, self.client.get("/exportar", query_string={"formato": "csv"},
+                                              headers=self.headers).status_code)
+        self.assertEqual(404, self.client.get("/exportar/usuario", headers=self.headers).status_code)
@@ -0,0 +1,111 @@
+import json
+from unittest import TestCase
+from faker import Faker
+from faker.generator import random
+from modelos import db, Usuario, Ejercicio, Entrenamiento, Persona, ResumenEntrenamiento
+from app import app
+
+
+class TestImportacion(TestCase):
+
+    def setUp(self):
+        # Instanciamos la librerias a usar
+        self.data_factory = Faker()
+        self.client = app.test_client()
+
+        # Se crea el entrenador y se realiza el login
+        usuario = "test_" + self.data_factory.first_name()
+        contrasena = self.data_factory.password(length=10, special_chars=False, upper_case=True, lower_case=True, digits=True)
+        nueva_persona = {
+            "nombre": self.data_factory.name(),
+            "apellido": self.data_factory.name(),
+            "usuario": usuario,
+            "contrasena": contrasena
+        }
+        self.client.post("/signin", data=json.dumps(nueva_persona), headers={"Content-Type": "application/json"})
+        solicitud_login = self.client.post("/login",
+                                           data=json.dumps({"usuario": usuario, "contrasena": contrasena}),
+                                           headers={'Content-Type': 'application/json'})
+        respuesta_login = json.loads(solicitud_login.get_data())
+        self.usuario_id = respuesta_login["id"]
+        self.headers = {'Content-Type': 'application/x-ndjson', "Authorization": "Bearer {}".format(respuesta_login["token"])}
+
+    def tearDown(self):
+        for modelo in (Entrenamiento, Ejercicio, Persona, Usuario):
+            for objeto in db.session.query(modelo).all():
+                db.session.delete(objeto)
+                db.session.commit()
+
+    def dar_ejercicio(self):
+        return {"nombre": self.data_factory.sentence(), "descripcion": self.data_factory.sentence(),
+                "video": self.data_factory.image_url(), "calorias": round(random.uniform(0.1, 0.99), 2)}
+
+    def test_importar_ejercicios_por_lotes(self):
+        lineas = [json.dumps(self.dar_ejercicio()) for i in range(0, 5)]
+        lineas.insert(2, '{"nombre": "sin cerrar"')
+        lineas.insert(4, json.dumps({"nombre": "sin calorias", "descripcion": "", "video": ""}))
+        lineas.append('')
+        resultado = self.client.post("/importar/ejercicios", query_string={"lote": 2},
+                                     data="\n".join(lineas), headers=self.headers)
+        self.assertEqual(resultado.status_code, 200)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.assertEqual(5, datos_respuesta["insertados"])
+        self.assertEqual([3, 5], [error["linea"] for error in datos_respuesta["errores"]])
+        self.assertIn("calorias", datos_respuesta["errores"][1]["error"])
+        self.assertEqual(sorted(json.loads(linea)["nombre"] for linea in lineas if "\"calorias\":" in linea),
+                         sorted(ejercicio.nombre for ejercicio in Ejercicio.query.all()))
+
+    def test_importar_lote_con_restriccion_violada(self):
+        # Indice temporal para que un nombre repetido viole una restriccion al insertar
+        db.session.execute("CREATE UNIQUE INDEX ix_prueba_ejercicio_nombre ON ejercicio (nombre)")
+        db.session.commit()
+        try:
+            ejercicios = [self.dar_ejercicio() for i in range(0, 3)]
+            lineas = [ejercicios[0], ejercicios[1], ejercicios[0], ejercicios[2]]
+            resultado = self.client.post("/importar/ejercicios", query_string={"lote": 2},
+                                         data="\n".join(json.dumps(linea) for linea in lineas), headers=self.headers)
+        finally:
+            db.session.execute("DROP INDEX ix_prueba_ejercicio_nombre")
+            db.session.commit()
+        self.assertEqual(resultado.status_code, 200)
+        datos_respuesta = json.loads(resultado.get_data())
+        # Solo la linea repetida se pierde; el resto de su lote se inserta y la importacion continua
+        self.assertEqual(3, datos_respuesta["insertados"])
+        self.assertEqual([3], [error["linea"] for error in datos_respuesta["errores"]])
+        self.assertIn("UNIQUE", datos_respuesta["errores"][0]["error"])
+        self.assertEqual(sorted(ejercicio["nombre"] for ejercicio in ejercicios),
+                         sorted(ejercicio.nombre for ejercicio in Ejercicio.query.all()))
+
+    def test_importar_personas_y_entrenamientos(self):
+        persona = {"nombre": self.data_factory.first_name(), "apellido": self.data_factory.last_name(), "talla": 1.7,
+                   "peso": 70, "edad": 30, "ingreso": "2023-01-01", "brazo": 30, "pecho": 90, "cintura": 80,
+                   "pierna": 50, "entrenando": True, "razon": "", "terminado": "2023-12-31"}
+        lineas = [dict(persona, usuario="cliente_importado", contrasena="Cliente123"),
+                  dict(persona, usuario="cliente_importado", contrasena="Cliente123"),
+                  persona]
+        resultado = self.client.post("/importar/personas", query_string={"entrenador": self.usuario_id},
+                                     data="\n".join(json.dumps(linea) for linea in lineas), headers=self.headers)
+        datos_respuesta = json.loads(resultado.get_data())
+        self.assertEqual(2, datos_respuesta["insertados"])
+        self.assertEqual([{"linea": 2, "error": "El usuario ya existe"}], datos_respuesta["errores"])
+        self.assertEqual(1, Usuario.query.filter(Usuario.usuario == "cliente_importado", Usuario.rol == "CLI").count())
+        clientes = Persona.query.filter(Persona.entrenador == self.usuario_id).all()
+        self.assertEqual(2, len(clientes))
+
+        # Los entrenamientos importados actualizan el resumen de los reportes
+        ejercicio = Ejercicio(**self.dar_ejercicio())
+        db.session.add(ejercicio)
+        db.session.commit()
+        entrenamientos = [{"tiempo": "00:10:00", "repeticiones": 5, "fecha": "2023-02-0{}".format(i % 3 + 1),
+                           "ejercicio": ejercicio.id, "persona": clientes[i % 2].id} for i in range(0, 7)]
+        resultado = self.client.post("/importar/entrenamientos", query_string={"lote": 3},
+                                     data="\n".join(json.dumps(linea) for linea in entrenamientos), headers=self.headers)
+        self.assertEqual(7, json.loads(resultado.get_data())["insertados"])
+        self.assertEqual(7, Entrenamiento.query.count())
+        self.assertEqual(35, sum(resumen.repeticiones for resumen in ResumenEntrenamiento.query.all()))
+
+    def test_importar_recurso_invalido(self):
+        resultado = self.client.post("/importar/rutinas", data="{}", headers=self.headers)
+        self.assertEqual(resultado.status_code, 404)
+        resultado = self.client.post("/importar/personas", data="{}", headers=self.headers)
+        self.assertEqual(resultado.status_code, 400)
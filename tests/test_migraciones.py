@@ -0,0 +1,79 @@
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine
+from modelos import db, Rutina, rutinas_ejercicios
+from app import app
+from vistas.utilidad_migraciones import MIGRACIONES, dar_version, migrar, verificar_planes
+
+
+class TestMigraciones(TestCase):
+
+    def setUp(self):
+        # Base de datos con el esquema anterior: rutina sin total_ejercicios y sin indices secundarios
+        descriptor, self.ruta = tempfile.mkstemp(suffix='.sqlite')
+        os.close(descriptor)
+        self.motor = create_engine('sqlite:///' + self.ruta)
+        tablas = [tabla for tabla in db.metadata.sorted_tables if tabla is not Rutina.__table__]
+        with self.motor.begin() as conexion:
+            conexion.exec_driver_sql('CREATE TABLE rutina (id INTEGER PRIMARY KEY, nombre VARCHAR(128), '
+                                     'descripcion VARCHAR(512))')
+            db.metadata.create_all(conexion, tables=tablas)
+            for nombre, in conexion.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").all():
+                conexion.exec_driver_sql('DROP INDEX {}'.format(nombre))
+            conexion.exec_driver_sql("INSERT INTO rutina (id, nombre, descripcion) VALUES (1, 'Fuerza', ''), (2, 'Cardio', ''), "
+                                     "(3, 'FUERZA', ''), (4, 'Fuerza (2)', ''), (5, 'Rutina Ñandú', ''), (6, 'RUTINA ÑANDÚ', '')")
+            conexion.execute(rutinas_ejercicios.insert(), [dict(rutina_id=1, ejercicio_id=ejercicio) for ejercicio in (1, 2, 3)])
+            conexion.exec_driver_sql("INSERT INTO ejercicio (id, nombre, calorias) VALUES (1, 'Sentadilla', 2)")
+            conexion.exec_driver_sql("INSERT INTO persona (id, nombre) VALUES (1, 'Cliente')")
+            conexion.exec_driver_sql("INSERT INTO entrenamiento (tiempo, repeticiones, fecha, ejercicio, persona) VALUES "
+                                     "('00:01:00.000000', 3, '2023-01-02', 1, 1), ('00:01:00.000000', 2, '2023-01-02', 1, 1)")
+
+    def tearDown(self):
+        self.motor.dispose()
+        os.remove(self.ruta)
+
+    def test_migrar_base_de_datos_existente(self):
+        aplicadas = migrar(self.motor)
+        self.assertEqual([numero for numero, descripcion, migracion in MIGRACIONES], [numero for numero, descripcion, avisos in aplicadas])
+        # Los nombres que solo difieren en mayusculas se renombran y se informan en lugar de fallar
+        self.assertEqual(['Rutina 3: nombre repetido "FUERZA" renombrado a "FUERZA (3)"',
+                          'Rutina 6: nombre repetido "RUTINA ÑANDÚ" renombrado a "RUTINA ÑANDÚ (2)"'],
+                         [aviso for numero, descripcion, avisos in aplicadas for aviso in avisos])
+        with self.motor.connect() as conexion:
+            self.assertEqual(MIGRACIONES[-1][0], dar_version(conexion))
+            self.assertEqual([(1, 'Fuerza', 'fuerza', 3), (2, 'Cardio', 'cardio', 0), (3, 'FUERZA (3)', 'fuerza (3)', 0),
+                              (4, 'Fuerza (2)', 'fuerza (2)', 0), (5, 'Rutina Ñandú', 'rutina ñandú', 0),
+                              (6, 'RUTINA ÑANDÚ (2)', 'rutina ñandú (2)', 0)],
+                             conexion.exec_driver_sql('SELECT id, nombre, nombre_normalizado, total_ejercicios FROM rutina '
+                                                      'ORDER BY id').all())
+            # El resumen que leen los reportes se llena con los entrenamientos existentes
+            self.assertEqual([(1, '2023-01-02', 'Ejercicio', 5, 120)], conexion.exec_driver_sql(
+                'SELECT persona, fecha, tipo, repeticiones, segundos FROM resumen_entrenamiento').all())
+            # Todas las consultas frecuentes usan su indice en la base de datos migrada
+            self.assertEqual([], [(nombre, plan) for nombre, indice, plan, usa_indice in verificar_planes(conexion)
+                                  if not usa_indice])
+        # Una segunda ejecucion no aplica nada
+        self.assertEqual([], migrar(self.motor))
+
+    def test_reemplazar_indice_lower(self):
+        # Base de datos que ya tenia el indice unico sobre lower(nombre), que admite "Ñandú" y "ÑANDÚ"
+        with self.motor.begin() as conexion:
+            conexion.exec_driver_sql("DELETE FROM rutina WHERE id = 3")
+            for numero, descripcion, migracion in MIGRACIONES[:3]:
+                migracion(conexion)
+            conexion.exec_driver_sql('CREATE UNIQUE INDEX ix_rutina_nombre_minusculas ON rutina (lower(nombre))')
+            conexion.exec_driver_sql('PRAGMA user_version = 3')
+        aplicadas = migrar(self.motor)
+        self.assertEqual([(4, 'Nombre normalizado de rutina',
+                           ['Rutina 6: nombre repetido "RUTINA ÑANDÚ" renombrado a "RUTINA ÑANDÚ (2)"'])], aplicadas)
+        with self.motor.connect() as conexion:
+            indices = {nombre for nombre, in conexion.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertNotIn('ix_rutina_nombre_minusculas', indices)
+            self.assertIn('ix_rutina_nombre_normalizado', indices)
+
+    def test_planes_base_de_datos_de_la_aplicacion(self):
+        with db.engine.connect() as conexion:
+            self.assertEqual(MIGRACIONES[-1][0], dar_version(conexion))
+            self.assertEqual([], [(nombre, plan) for nombre, indice, plan, usa_indice in verificar_planes(conexion)
+                                  if not usa_indice])
@@ -5,7 +5,8 @@ from unittest import TestCase
 from faker import Faker
 from datetime import datetime
 from faker.generator import random
-from modelos import db, Usuario, Persona, PersonaSchema
+from modelos import db, Usuario, Persona, PersonaSchema, Entrenamiento
+from sqlalchemy import event
 from app import app
 
 # Clase que contiene las pruebas unitarias asociadas a la entidad Persona
@@ -243,4 +244,41 @@ class TestPersona(TestCase):
         self.assertEqual(brazo_cliente, int(float(respuesta_creacion["brazo"])))
         self.assertEqual(pecho_cliente, int(float(respuesta_creacion["pecho"])))
         self.assertEqual(cintura_cliente, int(float(respuesta_creacion["cintura"])))
-        self.assertEqual(pierna_cliente, int(float(respuesta_creacion["pierna"])))
\ No newline at end of file
+        self.assertEqual(pierna_cliente, int(float(respuesta_creacion["pierna"])))
+
+    # Función que valida que solo se elimine un cliente sin entrenamientos
+    def test_eliminar_cliente(self):
+        usuario = "test_" + self.data_factory.first_name()
+        contrasena = self.data_factory.password(length=10, special_chars=False, upper_case=True, lower_case= True, digits= True)
+        self.client.post("/signin", data=json.dumps({"nombre": self.data_factory.name(), "apellido": self.data_factory.name(),
+                                                     "usuario": usuario, "contrasena": contrasena}),
+                         headers={"Content-Type": "application/json"})
+        solicitud_login = self.client.post("/login", data=json.dumps({"usuario": usuario, "contrasena": contrasena}),
+                                           headers={"Content-Type": "application/json"})
+        headers = {"Authorization": "Bearer {}".format(json.loads(solicitud_login.get_data())["token"])}
+        cliente = Persona(nombre=self.data_factory.name(), apellido=self.data_factory.last_name())
+        cliente.entrenamientos.append(Entrenamiento(fecha=datetime.today().date(), repeticiones=1))
+        db.session.add(cliente)
+        db.session.commit()
+        id_cliente = cliente.id
+
+        consultas = []
+        def contar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar)
+        try:
+            solicitud_eliminacion = self.client.delete(f"/persona/{id_cliente}", headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar)
+        self.assertEqual(solicitud_eliminacion.status_code, 409)
+        # Los entrenamientos no se cargan, solo se verifica que exista alguno
+        consultas_entrenamiento = [consulta for consulta in consultas if "entrenamiento" in consulta]
+        self.assertEqual(1, len(consultas_entrenamiento))
+        self.assertIn("EXISTS", consultas_entrenamiento[0])
+
+        for entrenamiento in Entrenamiento.query.filter_by(persona=id_cliente).all():
+            db.session.delete(entrenamiento)
+        db.session.commit()
+        self.assertEqual(self.client.delete(f"/persona/{id_cliente}", headers=headers).status_code, 204)
+        self.assertIsNone(Persona.query.get(id_cliente))
+        self.assertEqual(self.client.delete("/entrenador/0", headers=headers).status_code, 404)
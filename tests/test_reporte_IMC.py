@@ -2,10 +2,14 @@ import json
 import hashlib
 from faker import Faker
 import unittest
-from modelos import db, Usuario, Rutina, Ejercicio, Entrenamiento
+from modelos import db, Usuario, Rutina, Ejercicio, Entrenamiento, Persona, ResumenEntrenamiento
 from app import app
+from vistas.utilidad_reporte import UtilidadReporte, numpy
+from vistas.utilidad_resumen import UtilidadResumen
+from vistas.utilidad_cache import CacheReportes
 import random
-from datetime import datetime, timedelta
+from sqlalchemy import event
+from datetime import datetime, timedelta, time
 
 class TestReporteIMC(unittest.TestCase):
 
@@ -55,8 +59,436 @@ class TestReporteIMC(unittest.TestCase):
         for usuario in usuarios:
             db.session.delete(usuario)
             db.session.commit()
+        personas = db.session.query(Persona).all()
+        for persona in personas:
+            db.session.delete(persona)
+            db.session.commit()
+
+
+
+    def test_reporte_imc(self):
+        #Crear la persona y los ejercicios del reporte con valores conocidos
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.75, peso=70, entrenador=self.usuario_id)
+        db.session.add(persona)
+        ejercicios = [Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                                video=self.data_factory.file_path(depth=3), calorias=calorias) for calorias in (10, 5)]
+        db.session.add_all(ejercicios)
+        db.session.commit()
+
+        #Calorias de cada entrenamiento: 4 * repeticiones^2 * calorias del ejercicio / segundos
+        #  2023-04-01: 4*5*5*10/100 = 10 y 4*6*6*5/120 = 6  -> 11 repeticiones, 16 calorias
+        #  2023-04-02: 4*10*10*10/400 = 10                 -> 10 repeticiones, 10 calorias
+        for fecha, ejercicio, repeticiones, tiempo in ((datetime(2023, 4, 1), ejercicios[0], 5, time(0, 1, 40)),
+                                                       (datetime(2023, 4, 1), ejercicios[1], 6, time(0, 2, 0)),
+                                                       (datetime(2023, 4, 2), ejercicios[0], 10, time(0, 6, 40))):
+            db.session.add(Entrenamiento(fecha=fecha.date(), persona=persona.id, ejercicio=ejercicio.id,
+                                         repeticiones=repeticiones, tiempo=tiempo))
+        db.session.commit()
+        esperados = [('2023-04-01', 11, 16), ('2023-04-02', 10, 10), ('Total', 21, 26)]
+
+        #Definir endpoint y encabezados, y consultar el reporte con cada motor
+        endpoint_reporte = "/persona/" + str(persona.id) + "/reporte"
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        motor_configurado = app.config['REPORTE_MOTOR']
+        motores = ['resumen', 'python'] + ([] if numpy is None else ['numpy'])
+        try:
+            for motor in motores:
+                app.config['REPORTE_MOTOR'] = motor
+                resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+                datos_reporte = json.loads(resultado_reporte.get_data())
+
+                #Verificar que el llamado fue exitoso, el IMC (70 / 1.75^2) y los totales por fecha
+                self.assertEqual(resultado_reporte.status_code, 200)
+                self.assertAlmostEqual(22.857142857, datos_reporte['imc'], places=6)
+                self.assertEqual(datos_reporte['clasificacion_imc'], 'Peso saludable')
+                obtenidos = [(fila['fecha'], float(fila['repeticiones']), float(fila['calorias']))
+                             for fila in datos_reporte['resultados']]
+                self.assertEqual([fecha for fecha, repeticiones, calorias in esperados],
+                                 [fecha for fecha, repeticiones, calorias in obtenidos], motor)
+                for esperado, obtenido in zip(esperados, obtenidos):
+                    self.assertAlmostEqual(esperado[1], obtenido[1], places=6, msg=motor)
+                    self.assertAlmostEqual(esperado[2], obtenido[2], places=6, msg=motor)
+        finally:
+            app.config['REPORTE_MOTOR'] = motor_configurado
+
+        #El calculo por lotes, sin el endpoint, entrega los mismos valores
+        persona = db.session.query(Persona).get(persona.id)
+        resultados = UtilidadReporte().dar_resultados_lote(persona.entrenamientos)
+        self.assertEqual(esperados, [(fila['fecha'], float(fila['repeticiones']), float(fila['calorias']))
+                                     for fila in resultados])
 
 
+    def test_reporte_imc_igual_al_original(self):
+        #Entrenamientos fuera de orden de fecha, con repeticiones fraccionarias y calorias con muchos decimales
+        persona = Persona(nombre='Ana', apellido='Gomez', talla=1.75, peso=70, entrenador=self.usuario_id)
+        ejercicios = [Ejercicio(nombre='Sentadilla', descripcion='', video='', calorias=7.3),
+                      Ejercicio(nombre='Plancha', descripcion='', video='', calorias=12.5)]
+        db.session.add_all([persona] + ejercicios)
+        db.session.commit()
+        for fecha, ejercicio, repeticiones, tiempo in ((datetime(2023, 5, 3), 0, 8, time(0, 2, 37)),
+                                                       (datetime(2023, 5, 1), 1, 12, time(0, 4, 11)),
+                                                       (datetime(2023, 5, 3), 1, 5, time(0, 1, 3)),
+                                                       (datetime(2023, 5, 2), 0, 10, time(0, 3, 7)),
+                                                       (datetime(2023, 5, 1), 0, 7.5, time(0, 0, 59))):
+            db.session.add(Entrenamiento(fecha=fecha.date(), persona=persona.id, ejercicio=ejercicios[ejercicio].id,
+                                         repeticiones=repeticiones, tiempo=tiempo))
+        db.session.commit()
+
+        #Con el motor por defecto la respuesta es la misma del reporte original: orden de aparicion y texto del Decimal
+        endpoint_reporte = "/persona/" + str(persona.id) + "/reporte"
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+        self.assertEqual(resultado_reporte.status_code, 200)
+        self.assertEqual([
+            {'fecha': '2023-05-03', 'repeticiones': '13.0000000000', 'calorias': '31.74445455464563744818521888'},
+            {'fecha': '2023-05-01', 'repeticiones': '19.5000000000', 'calorias': '56.52424201499088392193936120'},
+            {'fecha': '2023-05-02', 'repeticiones': '10.0000000000', 'calorias': '15.61497326203208556149732620'},
+            {'fecha': 'Total', 'repeticiones': '42.5000000000', 'calorias': '103.8836698316686069316219063'}],
+            json.loads(resultado_reporte.get_data())['resultados'])
+
+
+    @unittest.skipIf(numpy is None, "numpy no esta instalado")
+    def test_reporte_imc_motor_numpy(self):
+        #Crear la persona con entrenamientos en varias fechas
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.60, peso=80, entrenador=self.usuario_id)
+        db.session.add(persona)
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=self.data_factory.random_int(5, 15))
+        db.session.add(ejercicio)
+        db.session.commit()
+        for i in range(0, 10):
+            entrenamiento = Entrenamiento(fecha=datetime.now().date()-timedelta(days=i % 3), persona=persona.id,
+                                          ejercicio=ejercicio.id, repeticiones=random.randint(5, 10),
+                                          tiempo=time(0, random.randint(1, 59), random.randint(1, 59)))
+            db.session.add(entrenamiento)
+        db.session.commit()
+
+        #Consultar el reporte con ambos motores
+        endpoint_reporte = "/persona/" + str(persona.id) + "/reporte"
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        resultados = {}
+        motor_configurado = app.config['REPORTE_MOTOR']
+        for motor in ['python', 'numpy']:
+            app.config['REPORTE_MOTOR'] = motor
+            resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+            self.assertEqual(resultado_reporte.status_code, 200)
+            resultados[motor] = json.loads(resultado_reporte.get_data())['resultados']
+        app.config['REPORTE_MOTOR'] = motor_configurado
+
+        #Verificar que ambos motores entregan las mismas fechas y totales; el texto de cada motor es distinto
+        self.assertEqual([fila['fecha'] for fila in resultados['python']], [fila['fecha'] for fila in resultados['numpy']])
+        for fila_python, fila_numpy in zip(resultados['python'], resultados['numpy']):
+            self.assertAlmostEqual(float(fila_python['repeticiones']), float(fila_numpy['repeticiones']), places=6)
+            self.assertAlmostEqual(float(fila_python['calorias']), float(fila_numpy['calorias']), places=6)
+
+
+    def test_resumen_con_valores_nulos(self):
+        #Entrenamientos sin repeticiones y ejercicios sin calorias en la misma fecha que uno completo
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.70, peso=70, entrenador=self.usuario_id)
+        sin_calorias = Ejercicio(nombre=self.data_factory.first_name(), calorias=None)
+        con_calorias = Ejercicio(nombre=self.data_factory.first_name(), calorias=2)
+        db.session.add_all([persona, sin_calorias, con_calorias])
+        db.session.commit()
+        fecha = datetime(2023, 3, 1).date()
+        db.session.add_all([
+            Entrenamiento(fecha=fecha, persona=persona.id, ejercicio=sin_calorias.id, repeticiones=None, tiempo=time(0, 1, 0)),
+            Entrenamiento(fecha=fecha, persona=persona.id, ejercicio=con_calorias.id, repeticiones=4, tiempo=time(0, 1, 0))])
+        db.session.commit()
+
+        #Los valores faltantes cuentan como cero sin mezclar float y Decimal al acumular
+        UtilidadResumen().reconstruir()
+        resumen = ResumenEntrenamiento.query.filter(ResumenEntrenamiento.persona == persona.id).one()
+        self.assertEqual(4, resumen.repeticiones)
+        self.assertEqual(120, resumen.segundos)
+        self.assertAlmostEqual(4*4*4*2/60, float(resumen.calorias), places=4)
+        self.assertEqual(8, resumen.calorias_consumidas)
+
+
+    def test_resumen_se_mantiene_con_las_escrituras(self):
+        #Crear la persona y el ejercicio
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.80, peso=75, entrenador=self.usuario_id)
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=self.data_factory.random_int(5, 15))
+        db.session.add(persona)
+        db.session.add(ejercicio)
+        db.session.commit()
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        #Crear entrenamientos por el servicio
+        id_entrenamientos = []
+        for i in range(0, 4):
+            nuevo_entrenamiento = {
+                "ejercicio": ejercicio.id,
+                "fecha": (datetime.now().date()-timedelta(days=i % 2)).strftime('%Y-%m-%d'),
+                "tiempo": "00:{:02d}:{:02d}".format(random.randint(1, 59), random.randint(1, 59)),
+                "repeticiones": random.randint(1, 10)
+            }
+            resultado = self.client.post("/entrenamientos/" + str(persona.id), data=json.dumps(nuevo_entrenamiento), headers=headers)
+            self.assertEqual(resultado.status_code, 200)
+            id_entrenamientos.append(json.loads(resultado.get_data())['id'])
+
+        #Editar un entrenamiento cambiando su fecha y cambiar las calorias del ejercicio
+        edicion = {
+            "ejercicio": ejercicio.id,
+            "fecha": (datetime.now().date()-timedelta(days=5)).strftime('%Y-%m-%d'),
+            "tiempo": "00:20:00",
+            "repeticiones": 7,
+            "persona": persona.id
+        }
+        resultado = self.client.put("/entrenamiento/" + str(id_entrenamientos[0]), data=json.dumps(edicion), headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        ejercicio.calorias = 20
+        db.session.commit()
+        self.assertEqual(3, ResumenEntrenamiento.query.filter_by(persona=persona.id).count())
+
+        #Verificar que el resumen mantenido coincide con uno reconstruido desde cero
+        mantenido = [(fila.fecha, fila.tipo, float(fila.repeticiones), float(fila.calorias), float(fila.calorias_consumidas))
+                     for fila in ResumenEntrenamiento.query.filter_by(persona=persona.id).order_by(ResumenEntrenamiento.fecha)]
+        UtilidadResumen().reconstruir()
+        reconstruido = [(fila.fecha, fila.tipo, float(fila.repeticiones), float(fila.calorias), float(fila.calorias_consumidas))
+                        for fila in ResumenEntrenamiento.query.filter_by(persona=persona.id).order_by(ResumenEntrenamiento.fecha)]
+        self.assertEqual(mantenido, reconstruido)
+
+        #Eliminar los entrenamientos deja el resumen vacio
+        for id_entrenamiento in id_entrenamientos:
+            resultado = self.client.delete("/entrenamiento/" + str(id_entrenamiento), headers=headers)
+            self.assertEqual(resultado.status_code, 204)
+        self.assertEqual(0, ResumenEntrenamiento.query.filter_by(persona=persona.id).count())
+
+
+    def test_cache_reporte_se_invalida_al_escribir(self):
+        #Crear la persona y el ejercicio
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.70, peso=65, entrenador=self.usuario_id)
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=10)
+        db.session.add(persona)
+        db.session.add(ejercicio)
+        db.session.commit()
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        endpoint_reporte = "/persona/" + str(persona.id) + "/reporte"
+
+        #La segunda consulta se responde desde la cache
+        self.client.get(endpoint_reporte, headers=headers)
+        estadisticas = json.loads(self.client.get("/cache/reportes", headers=headers).get_data())
+        resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+        self.assertEqual(resultado_reporte.status_code, 200)
+        estadisticas_cache = json.loads(self.client.get("/cache/reportes", headers=headers).get_data())
+        self.assertEqual(estadisticas['aciertos'] + 1, estadisticas_cache['aciertos'])
+        self.assertEqual(1, len(json.loads(resultado_reporte.get_data())['resultados']))
+
+        #Registrar un entrenamiento invalida el reporte de la persona
+        nuevo_entrenamiento = {
+            "ejercicio": ejercicio.id,
+            "fecha": datetime.now().date().strftime('%Y-%m-%d'),
+            "tiempo": "00:10:00",
+            "repeticiones": 5
+        }
+        self.client.post("/entrenamientos/" + str(persona.id), data=json.dumps(nuevo_entrenamiento), headers=headers)
+        resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+        self.assertEqual(2, len(json.loads(resultado_reporte.get_data())['resultados']))
+
+        #Cambiar las calorias del ejercicio tambien invalida el reporte
+        ejercicio.calorias = 20
+        db.session.commit()
+        resultado_reporte = self.client.get(endpoint_reporte, headers=headers)
+        self.assertAlmostEqual(4*5*5*20/600, float(json.loads(resultado_reporte.get_data())['resultados'][-1]['calorias']), places=4)
+
+
+    def test_reporte_imc_paginado_por_fechas(self):
+        #Crear la persona con entrenamientos en cinco fechas distintas
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                          talla=1.70, peso=90, entrenador=self.usuario_id)
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=10)
+        db.session.add(persona)
+        db.session.add(ejercicio)
+        db.session.commit()
+        hoy = datetime.now().date()
+        for i in range(0, 5):
+            db.session.add(Entrenamiento(fecha=hoy-timedelta(days=i), persona=persona.id, ejercicio=ejercicio.id,
+                                         repeticiones=i+1, tiempo=time(0, 10, 0)))
+        db.session.commit()
+        endpoint_reporte = "/persona/" + str(persona.id) + "/reporte"
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        #Recorrer las paginas de la mas reciente a la mas antigua
+        fechas = []
+        parametros = {"limit": 2}
+        paginas = 0
+        while True:
+            resultado_reporte = self.client.get(endpoint_reporte, query_string=parametros, headers=headers)
+            self.assertEqual(resultado_reporte.status_code, 200)
+            datos_reporte = json.loads(resultado_reporte.get_data())
+            filas = datos_reporte['resultados'][:-1]
+            self.assertLessEqual(len(filas), 2)
+            fechas = [fila['fecha'] for fila in filas] + fechas
+            total_pagina = sum(float(fila['repeticiones']) for fila in filas)
+            self.assertAlmostEqual(total_pagina, float(datos_reporte['resultados'][-1]['repeticiones']))
+            paginas += 1
+            self.assertNotIn('siguiente', datos_reporte)
+            if 'X-Siguiente-Cursor' not in resultado_reporte.headers:
+                break
+            parametros = {"limit": 2, "cursor": resultado_reporte.headers['X-Siguiente-Cursor']}
+        self.assertEqual(3, paginas)
+        #Las paginas cubren cada fecha una vez; dentro de la pagina el motor python conserva el orden de aparicion
+        self.assertEqual([str(hoy-timedelta(days=i)) for i in range(4, -1, -1)], sorted(fechas))
+
+        #El total puede pedirse sobre todo el historial
+        resultado_reporte = self.client.get(endpoint_reporte, query_string={"limit": 1, "total": "completo"}, headers=headers)
+        datos_reporte = json.loads(resultado_reporte.get_data())
+        self.assertAlmostEqual(15, float(datos_reporte['resultados'][-1]['repeticiones']))
+        #Las paginas no incluyen las relaciones de la persona
+        self.assertNotIn('entrenamientos', datos_reporte['persona'])
+        self.assertNotIn('usuario', datos_reporte['persona'])
+
+        #La ventana y el total completo respetan el motor configurado
+        motor_configurado = app.config['REPORTE_MOTOR']
+        app.config['REPORTE_MOTOR'] = 'resumen'
+        try:
+            resultado_reporte = self.client.get(endpoint_reporte, query_string={"limit": 2, "total": "completo"},
+                                                headers=headers)
+        finally:
+            app.config['REPORTE_MOTOR'] = motor_configurado
+        datos_reporte = json.loads(resultado_reporte.get_data())
+        self.assertEqual([str(hoy-timedelta(days=1)), str(hoy), 'Total'],
+                         sorted(fila['fecha'] for fila in datos_reporte['resultados']))
+        self.assertAlmostEqual(15, float(datos_reporte['resultados'][-1]['repeticiones']))
+        self.assertIn('X-Siguiente-Cursor', resultado_reporte.headers)
+
+        #Filtrar por rango de fechas
+        resultado_reporte = self.client.get(endpoint_reporte, headers=headers, query_string={
+            "desde": str(hoy-timedelta(days=3)), "hasta": str(hoy-timedelta(days=2))})
+        datos_reporte = json.loads(resultado_reporte.get_data())
+        self.assertEqual([str(hoy-timedelta(days=3)), str(hoy-timedelta(days=2)), 'Total'],
+                         sorted(fila['fecha'] for fila in datos_reporte['resultados']))
+
+        #Parametros invalidos
+        resultado_reporte = self.client.get(endpoint_reporte, query_string={"cursor": "no-es-un-cursor"}, headers=headers)
+        self.assertEqual(resultado_reporte.status_code, 400)
+
+
+    def test_resultados_entrenamientos_por_persona_y_fechas(self):
+        #Crear dos personas con entrenamientos de ejercicio y de rutina en las mismas fechas
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        rutina = Rutina(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence())
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=7)
+        personas = [Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                            talla=1.70, peso=70, entrenador=self.usuario_id) for i in range(0, 2)]
+        db.session.add_all([rutina, ejercicio] + personas)
+        db.session.commit()
+        hoy = datetime.now().date()
+        for persona in personas:
+            for i in range(0, 6):
+                db.session.add(Entrenamiento(fecha=hoy-timedelta(days=i % 3), persona=persona.id, ejercicio=ejercicio.id,
+                                             repeticiones=random.randint(1, 10), tiempo=time(0, 5, 0),
+                                             rutina=rutina.id if i % 2 else None))
+        db.session.commit()
+
+        #Consultar con rango de fechas
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        desde = hoy-timedelta(days=1)
+        resultado = self.client.get("/resultadosEntrenamientos/" + str(personas[0].id),
+                                    query_string={"desde": str(desde), "hasta": str(hoy)}, headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        datos_respuesta = json.loads(resultado.get_data())
+
+        #Calcular lo esperado agrupando los entrenamientos de la persona en la base de datos
+        esperado = db.session.execute(
+            "SELECT ENTR.persona, ENTR.fecha, CASE WHEN ENTR.rutina IS NULL THEN 'Ejercicio' ELSE 'Rutina' END AS tipo, "
+            "SUM(ENTR.repeticiones) AS repeticiones, SUM(ENTR.repeticiones*EJER.calorias) AS calorias "
+            "FROM entrenamiento AS ENTR JOIN ejercicio AS EJER ON ENTR.ejercicio = EJER.id "
+            "WHERE ENTR.persona = :persona AND ENTR.fecha BETWEEN :desde AND :hasta "
+            "GROUP BY ENTR.persona, ENTR.fecha, tipo ORDER BY ENTR.fecha, tipo",
+            {"persona": personas[0].id, "desde": str(desde), "hasta": str(hoy)}).fetchall()
+        self.assertEqual(4, len(datos_respuesta))
+        for fila_esperada, fila_respuesta in zip(esperado, datos_respuesta):
+            self.assertEqual(fila_esperada.persona, fila_respuesta['persona'])
+            self.assertEqual(fila_esperada.fecha, fila_respuesta['fecha'])
+            self.assertEqual(fila_esperada.tipo, fila_respuesta['Tipo de Entrenamiento'])
+            self.assertEqual(fila_esperada.repeticiones, fila_respuesta['Repeticiones Ejecutadas'])
+            self.assertAlmostEqual(fila_esperada.calorias, fila_respuesta['Calorias Consumidas'])
+
+
+    def test_reportes_entrenador(self):
+        #Crear clientes del entrenador con entrenamientos de dos ejercicios
+        self.data_factory = Faker()
+        Faker.seed(1000)
+        ejercicios = [Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                                video=self.data_factory.file_path(depth=3), calorias=calorias) for calorias in (12, 7.5)]
+        db.session.add_all(ejercicios)
+        db.session.commit()
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        endpoint_reportes = "/entrenador/" + str(self.usuario_id) + "/reportes"
+        motores = ['python', 'resumen'] + ([] if numpy is None else ['numpy'])
+        motor_configurado = app.config['REPORTE_MOTOR']
+
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+
+        cantidad_consultas = {motor: [] for motor in motores}
+        reportes = {}
+        try:
+            for total_clientes in [2, 5]:
+                while db.session.query(Persona).filter(Persona.entrenador == self.usuario_id).count() < total_clientes:
+                    persona = Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                                      talla=1.60 + random.randint(0, 30)/100, peso=random.randint(50, 110),
+                                      entrenador=self.usuario_id)
+                    db.session.add(persona)
+                    db.session.commit()
+                    for i in range(0, 4):
+                        db.session.add(Entrenamiento(fecha=datetime.now().date()-timedelta(days=(i * 2) % 3), persona=persona.id,
+                                                     ejercicio=ejercicios[i % 2].id, repeticiones=random.randint(1, 10),
+                                                     tiempo=time(0, random.randint(1, 59), random.randint(1, 59))))
+                    db.session.commit()
+
+                for motor in motores:
+                    app.config['REPORTE_MOTOR'] = motor
+                    consultas.clear()
+                    event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+                    resultado_reportes = self.client.get(endpoint_reportes, headers=headers)
+                    event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+                    cantidad_consultas[motor].append(len(consultas))
+                    self.assertEqual(resultado_reportes.status_code, 200)
+                    reportes[motor] = json.loads(resultado_reportes.get_data())
+
+            for motor in motores:
+                app.config['REPORTE_MOTOR'] = motor
+                #El numero de consultas no depende del numero de clientes
+                self.assertEqual(cantidad_consultas[motor][0], cantidad_consultas[motor][1], motor)
+
+                #Cada reporte coincide con el reporte individual de la persona calculado con el mismo motor
+                self.assertEqual(5, len(reportes[motor]))
+                for reporte in reportes[motor]:
+                    resultado_reporte = self.client.get("/persona/" + reporte['persona']['id'] + "/reporte",
+                                                        headers=headers)
+                    self.assertEqual(json.loads(resultado_reporte.get_data()), reporte, motor)
+        finally:
+            app.config['REPORTE_MOTOR'] = motor_configurado
+
+        #La salida en streaming entrega un reporte por linea
+        resultado_stream = self.client.get(endpoint_reportes, query_string={"stream": 1}, headers=headers)
+        self.assertEqual(resultado_stream.status_code, 200)
+        self.assertEqual(reportes[motor_configurado],
+                         [json.loads(linea) for linea in resultado_stream.get_data(as_text=True).splitlines()])
+
 
     def test_resultados_entrenamientos(self):
         #Crear los datos de la rutina 
@@ -165,19 +597,49 @@ class TestReporteIMC(unittest.TestCase):
             else:   
                 self.assertEqual(repeticionesEjercicios, datos_respuesta_resultadosEntrenamientos[1]['Repeticiones Ejecutadas'])
                 self.assertEqual(caloriasEjercicios, datos_respuesta_resultadosEntrenamientos[1]['Calorias Consumidas'])
-        
-        
 
-       
 
+class TestCacheReportes(unittest.TestCase):
 
-        
-
+    def test_desalojo_y_vigencia(self):
+        reloj = [0]
+        cache = CacheReportes(tamano_maximo=2, ttl=10, reloj=lambda: reloj[0])
+        cache.guardar(1, 'reporte', {'persona': 1}, cache.obtener(1, 'reporte')[1])
+        cache.guardar(2, 'reporte', {'persona': 2}, cache.obtener(2, 'reporte')[1])
+        self.assertEqual({'persona': 1}, cache.obtener(1, 'reporte')[0])
 
+        #La persona 2 es la menos usada y sale al guardar una tercera
+        cache.guardar(3, 'reporte', {'persona': 3}, cache.obtener(3, 'reporte')[1])
+        self.assertIsNone(cache.obtener(2, 'reporte')[0])
+        self.assertEqual(1, cache.dar_estadisticas()['desalojos'])
 
-        
-
-       
+        #Las entradas vencidas no se entregan
+        reloj[0] = 11
+        self.assertIsNone(cache.obtener(1, 'reporte')[0])
+        estadisticas = cache.dar_estadisticas()
+        self.assertEqual(1, estadisticas['aciertos'])
+        self.assertEqual(5, estadisticas['fallos'])
 
+    def test_no_guarda_reportes_calculados_antes_de_invalidar(self):
+        cache = CacheReportes(tamano_maximo=2, ttl=10)
+        #Una consulta falla, una escritura invalida a la persona mientras se calcula el reporte y luego se guarda
+        valor, generacion = cache.obtener(1, 'reporte')
+        self.assertIsNone(valor)
+        cache.invalidar_persona(1)
+        cache.guardar(1, 'reporte', {'persona': 1, 'version': 'anterior'}, generacion)
+        self.assertIsNone(cache.obtener(1, 'reporte')[0])
+        self.assertEqual(1, cache.dar_estadisticas()['descartes'])
 
+        #Invalidar otra persona no impide guardar el reporte
+        valor, generacion = cache.obtener(1, 'reporte')
+        cache.invalidar_persona(2)
+        cache.guardar(1, 'reporte', {'persona': 1}, generacion)
+        self.assertEqual({'persona': 1}, cache.obtener(1, 'reporte')[0])
 
+        #Las generaciones olvidadas por tamano descartan tambien los reportes calculados antes de ellas
+        valor, generacion = cache.obtener(3, 'reporte')
+        cache.invalidar_persona(3)
+        cache.invalidar_persona(4)
+        cache.invalidar_persona(5)
+        cache.guardar(3, 'reporte', {'persona': 3}, generacion)
+        self.assertIsNone(cache.obtener(3, 'reporte')[0])
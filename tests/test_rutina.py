@@ -2,7 +2,9 @@ import json
 import hashlib
 from faker import Faker
 import unittest
-from modelos import db, Usuario, Rutina, Ejercicio
+from modelos import db, Usuario, Rutina, Ejercicio, Entrenamiento
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from app import app
 import random
 
@@ -169,6 +171,33 @@ class TestRutinaEndPoint(unittest.TestCase):
         self.assertEqual(datos_respuesta['descripcion'], rutina.descripcion)       
         self.assertIsNotNone(datos_respuesta['id'])
 
+    def test_crear_rutina_nombre_repetido(self):
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+        nueva_rutina = {"nombre": "Rutina de Fuerza", "descripcion": self.data_factory.sentence()}
+        resultado = self.client.post("/rutinas", data=json.dumps(nueva_rutina), headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+
+        # El nombre se compara sin importar mayusculas y minusculas
+        repetida = dict(nueva_rutina, nombre="RUTINA de fuerza")
+        resultado = self.client.post("/rutinas", data=json.dumps(repetida), headers=headers)
+        self.assertEqual(resultado.status_code, 409)
+        self.assertEqual(1, Rutina.query.count())
+
+        # La base de datos tambien rechaza el nombre repetido fuera de la vista
+        db.session.add(Rutina(nombre="rutina DE FUERZA", descripcion=""))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # Tambien con letras fuera de ASCII
+        nueva_rutina = dict(nueva_rutina, nombre="Rutina Ñandú")
+        resultado = self.client.post("/rutinas", data=json.dumps(nueva_rutina), headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        repetida = dict(nueva_rutina, nombre="RUTINA ÑANDÚ")
+        resultado = self.client.post("/rutinas", data=json.dumps(repetida), headers=headers)
+        self.assertEqual(resultado.status_code, 409)
+        self.assertEqual(2, Rutina.query.count())
+
 
     def test_listar_rutinas(self):
         #Crear los datos de las rutinas
@@ -365,6 +394,83 @@ class TestRutinaEndPoint(unittest.TestCase):
         self.assertEqual(len(datos_nueva_asociacion['ejercicios']), len(datos_asociacion['ejercicios']))
            
 
+    def test_etag_rutinas(self):
+        rutina = Rutina(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence())
+        ejercicio = Ejercicio(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence(),
+                              video=self.data_factory.file_path(depth=3), calorias=self.data_factory.random_int(1, 10000))
+        db.session.add_all([rutina, ejercicio])
+        db.session.commit()
+        headers = {'Content-Type': 'application/json', "Authorization": "Bearer {}".format(self.token)}
+
+        resultado = self.client.get("/rutinas", headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        etag = resultado.headers['ETag']
+
+        #Con la misma version se responde 304 sin consultar las rutinas
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        resultado = self.client.get("/rutinas", headers=dict(headers, **{"If-None-Match": etag}))
+        event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        self.assertEqual(resultado.status_code, 304)
+        self.assertEqual(b'', resultado.get_data())
+        self.assertEqual(etag, resultado.headers['ETag'])
+        self.assertTrue(all("version_tabla" in consulta for consulta in consultas))
+
+        #Cada ruta y cada seleccion de campos tiene su propio ETag
+        resultado = self.client.get(f"/rutina/{rutina.id}", headers=dict(headers, **{"If-None-Match": etag}))
+        self.assertEqual(resultado.status_code, 200)
+        etag_rutina = resultado.headers['ETag']
+        resultado = self.client.get("/rutinas", query_string={"fields": "id,nombre"}, headers=dict(headers, **{"If-None-Match": etag}))
+        self.assertEqual(resultado.status_code, 200)
+        etag_campos = resultado.headers['ETag']
+
+        #Asociar un ejercicio cambia la version de las rutinas, pero no la de los campos propios de la rutina
+        self.client.put(f"/rutina/{rutina.id}/ejercicio/{ejercicio.id}", headers=headers)
+        resultado = self.client.get("/rutinas", headers=dict(headers, **{"If-None-Match": etag}))
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(str(ejercicio.id), json.loads(resultado.get_data())[0]['ejercicios'][0]['id'])
+        resultado = self.client.get(f"/rutina/{rutina.id}", headers=dict(headers, **{"If-None-Match": etag_rutina}))
+        self.assertEqual(resultado.status_code, 200)
+        resultado = self.client.get("/rutinas", query_string={"fields": "id,nombre"}, headers=dict(headers, **{"If-None-Match": etag_campos}))
+        self.assertEqual(resultado.status_code, 304)
+
+        #Editar un ejercicio cambia la version de /ejercicios
+        resultado = self.client.get("/ejercicios", headers=headers)
+        etag_ejercicios = resultado.headers['ETag']
+        ejercicio.calorias = 5
+        db.session.commit()
+        resultado = self.client.get("/ejercicios", headers=dict(headers, **{"If-None-Match": etag_ejercicios}))
+        self.assertEqual(resultado.status_code, 200)
+
+        #Los catalogos incluyen los ids de los entrenamientos, asi que un entrenamiento nuevo cambia su ETag,
+        #salvo en las selecciones de campos que no los incluyen
+        etag_ejercicios = resultado.headers['ETag']
+        resultado = self.client.get("/rutinas", headers=headers)
+        etag = resultado.headers['ETag']
+        self.assertEqual([], json.loads(resultado.get_data())[0]['entrenamientos'])
+        resultado = self.client.get("/rutinas", query_string={"fields": "id,nombre"}, headers=headers)
+        etag_campos = resultado.headers['ETag']
+        entrenamiento = Entrenamiento(repeticiones=5, ejercicio=ejercicio.id, rutina=rutina.id)
+        db.session.add(entrenamiento)
+        db.session.commit()
+        resultado = self.client.get("/ejercicios", headers=dict(headers, **{"If-None-Match": etag_ejercicios}))
+        self.assertEqual(resultado.status_code, 200)
+        self.assertIn(entrenamiento.id, json.loads(resultado.get_data())[0]['entrenamientos'])
+        resultado = self.client.get("/rutinas", headers=dict(headers, **{"If-None-Match": etag}))
+        self.assertEqual(resultado.status_code, 200)
+        rutina_listada = json.loads(resultado.get_data())[0]
+        self.assertEqual([entrenamiento.id], rutina_listada['entrenamientos'])
+        self.assertEqual([entrenamiento.id], rutina_listada['ejercicios'][0]['entrenamientos'])
+        resultado = self.client.get("/rutinas", query_string={"fields": "id,nombre"}, headers=dict(headers, **{"If-None-Match": etag_campos}))
+        self.assertEqual(resultado.status_code, 304)
+        resultado = self.client.get(f"/rutina/{rutina.id}", query_string={"fields": "entrenamientos"}, headers=headers)
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual({'entrenamientos': [entrenamiento.id]}, json.loads(resultado.get_data()))
+        db.session.delete(entrenamiento)
+        db.session.commit()
+
     def test_consultar_rutinas_diferentes(self):
         #Crear los datos del ejercicio
         nombre_nueva_rutina = self.data_factory.first_name()
@@ -443,6 +549,32 @@ class TestRutinaEndPoint(unittest.TestCase):
         datos_respuesta_rutina_ejercicios = json.loads(resultado_consulta_rutina.get_data())
         self.assertEqual(len(ejercicio2), len(datos_respuesta_rutina_ejercicios) )
 
+    def test_consultar_rutinas_diferentes_por_id(self):
+        rutina = Rutina(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence())
+        nombres = ["Sentadilla profunda", "Sentadilla", "Plancha", "Plancha lateral", "Remo"]
+        ejercicios = [Ejercicio(nombre=nombre, descripcion="", video="", calorias=1) for nombre in nombres]
+        rutina.ejercicios.append(ejercicios[0])
+        rutina.ejercicios.append(ejercicios[3])
+        db.session.add(rutina)
+        db.session.add_all(ejercicios)
+        db.session.commit()
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+        endpoint = "/rutina/{}/diferente".format(rutina.id)
+
+        # Un nombre contenido en el de otro ejercicio de la rutina no oculta al ejercicio
+        resultado = self.client.get(endpoint, headers=headers)
+        self.assertEqual(["Sentadilla", "Plancha", "Remo"], [ejercicio["nombre"] for ejercicio in json.loads(resultado.get_data())])
+
+        resultado = self.client.get(endpoint, query_string={"limit": 2}, headers=headers)
+        self.assertEqual(["Sentadilla", "Plancha"], [ejercicio["nombre"] for ejercicio in json.loads(resultado.get_data())])
+        resultado = self.client.get(endpoint, query_string={"limit": 2, "cursor": resultado.headers["X-Siguiente-Cursor"]},
+                                    headers=headers)
+        self.assertEqual(["Remo"], [ejercicio["nombre"] for ejercicio in json.loads(resultado.get_data())])
+
+        resultado = self.client.get(endpoint, query_string={"nombre": "plancha", "fields": "id"}, headers=headers)
+        self.assertEqual([{"id": str(ejercicios[2].id)}], json.loads(resultado.get_data()))
+        self.assertEqual(404, self.client.get("/rutina/0/diferente", headers=headers).status_code)
+
 
     def test_consulta_rutina_con_3_ejercicios(self):
         #Crear los datos de la rutina 
@@ -530,6 +662,44 @@ class TestRutinaEndPoint(unittest.TestCase):
         #Verificar que rutina3 tiene 3 ejercicios o mas (pertenece a la respuesta)
         self.assertIn('3', id_rutinasEntrenamiento)
 
+    def test_total_ejercicios_rutina(self):
+        rutina = Rutina(nombre=self.data_factory.sentence(), descripcion=self.data_factory.sentence())
+        ejercicios = [Ejercicio(nombre=self.data_factory.sentence(), descripcion="", video="", calorias=1)
+                      for i in range(0, 4)]
+        rutina.ejercicios.extend(ejercicios[:2])
+        db.session.add(rutina)
+        db.session.add_all(ejercicios)
+        db.session.commit()
+        self.assertEqual(2, db.session.query(Rutina.total_ejercicios).filter(Rutina.id == rutina.id).scalar())
+
+        # Asociar por la vista y desde el lado del ejercicio tambien actualiza el contador
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+        self.client.put("/rutina/{}/ejercicio/{}".format(rutina.id, ejercicios[2].id), headers=headers)
+        ejercicios[3].rutinas.append(rutina)
+        db.session.commit()
+        self.assertEqual(4, db.session.query(Rutina.total_ejercicios).filter(Rutina.id == rutina.id).scalar())
+
+        consultas = []
+        def contar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar)
+        try:
+            resultado = self.client.get("/rutinasEntrenamiento", headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', contar)
+        self.assertEqual([str(rutina.id)], [datos['id'] for datos in json.loads(resultado.get_data())])
+        # Una consulta para las rutinas y una por cada relacion serializada, sin importar cuantas rutinas haya
+        self.assertEqual(1, len([consulta for consulta in consultas if 'total_ejercicios >=' in consulta]))
+        self.assertEqual(5, len(consultas))
+
+        # Retirar o borrar ejercicios descuenta del contador
+        rutina.ejercicios.remove(ejercicios[0])
+        db.session.delete(ejercicios[1])
+        db.session.commit()
+        self.assertEqual(2, db.session.query(Rutina.total_ejercicios).filter(Rutina.id == rutina.id).scalar())
+        resultado = self.client.get("/rutinasEntrenamiento", headers=headers)
+        self.assertEqual([], json.loads(resultado.get_data()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import json
+from unittest import TestCase
+from faker import Faker
+from faker.generator import random
+from modelos import db, Ejercicio, EjercicioSchema, Persona, PersonaSchema, Entrenamiento, EntrenamientoSchema, \
+    Rutina, RutinaSchema
+from datetime import date, time, timedelta
+from sqlalchemy import event
+from app import app
+from vistas.utilidad_serializacion import SerializadorRapido
+
+
+class TestSerializacion(TestCase):
+
+    def setUp(self):
+        self.data_factory = Faker()
+        # Ejercicios con valores nulos, rutinas que comparten ejercicios y entrenamientos con y sin rutina
+        self.ejercicios = [Ejercicio(nombre=self.data_factory.sentence(),
+                                     descripcion=None if i % 3 == 0 else self.data_factory.sentence(),
+                                     video=self.data_factory.image_url(),
+                                     calorias=None if i % 4 == 0 else round(random.uniform(0.1, 0.99), 2))
+                           for i in range(0, 6)]
+        self.rutinas = [Rutina(nombre=self.data_factory.first_name(), descripcion=self.data_factory.sentence())
+                        for i in range(0, 3)]
+        for indice, rutina in enumerate(self.rutinas):
+            rutina.ejercicios.extend(reversed(self.ejercicios[indice:indice + 3]))
+        self.personas = [Persona(nombre=self.data_factory.first_name(), apellido=self.data_factory.last_name(),
+                                 talla=None if i == 0 else 1.72, peso=70.5, entrenando=i % 2 == 0,
+                                 ingreso=date(2023, 1, 1) + timedelta(days=i), entrenador=1)
+                         for i in range(0, 3)]
+        db.session.add_all(self.ejercicios + self.rutinas + self.personas)
+        db.session.flush()
+        # Se conservan las referencias: el rollback de tearDown solo retira de la sesion los objetos nuevos que
+        # siguen vivos, y una copia recargada de un entrenamiento ya recolectado quedaria en el mapa de identidad
+        self.entrenamientos = [Entrenamiento(fecha=date(2023, 1, 1) + timedelta(days=i % 4), tiempo=time(0, i, 30),
+                                             repeticiones=[3, 2.5, None][i % 3], ejercicio=self.ejercicios[i % 6].id,
+                                             persona=self.personas[i % 3].id,
+                                             rutina=self.rutinas[i % 3].id if i % 2 else None)
+                               for i in range(0, 20)]
+        db.session.add_all(self.entrenamientos)
+        db.session.flush()
+        db.session.expire_all()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_json_identico_a_los_esquemas(self):
+        for modelo, schema in ((Ejercicio, EjercicioSchema()), (Persona, PersonaSchema()),
+                               (Entrenamiento, EntrenamientoSchema()), (Rutina, RutinaSchema())):
+            objetos = modelo.query.order_by(modelo.id).all()
+            self.assertEqual(json.dumps([schema.dump(objeto) for objeto in objetos]),
+                             json.dumps(SerializadorRapido(schema).serializar_lista(objetos)))
+
+    def test_relaciones_en_bloque(self):
+        # Las relaciones se consultan una vez por lista y no una vez por objeto
+        serializador = SerializadorRapido(RutinaSchema())
+        rutinas = Rutina.query.all()
+        consultas = []
+        def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', contar_consulta)
+        serializador.serializar_lista(rutinas)
+        event.remove(db.engine, 'before_cursor_execute', contar_consulta)
+        # entrenamientos y ejercicios de la rutina, y entrenamientos y rutinas de los ejercicios anidados
+        self.assertEqual(4, len(consultas))
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .utilidad_resumen import PERSONAS_MODIFICADAS
+
+
+class CacheReportes:
+    # Cache LRU en memoria con los reportes serializados de cada persona
+    def __init__(self, tamano_maximo=256, ttl=300, reloj=time.monotonic):
+        self.tamano_maximo = tamano_maximo
+        self.ttl = ttl
+        self.reloj = reloj
+        self.entradas = OrderedDict()
+        self.bloqueo = Lock()
+        # Generacion de la ultima invalidacion de cada persona, para no guardar reportes calculados antes de ella.
+        # Solo se recuerdan las mas recientes; las olvidadas cuentan como invalidadas en generacion_olvidada
+        self.generacion = 0
+        self.generaciones = OrderedDict()
+        self.generacion_olvidada = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+        self.descartes = 0
+
+    def configurar(self, tamano_maximo, ttl):
+        with self.bloqueo:
+            self.tamano_maximo = tamano_maximo
+            self.ttl = ttl
+            self.entradas.clear()
+
+    def obtener(self, id_persona, recurso):
+        # Retorna el reporte guardado (o None) y la generacion que se entrega a guardar con el reporte calculado
+        with self.bloqueo:
+            reportes = self.entradas.get(id_persona)
+            if reportes is not None and recurso in reportes:
+                expiracion, valor = reportes[recurso]
+                if expiracion > self.reloj():
+                    self.entradas.move_to_end(id_persona)
+                    self.aciertos += 1
+                    return valor, self.generacion
+                del reportes[recurso]
+            self.fallos += 1
+            return None, self.generacion
+
+    def guardar(self, id_persona, recurso, valor, generacion):
+        # Un reporte calculado antes de invalidar la persona ya esta desactualizado y no se guarda
+        if self.tamano_maximo <= 0:
+            return
+        with self.bloqueo:
+            if generacion < max(self.generacion_olvidada, self.generaciones.get(id_persona, 0)):
+                self.descartes += 1
+                return
+            reportes = self.entradas.setdefault(id_persona, {})
+            reportes[recurso] = (self.reloj() + self.ttl, valor)
+            self.entradas.move_to_end(id_persona)
+            while len(self.entradas) > self.tamano_maximo:
+                self.entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar_persona(self, id_persona):
+        with self.bloqueo:
+            self.generacion += 1
+            self.generaciones[id_persona] = self.generacion
+            self.generaciones.move_to_end(id_persona)
+            while len(self.generaciones) > max(self.tamano_maximo, 1):
+                self.generacion_olvidada = self.generaciones.popitem(last=False)[1]
+            if self.entradas.pop(id_persona, None) is not None:
+                self.invalidaciones += 1
+
+    def dar_estadisticas(self):
+        with self.bloqueo:
+            return dict(tamano_maximo=self.tamano_maximo, ttl=self.ttl, personas=len(self.entradas),
+                        aciertos=self.aciertos, fallos=self.fallos, desalojos=self.desalojos,
+                        invalidaciones=self.invalidaciones, descartes=self.descartes)
+
+
+cache_reportes = CacheReportes()
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidar_reportes(session):
+    for id_persona in session.info.pop(PERSONAS_MODIFICADAS, ()):
+        cache_reportes.invalidar_persona(id_persona)
+
+
+@event.listens_for(Session, 'after_rollback')
+def descartar_invalidaciones(session):
+    session.info.pop(PERSONAS_MODIFICADAS, None)
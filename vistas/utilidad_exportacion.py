@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from decimal import Decimal
+from io import StringIO
+from itertools import islice
+from threading import Lock
+import csv
+import json
+import os
+
+from modelos import \
+    db, \
+    Ejercicio, \
+    Entrenamiento, \
+    Exportacion, \
+    Persona, \
+    Rutina, \
+    rutinas_ejercicios
+
+
+PENDIENTE = 'PENDIENTE'
+EN_PROCESO = 'EN_PROCESO'
+TERMINADA = 'TERMINADA'
+FALLIDA = 'FALLIDA'
+
+FORMATOS = ('csv', 'ndjson')
+
+COLUMNAS_ENTRENAMIENTO = ('id', 'persona', 'fecha', 'tiempo', 'repeticiones', 'rutina',
+                          'ejercicio', 'ejercicio_nombre', 'ejercicio_calorias')
+
+# Tablas de la exportacion completa, en orden de dependencias
+TABLAS_EXPORTACION = OrderedDict([
+    ('persona', Persona.__table__),
+    ('ejercicio', Ejercicio.__table__),
+    ('rutina', Rutina.__table__),
+    ('rutina_ejercicio', rutinas_ejercicios),
+    ('entrenamiento', Entrenamiento.__table__),
+])
+
+
+class ColaLlena(Exception):
+    pass
+
+
+class GestorExportaciones:
+    # Ejecuta las exportaciones en un pool de hilos acotado, con un limite de trabajos en espera
+    def __init__(self, hilos=2, cola=20, directorio='exportaciones'):
+        self.hilos = hilos
+        self.cola = cola
+        self.directorio = directorio
+        self.ejecutor = None
+        self.en_curso = 0
+        self.bloqueo = Lock()
+
+    def configurar(self, hilos, cola, directorio):
+        with self.bloqueo:
+            if self.ejecutor is not None:
+                self.ejecutor.shutdown(wait=False)
+                self.ejecutor = None
+            self.hilos = hilos
+            self.cola = cola
+            self.directorio = directorio
+
+    def reiniciar(self):
+        # Despues de un fork el hijo no tiene los hilos del padre y el bloqueo pudo quedar tomado
+        self.bloqueo = Lock()
+        self.ejecutor = None
+        self.en_curso = 0
+
+    def encolar(self, app, id_exportacion):
+        with self.bloqueo:
+            if self.en_curso >= self.hilos + self.cola:
+                raise ColaLlena()
+            if self.ejecutor is None:
+                self.ejecutor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='exportacion')
+            self.en_curso += 1
+            futuro = self.ejecutor.submit(self.ejecutar, app, id_exportacion)
+        futuro.add_done_callback(self.terminar)
+        return futuro
+
+    def terminar(self, futuro):
+        with self.bloqueo:
+            self.en_curso -= 1
+
+    def ejecutar(self, app, id_exportacion):
+        with app.app_context():
+            parcial = None
+            try:
+                exportacion = Exportacion.query.get(id_exportacion)
+                exportacion.estado = EN_PROCESO
+                db.session.commit()
+                os.makedirs(self.directorio, exist_ok=True)
+                ruta = self.dar_ruta(exportacion)
+                # Se escribe en un archivo temporal para no exponer exportaciones a medias
+                parcial = ruta + '.parcial'
+                with open(parcial, 'w', newline='', encoding='utf-8') as archivo:
+                    filas = escribir(archivo, exportacion.formato,
+                                     self.consultar_entrenamientos(exportacion.persona, exportacion.entrenador))
+                os.replace(parcial, ruta)
+                exportacion.estado = TERMINADA
+                exportacion.archivo = ruta
+                exportacion.filas = filas
+            except Exception as error:
+                db.session.rollback()
+                if parcial is not None and os.path.exists(parcial):
+                    os.remove(parcial)
+                exportacion = Exportacion.query.get(id_exportacion)
+                if exportacion is None:
+                    return
+                exportacion.estado = FALLIDA
+                exportacion.error = str(error)[:512]
+            exportacion.terminada = datetime.now()
+            db.session.commit()
+
+    def dar_ruta(self, exportacion):
+        return os.path.abspath(os.path.join(self.directorio, 'exportacion_{}.{}'.format(
+            exportacion.id, exportacion.formato)))
+
+    def marcar_interrumpidas(self):
+        # Los trabajos PENDIENTE o EN_PROCESO de una ejecucion anterior ya no tienen un hilo que los termine.
+        # Se llama una vez al iniciar, antes de atender solicitudes: con varios trabajadores no se distingue
+        # un trabajo de otro proceso de uno interrumpido
+        interrumpidas = Exportacion.query.filter(Exportacion.estado.in_([PENDIENTE, EN_PROCESO])).all()
+        for exportacion in interrumpidas:
+            parcial = self.dar_ruta(exportacion) + '.parcial'
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            exportacion.estado = FALLIDA
+            exportacion.error = 'Interrumpida al reiniciar el servidor'
+            exportacion.terminada = datetime.now()
+        db.session.commit()
+        return len(interrumpidas)
+
+    def consultar_entrenamientos(self, id_persona=None, id_entrenador=None, tamano_lote=1000):
+        consulta = db.session.query(Entrenamiento.id, Entrenamiento.persona, Entrenamiento.fecha, Entrenamiento.tiempo,
+                                    Entrenamiento.repeticiones, Entrenamiento.rutina, Entrenamiento.ejercicio,
+                                    Ejercicio.nombre, Ejercicio.calorias) \
+            .outerjoin(Ejercicio, Entrenamiento.ejercicio == Ejercicio.id)
+        if id_persona is not None:
+            consulta = consulta.filter(Entrenamiento.persona == id_persona)
+        else:
+            consulta = consulta.join(Persona, Persona.id == Entrenamiento.persona) \
+                .filter(Persona.entrenador == id_entrenador)
+        return consulta.order_by(Entrenamiento.persona, Entrenamiento.fecha, Entrenamiento.id) \
+            .execution_options(stream_results=True).yield_per(tamano_lote)
+
+
+class ExportadorDatos:
+    # Recorre tablas completas con cursores del servidor y produce el contenido por bloques de filas
+    def __init__(self, formato, tablas=None, tamano_lote=1000):
+        self.formato = formato
+        self.tablas = list(tablas or TABLAS_EXPORTACION)
+        self.tamano_lote = tamano_lote
+        self.filas = 0
+
+    def consultar_tabla(self, tabla):
+        return db.session.query(*tabla.c).order_by(*tabla.primary_key.columns) \
+            .execution_options(stream_results=True).yield_per(self.tamano_lote)
+
+    def generar(self):
+        # Con varias tablas en NDJSON cada linea indica su tabla; en CSV cada tabla lleva su encabezado
+        for nombre in self.tablas:
+            tabla = TABLAS_EXPORTACION[nombre]
+            columnas = tuple(columna.name for columna in tabla.c)
+            filas = iter(self.consultar_tabla(tabla))
+            if self.formato == 'ndjson' and len(self.tablas) > 1:
+                columnas = ('tabla',) + columnas
+                filas = ((nombre,) + tuple(fila) for fila in filas)
+            encabezado = True
+            while True:
+                bloque = list(islice(filas, self.tamano_lote))
+                if not bloque and not encabezado:
+                    break
+                contenido = StringIO()
+                self.filas += escribir(contenido, self.formato, bloque, columnas, encabezado)
+                encabezado = False
+                yield contenido.getvalue()
+                if len(bloque) < self.tamano_lote:
+                    break
+
+
+def escribir(archivo, formato, filas, columnas=COLUMNAS_ENTRENAMIENTO, encabezado=True):
+    total = 0
+    if formato == 'csv':
+        escritor = csv.writer(archivo)
+        if encabezado:
+            escritor.writerow(columnas)
+        for fila in filas:
+            escritor.writerow(['' if valor is None else dar_valor(valor) for valor in fila])
+            total += 1
+    else:
+        for fila in filas:
+            archivo.write(json.dumps(dict(zip(columnas, (dar_valor(valor) for valor in fila)))) + '\n')
+            total += 1
+    return total
+
+
+def dar_valor(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    return valor
+
+
+gestor_exportaciones = GestorExportaciones()
@@ -0,0 +1,181 @@
+from datetime import datetime
+import hashlib
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+from modelos import \
+    db, \
+    Ejercicio, \
+    Entrenamiento, \
+    Persona, \
+    Usuario
+
+from .utilidad_resumen import UtilidadResumen, PERSONAS_MODIFICADAS
+from .utilidad_versiones import incrementar_versiones
+
+
+RECURSOS = ('ejercicios', 'personas', 'entrenamientos')
+
+
+class LineaInvalida(ValueError):
+    pass
+
+
+def dar_campo(datos, nombre):
+    if nombre not in datos:
+        raise LineaInvalida('Falta el campo {}'.format(nombre))
+    return datos[nombre]
+
+
+def validar_ejercicio(datos, parametros):
+    # Mismas reglas de VistaEjercicios.post
+    return dict(nombre=dar_campo(datos, 'nombre'),
+                descripcion=dar_campo(datos, 'descripcion'),
+                video=dar_campo(datos, 'video'),
+                calorias=float(dar_campo(datos, 'calorias')))
+
+
+def validar_persona(datos, parametros):
+    # Mismas reglas de VistaPersonas.post; el entrenador llega como parametro, igual que en la ruta
+    persona = dict(nombre=dar_campo(datos, 'nombre'),
+                   apellido=dar_campo(datos, 'apellido'),
+                   talla=float(dar_campo(datos, 'talla')),
+                   peso=float(dar_campo(datos, 'peso')),
+                   edad=float(dar_campo(datos, 'edad')),
+                   ingreso=datetime.strptime(dar_campo(datos, 'ingreso'), '%Y-%m-%d').date(),
+                   brazo=float(dar_campo(datos, 'brazo')),
+                   pecho=float(dar_campo(datos, 'pecho')),
+                   cintura=float(dar_campo(datos, 'cintura')),
+                   pierna=float(dar_campo(datos, 'pierna')),
+                   entrenando=bool(dar_campo(datos, 'entrenando')),
+                   razon=dar_campo(datos, 'razon'),
+                   terminado=datetime.strptime(dar_campo(datos, 'terminado'), '%Y-%m-%d').date(),
+                   entrenador=parametros['entrenador'])
+    usuario = None
+    if 'contrasena' in datos:
+        usuario = dict(usuario=dar_campo(datos, 'usuario'), rol='CLI',
+                       contrasena=hashlib.md5(datos['contrasena'].encode('utf-8')).hexdigest())
+    return persona, usuario
+
+
+def validar_entrenamiento(datos, parametros):
+    # Mismas reglas de VistaEntrenamientos.post; la persona va en cada linea
+    return dict(tiempo=datetime.strptime(dar_campo(datos, 'tiempo'), '%H:%M:%S').time(),
+                repeticiones=float(dar_campo(datos, 'repeticiones')),
+                fecha=datetime.strptime(dar_campo(datos, 'fecha'), '%Y-%m-%d').date(),
+                ejercicio=dar_campo(datos, 'ejercicio'),
+                persona=int(dar_campo(datos, 'persona')))
+
+
+class ImportadorNDJSON:
+    # Importa un cuerpo NDJSON linea a linea, escribiendo por lotes con executemany y un commit por lote.
+    # Las lineas invalidas, o que violan una restriccion de la base de datos, se reportan sin detener la importacion
+    def __init__(self, recurso, parametros=None, tamano_lote=500, errores_maximos=1000, linea_maxima=65536):
+        self.recurso = recurso
+        self.parametros = parametros or {}
+        self.tamano_lote = tamano_lote
+        self.errores_maximos = errores_maximos
+        self.linea_maxima = linea_maxima
+        self.validar = dict(ejercicios=validar_ejercicio, personas=validar_persona,
+                            entrenamientos=validar_entrenamiento)[recurso]
+        self.lineas = 0
+        self.insertados = 0
+        self.total_errores = 0
+        self.errores = []
+
+    def importar(self, flujo):
+        lote = []
+        for numero, linea in enumerate(self.leer_lineas(flujo), start=1):
+            self.lineas = numero
+            if linea is None:
+                self.registrar_error(numero, 'La linea supera {} bytes'.format(self.linea_maxima))
+                continue
+            if not linea.strip():
+                continue
+            try:
+                datos = json.loads(linea)
+                if not isinstance(datos, dict):
+                    raise LineaInvalida('La linea no es un objeto JSON')
+                lote.append((numero, self.validar(datos, self.parametros)))
+            except (LineaInvalida, KeyError, TypeError, ValueError, AttributeError) as error:
+                self.registrar_error(numero, str(error))
+            if len(lote) >= self.tamano_lote:
+                self.escribir_lote(lote)
+                lote = []
+        if lote:
+            self.escribir_lote(lote)
+        return dict(recurso=self.recurso, lineas=self.lineas, insertados=self.insertados,
+                    total_errores=self.total_errores, errores=self.errores)
+
+    def leer_lineas(self, flujo):
+        # Se lee con un limite por linea para que la memoria no dependa del tamano del cuerpo
+        while True:
+            linea = flujo.readline(self.linea_maxima + 1)
+            if not linea:
+                return
+            if len(linea) > self.linea_maxima and not linea.endswith(b'\n'):
+                while linea and not linea.endswith(b'\n'):
+                    linea = flujo.readline(self.linea_maxima + 1)
+                yield None
+            else:
+                yield linea.decode('utf-8', errors='replace')
+
+    def registrar_error(self, numero, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < self.errores_maximos:
+            self.errores.append(dict(linea=numero, error=mensaje))
+
+    def escribir_lote(self, lote):
+        if self.recurso == 'personas':
+            lote = self.descartar_usuarios_repetidos(lote)
+        try:
+            self.insertar(lote)
+        except IntegrityError:
+            db.session.rollback()
+            # Se reintenta linea por linea para atribuir el error a su linea y conservar el resto del lote
+            for numero, fila in lote:
+                try:
+                    self.insertar([(numero, fila)])
+                except IntegrityError as error:
+                    db.session.rollback()
+                    self.registrar_error(numero, 'Restriccion de la base de datos: {}'.format(error.orig))
+
+    def insertar(self, lote):
+        conexion = db.session.connection()
+        tablas = set()
+        if self.recurso == 'personas':
+            filas = [persona for numero, (persona, usuario) in lote]
+            usuarios = [usuario for numero, (persona, usuario) in lote if usuario is not None]
+            if usuarios:
+                conexion.execute(Usuario.__table__.insert(), usuarios)
+                tablas.add(Usuario.__table__.name)
+            tabla = Persona.__table__
+        else:
+            filas = [fila for numero, fila in lote]
+            tabla = Entrenamiento.__table__ if self.recurso == 'entrenamientos' else Ejercicio.__table__
+        if filas:
+            conexion.execute(tabla.insert(), filas)
+            tablas.add(tabla.name)
+        if filas and self.recurso == 'entrenamientos':
+            # executemany no pasa por el flush: el resumen y la cache de reportes se actualizan aqui
+            claves = {(fila['persona'], fila['fecha']) for fila in filas}
+            UtilidadResumen().recalcular(conexion, claves)
+            db.session.info.setdefault(PERSONAS_MODIFICADAS, set()).update(persona for persona, fecha in claves)
+        incrementar_versiones(conexion, tablas)
+        db.session.commit()
+        self.insertados += len(filas)
+
+    def descartar_usuarios_repetidos(self, lote):
+        # Los usuarios repetidos, en la base de datos o en el mismo lote, invalidan su linea
+        nombres = [usuario['usuario'] for numero, (persona, usuario) in lote if usuario is not None]
+        existentes = {nombre for nombre, in db.session.query(Usuario.usuario).filter(Usuario.usuario.in_(nombres))}
+        validas = []
+        for numero, (persona, usuario) in lote:
+            if usuario is not None:
+                if usuario['usuario'] in existentes:
+                    self.registrar_error(numero, 'El usuario ya existe')
+                    continue
+                existentes.add(usuario['usuario'])
+            validas.append((numero, (persona, usuario)))
+        return validas
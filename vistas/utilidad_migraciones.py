@@ -0,0 +1,157 @@
+from sqlalchemy import select
+
+from modelos import \
+    db, \
+    Entrenamiento, \
+    Persona, \
+    Rutina, \
+    Usuario, \
+    normalizar_nombre, \
+    rutinas_ejercicios
+
+from .utilidad_resumen import UtilidadResumen
+from .utilidad_rutinas import recalcular_total_ejercicios
+
+
+entrenamiento_tabla = Entrenamiento.__table__
+persona_tabla = Persona.__table__
+rutina_tabla = Rutina.__table__
+usuario_tabla = Usuario.__table__
+
+
+def dar_version(conexion):
+    return conexion.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def agregar_columna(conexion, tabla, columna, definicion):
+    columnas = {fila[1] for fila in conexion.exec_driver_sql('PRAGMA table_info({})'.format(tabla))}
+    if columna not in columnas:
+        conexion.exec_driver_sql('ALTER TABLE {} ADD COLUMN {} {}'.format(tabla, columna, definicion))
+
+
+def crear_indices(conexion, nombres):
+    # Crea los indices declarados en los modelos con los nombres dados que aun no existen en la base de datos.
+    # Se buscan por nombre en sqlite_master porque la reflexion omite los indices sobre expresiones
+    existentes = {nombre for nombre, in conexion.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    indices = {indice.name: indice for tabla in db.metadata.sorted_tables for indice in tabla.indexes}
+    for nombre in nombres:
+        if nombre not in existentes:
+            indices[nombre].create(conexion)
+
+
+def renombrar_rutinas_repetidas(conexion):
+    # Las rutinas cuyo nombre normalizado se repite impedirian crear el indice unico: se conserva la primera
+    # y a las demas se les agrega un sufijo. Retorna los avisos de los cambios
+    filas = conexion.execute(select(rutina_tabla.c.id, rutina_tabla.c.nombre).order_by(rutina_tabla.c.id)).all()
+    ocupados = {normalizar_nombre(nombre) for id_rutina, nombre in filas if nombre is not None}
+    vistos = set()
+    avisos = []
+    for id_rutina, nombre in filas:
+        if nombre is None:
+            continue
+        if normalizar_nombre(nombre) not in vistos:
+            vistos.add(normalizar_nombre(nombre))
+            continue
+        numero = 2
+        while normalizar_nombre('{} ({})'.format(nombre, numero)) in ocupados:
+            numero += 1
+        nuevo = '{} ({})'.format(nombre, numero)
+        ocupados.add(normalizar_nombre(nuevo))
+        vistos.add(normalizar_nombre(nuevo))
+        conexion.execute(rutina_tabla.update().where(rutina_tabla.c.id == id_rutina).values(nombre=nuevo))
+        avisos.append('Rutina {}: nombre repetido "{}" renombrado a "{}"'.format(id_rutina, nombre, nuevo))
+    return avisos
+
+
+def migrar_indices(conexion):
+    crear_indices(conexion, ['ix_entrenamiento_ejercicio', 'ix_entrenamiento_persona_fecha_rutina',
+                             'ix_entrenamiento_persona_sin_rutina', 'ix_entrenamiento_rutina',
+                             'ix_persona_entrenador', 'ix_persona_usuario', 'ix_rutina_ejercicio_ejercicio',
+                             'ix_rutina_total_ejercicios', 'ix_usuario_rol', 'ix_usuario_usuario'])
+
+
+def migrar_nombre_normalizado(conexion):
+    # Reemplaza el indice unico sobre lower(nombre), que solo ignoraba mayusculas en letras ASCII
+    agregar_columna(conexion, rutina_tabla.name, 'nombre_normalizado', 'VARCHAR(128)')
+    conexion.exec_driver_sql('DROP INDEX IF EXISTS ix_rutina_nombre_minusculas')
+    avisos = renombrar_rutinas_repetidas(conexion)
+    for id_rutina, nombre in conexion.execute(select(rutina_tabla.c.id, rutina_tabla.c.nombre)).all():
+        conexion.execute(rutina_tabla.update().where(rutina_tabla.c.id == id_rutina)
+                         .values(nombre_normalizado=normalizar_nombre(nombre)))
+    crear_indices(conexion, ['ix_rutina_nombre_normalizado'])
+    return avisos
+
+
+def migrar_total_ejercicios(conexion):
+    agregar_columna(conexion, rutina_tabla.name, 'total_ejercicios', 'INTEGER NOT NULL DEFAULT 0')
+    recalcular_total_ejercicios(conexion)
+
+
+def migrar_resumen(conexion):
+    # Las bases de datos anteriores al resumen tienen la tabla vacia: los reportes la leen por defecto
+    UtilidadResumen().reconstruir_tabla(conexion)
+
+
+# Migraciones en orden; la version aplicada se guarda en PRAGMA user_version. Cada paso es idempotente,
+# asi que una migracion interrumpida se vuelve a ejecutar completa. Las bases de datos nuevas las aplican
+# sin cambios porque create_all ya creo las columnas y los indices
+MIGRACIONES = [
+    (1, 'Contador total_ejercicios en rutina', migrar_total_ejercicios),
+    (2, 'Indices de las consultas frecuentes', migrar_indices),
+    (3, 'Resumen de entrenamientos', migrar_resumen),
+    (4, 'Nombre normalizado de rutina', migrar_nombre_normalizado),
+]
+
+
+def migrar(motor):
+    # Retorna las migraciones aplicadas con los avisos de cada una (por ejemplo, datos que se corrigieron)
+    aplicadas = []
+    for numero, descripcion, migracion in MIGRACIONES:
+        with motor.begin() as conexion:
+            if dar_version(conexion) >= numero:
+                continue
+            avisos = migracion(conexion) or []
+            conexion.exec_driver_sql('PRAGMA user_version = {:d}'.format(numero))
+        aplicadas.append((numero, descripcion, avisos))
+    return aplicadas
+
+
+# Consultas de los caminos frecuentes y el indice que cada una debe usar
+CONSULTAS_FRECUENTES = [
+    ('entrenamientos sin rutina de una persona', 'ix_entrenamiento_persona_sin_rutina',
+     select(entrenamiento_tabla.c.id).where(entrenamiento_tabla.c.persona == 1, entrenamiento_tabla.c.rutina.is_(None))
+     .order_by(entrenamiento_tabla.c.fecha, entrenamiento_tabla.c.id)),
+    ('sesiones de rutina de una persona', 'ix_entrenamiento_persona_fecha_rutina',
+     select(entrenamiento_tabla.c.fecha, entrenamiento_tabla.c.rutina)
+     .where(entrenamiento_tabla.c.persona == 1, entrenamiento_tabla.c.rutina.isnot(None))
+     .group_by(entrenamiento_tabla.c.fecha, entrenamiento_tabla.c.rutina)),
+    ('entrenamientos de las rutinas', 'ix_entrenamiento_rutina',
+     select(entrenamiento_tabla.c.id).where(entrenamiento_tabla.c.rutina.in_([1, 2]))),
+    ('entrenamientos de los ejercicios', 'ix_entrenamiento_ejercicio',
+     select(entrenamiento_tabla.c.id).where(entrenamiento_tabla.c.ejercicio.in_([1, 2]))),
+    ('rutinas de los ejercicios', 'ix_rutina_ejercicio_ejercicio',
+     select(rutinas_ejercicios.c.rutina_id).where(rutinas_ejercicios.c.ejercicio_id.in_([1, 2]))),
+    ('clientes de un entrenador', 'ix_persona_entrenador',
+     select(persona_tabla.c.id).where(persona_tabla.c.entrenador == 1)),
+    ('persona de un usuario', 'ix_persona_usuario',
+     select(persona_tabla.c.id).where(persona_tabla.c.usuario == 1)),
+    ('inicio de sesion', 'ix_usuario_usuario',
+     select(usuario_tabla.c.id).where(usuario_tabla.c.usuario == 'usuario')),
+    ('entrenadores', 'ix_usuario_rol',
+     select(persona_tabla.c.id).select_from(persona_tabla.join(usuario_tabla, persona_tabla.c.usuario == usuario_tabla.c.id))
+     .where(usuario_tabla.c.rol == 'ENT')),
+    ('nombre de rutina repetido', 'ix_rutina_nombre_normalizado',
+     select(rutina_tabla.c.id).where(rutina_tabla.c.nombre_normalizado == 'nombre')),
+    ('rutinas para entrenar', 'ix_rutina_total_ejercicios',
+     select(rutina_tabla.c.id).where(rutina_tabla.c.total_ejercicios >= 3)),
+]
+
+
+def verificar_planes(conexion):
+    # Retorna (consulta, indice esperado, plan, usa el indice) con EXPLAIN QUERY PLAN de cada consulta frecuente
+    resultados = []
+    for nombre, indice, consulta in CONSULTAS_FRECUENTES:
+        compilada = consulta.compile(dialect=conexion.dialect, compile_kwargs={'literal_binds': True})
+        plan = ' | '.join(fila[-1] for fila in conexion.exec_driver_sql('EXPLAIN QUERY PLAN {}'.format(compilada)))
+        resultados.append((nombre, indice, plan, 'INDEX {}'.format(indice) in plan))
+    return resultados
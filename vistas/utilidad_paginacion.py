@@ -0,0 +1,89 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+import binascii
+import json
+
+from flask import current_app
+from sqlalchemy import or_
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(valores):
+    # El cursor es opaco para el cliente: una lista JSON en base64 sin relleno
+    contenido = json.dumps(valores, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(contenido).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        contenido = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(contenido.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorInvalido(cursor)
+    if not isinstance(valores, list):
+        raise CursorInvalido(cursor)
+    return valores
+
+
+def leer_fecha(argumentos, nombre):
+    valor = argumentos.get(nombre)
+    if valor is None:
+        return None
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def leer_limite(argumentos, nombre='limit'):
+    valor = argumentos.get(nombre)
+    if valor is None:
+        return None
+    limite = int(valor)
+    if limite <= 0:
+        raise ValueError(valor)
+    return limite
+
+
+def leer_campos(argumentos, nombre='fields'):
+    valor = argumentos.get(nombre)
+    if valor is None:
+        return None
+    campos = [campo.strip() for campo in valor.split(',') if campo.strip()]
+    if not campos:
+        raise ValueError(valor)
+    return campos
+
+
+def leer_nombre(argumentos, nombre='nombre'):
+    valor = argumentos.get(nombre)
+    if valor is None or not valor.strip():
+        return None
+    # Los comodines de LIKE se buscan de forma literal
+    return '%' + valor.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def paginar(consulta, argumentos, columna_id, columnas_nombre=()):
+    # Pagina una consulta por llave (id) con los parametros limit, cursor y nombre.
+    # Retorna los elementos de la pagina y los encabezados con el cursor siguiente
+    limite = leer_limite(argumentos)
+    cursor = argumentos.get('cursor')
+    patron = leer_nombre(argumentos)
+    if patron is not None and columnas_nombre:
+        consulta = consulta.filter(or_(*[columna.ilike(patron, escape='\\') for columna in columnas_nombre]))
+    if cursor is not None:
+        valores = decodificar_cursor(cursor)
+        if len(valores) != 1 or not isinstance(valores[0], int):
+            raise CursorInvalido(cursor)
+        consulta = consulta.filter(columna_id > valores[0])
+    consulta = consulta.order_by(columna_id)
+    if limite is None and cursor is None:
+        return consulta.all(), {}
+    maximo = current_app.config['PAGINACION_LIMITE_MAXIMO']
+    limite = min(limite or maximo, maximo)
+    elementos = consulta.limit(limite + 1).all()
+    encabezados = {}
+    if len(elementos) > limite:
+        elementos = elementos[:limite]
+        encabezados['X-Siguiente-Cursor'] = codificar_cursor([elementos[-1].id])
+    return elementos, encabezados
@@ -1,9 +1,31 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from flask import abort, current_app
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 from modelos import \
     db, \
     Ejercicio, \
-    Entrenamiento
+    Entrenamiento, \
+    Persona, \
+    ResumenEntrenamiento
+from .utilidad_resumen import UtilidadResumen, filtrar_fechas
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MOTOR_RESUMEN = 'resumen'
+MOTOR_PYTHON = 'python'
+MOTOR_NUMPY = 'numpy'
+
+# El motor numpy entrega los valores con la escala de los Numeric que SQLAlchemy lee de SQLite
+ESCALA_RESULTADOS = Decimal('0.0000000001')
+
     
 class UtilidadReporte:
     def calcular_imc(self, talla, peso):
@@ -19,7 +41,7 @@ class UtilidadReporte:
         else:
             return "Obesidad"
             
-    def dar_resultados(self, entrenamientos):
+    def dar_resultados(self, entrenamientos, calorias_ejercicios=None):
         calorias = {}
         repeticiones = {}
         resultados = []
@@ -28,32 +50,183 @@ class UtilidadReporte:
         repeticiones_total = 0
         
         for entrenamiento in entrenamientos:
+            fecha = str(entrenamiento.fecha)
             repeticiones_temp = entrenamiento.repeticiones
-            calorias_temp = self.calcular_calorias(entrenamiento)
+            if calorias_ejercicios is None:
+                calorias_temp = self.calcular_calorias(entrenamiento)
+            else:
+                calorias_temp = self.calcular_calorias(
+                    entrenamiento, calorias_ejercicios[entrenamiento.ejercicio])
             
-            if str(entrenamiento.fecha) in repeticiones:
-                repeticiones[str(entrenamiento.fecha)] = repeticiones [str(entrenamiento.fecha)] + repeticiones_temp
+            if fecha in repeticiones:
+                repeticiones[fecha] = repeticiones[fecha] + repeticiones_temp
             else:
-                repeticiones[str(entrenamiento.fecha)] = repeticiones_temp
+                repeticiones[fecha] = repeticiones_temp
             
-            if str(entrenamiento.fecha) in calorias:
-                calorias[str(entrenamiento.fecha)] = calorias [str(entrenamiento.fecha)] + calorias_temp
+            if fecha in calorias:
+                calorias[fecha] = calorias[fecha] + calorias_temp
             else:
-                calorias[str(entrenamiento.fecha)] =  calorias_temp
+                calorias[fecha] = calorias_temp
                 
             calorias_total = calorias_total + calorias_temp
             repeticiones_total = repeticiones_total + repeticiones_temp
         
         for fecha_resultados in list(repeticiones.keys()):
-            fila = dict(fecha=fecha_resultados, repeticiones=str(repeticiones[str(fecha_resultados)]), calorias=str(calorias[str(fecha_resultados)]))
+            fila = dict(fecha=fecha_resultados, repeticiones=str(repeticiones[fecha_resultados]), calorias=str(calorias[fecha_resultados]))
             resultados.append(fila)
         
         resultados.append(dict(fecha='Total', repeticiones=str(repeticiones_total), calorias=str(calorias_total)))
         return resultados
+
+    def formatear_numero(self, valor):
+        # Texto de los float de numpy con la escala de los Numeric, en lugar de la notacion de float
+        return '{:f}'.format(Decimal(valor).quantize(ESCALA_RESULTADOS))
+
+    def dar_reportes_entrenador(self, id_entrenador, tamano_lote=100):
+        # Consultas fijas sin importar el numero de clientes, con el mismo motor del reporte de cada persona
+        if self.dar_motor() == MOTOR_RESUMEN:
+            return self.dar_reportes_entrenador_resumen(id_entrenador, tamano_lote)
+        return self.dar_reportes_entrenador_entrenamientos(id_entrenador, tamano_lote)
+
+    def dar_reportes_entrenador_resumen(self, id_entrenador, tamano_lote):
+        # Personas, ids de sus entrenamientos y el resumen agrupado
+        personas = Persona.query.filter(Persona.entrenador == id_entrenador) \
+            .options(selectinload(Persona.entrenamientos).load_only(Entrenamiento.id)) \
+            .order_by(Persona.id).yield_per(tamano_lote)
+        utilidad_resumen = UtilidadResumen()
+        filas = iter(utilidad_resumen.dar_resultados_entrenador(id_entrenador))
+        fila = next(filas, None)
+        for persona in personas:
+            filas_persona = []
+            while fila is not None and fila[0] <= persona.id:
+                if fila[0] == persona.id:
+                    filas_persona.append(fila[1:])
+                fila = next(filas, None)
+            yield (persona,) + self.dar_imc_persona(persona) + (utilidad_resumen.formatear_resultados(filas_persona),)
+
+    def dar_reportes_entrenador_entrenamientos(self, id_entrenador, tamano_lote):
+        # Personas con sus entrenamientos y las calorias de todos los ejercicios que usan, para los motores python y numpy
+        personas = Persona.query.filter(Persona.entrenador == id_entrenador) \
+            .options(selectinload(Persona.entrenamientos)).order_by(Persona.id).yield_per(tamano_lote)
+        id_ejercicios = select(Entrenamiento.ejercicio).join(Persona, Entrenamiento.persona == Persona.id) \
+            .where(Persona.entrenador == id_entrenador)
+        calorias_ejercicios = dict(db.session.query(Ejercicio.id, Ejercicio.calorias)
+                                   .filter(Ejercicio.id.in_(id_ejercicios)).all())
+        vectorizado = self.dar_motor() == MOTOR_NUMPY and numpy is not None
+        for persona in personas:
+            entrenamientos = persona.entrenamientos
+            if any(entrenamiento.ejercicio not in calorias_ejercicios for entrenamiento in entrenamientos):
+                abort(404)
+            if vectorizado:
+                resultados = self.calcular_resultados_vectorizado(
+                    [(entrenamiento.fecha, entrenamiento.repeticiones, entrenamiento.tiempo, entrenamiento.ejercicio,
+                      calorias_ejercicios[entrenamiento.ejercicio]) for entrenamiento in entrenamientos])
+            else:
+                resultados = self.dar_resultados(entrenamientos, calorias_ejercicios)
+            yield (persona,) + self.dar_imc_persona(persona) + (resultados,)
+
+    def dar_imc_persona(self, persona):
+        if not persona.talla or persona.peso is None:
+            return None, None
+        imc = self.calcular_imc(persona.talla, persona.peso)
+        return imc, self.dar_clasificacion_imc(imc)
+
+    def dar_motor(self):
+        return current_app.config.get('REPORTE_MOTOR', MOTOR_PYTHON)
+
+    def dar_resultados_persona(self, persona, desde=None, hasta=None):
+        # El motor se elige con REPORTE_MOTOR; sin numpy instalado se usa el de Python en su lugar
+        motor = self.dar_motor()
+        if motor == MOTOR_RESUMEN:
+            return UtilidadResumen().dar_resultados(persona.id, desde, hasta)
+        if motor == MOTOR_NUMPY and numpy is not None:
+            return self.dar_resultados_vectorizado(persona.id, desde, hasta)
+        if desde is None and hasta is None:
+            return self.dar_resultados_lote(persona.entrenamientos)
+        return self.dar_resultados_lote(filtrar_fechas(
+            Entrenamiento.query.filter(Entrenamiento.persona == persona.id), Entrenamiento.fecha, desde, hasta)
+            .order_by(Entrenamiento.id))
+
+    def dar_total_persona(self, persona):
+        # Fila 'Total' de todo el historial, calculada con el mismo motor de los resultados
+        if self.dar_motor() == MOTOR_RESUMEN:
+            return UtilidadResumen().dar_total(persona.id)
+        return self.dar_resultados_persona(persona)[-1]
+
+    def dar_ventana(self, id_persona, desde=None, hasta=None, limite=None, cursor=None):
+        # Traduce limite y cursor en un rango de fechas; las paginas van de las fechas mas recientes a las mas antiguas.
+        # Las fechas salen del resumen o, con los otros motores, de los entrenamientos que esos motores leen
+        if cursor is not None:
+            anterior_a = cursor - timedelta(days=1)
+            hasta = anterior_a if hasta is None else min(hasta, anterior_a)
+        if limite is None:
+            return desde, hasta, None
+        modelo = ResumenEntrenamiento if self.dar_motor() == MOTOR_RESUMEN else Entrenamiento
+        consulta = db.session.query(modelo.fecha).filter(modelo.persona == id_persona)
+        fechas = [fila.fecha for fila in filtrar_fechas(consulta, modelo.fecha, desde, hasta)
+                  .distinct().order_by(modelo.fecha.desc()).limit(limite + 1)]
+        if not fechas:
+            return desde, hasta, None
+        pagina = fechas[:limite]
+        siguiente = pagina[-1] if len(fechas) > limite else None
+        return pagina[-1], pagina[0], siguiente
+
+    def dar_resultados_vectorizado(self, id_persona, desde=None, hasta=None):
+        consulta = db.session.query(Entrenamiento.fecha, Entrenamiento.repeticiones, Entrenamiento.tiempo,
+                                    Ejercicio.id, Ejercicio.calorias) \
+            .outerjoin(Ejercicio, Entrenamiento.ejercicio == Ejercicio.id) \
+            .filter(Entrenamiento.persona == id_persona)
+        return self.calcular_resultados_vectorizado(
+            filtrar_fechas(consulta, Entrenamiento.fecha, desde, hasta).order_by(Entrenamiento.id).all())
+
+    def calcular_resultados_vectorizado(self, filas):
+        # Filas (fecha, repeticiones, tiempo, id del ejercicio, calorias del ejercicio) en el orden de los entrenamientos
+        if not filas:
+            return [dict(fecha='Total', repeticiones=self.formatear_numero(0), calorias=self.formatear_numero(0))]
+        if any(fila[3] is None for fila in filas):
+            abort(404)
+
+        total_filas = len(filas)
+        fechas = numpy.fromiter((fila[0].toordinal() for fila in filas), dtype=numpy.int64, count=total_filas)
+        repeticiones = numpy.fromiter((fila[1] for fila in filas), dtype=numpy.float64, count=total_filas)
+        segundos = numpy.fromiter((fila[2].hour*60*60 + fila[2].minute*60 + fila[2].second for fila in filas),
+                                  dtype=numpy.float64, count=total_filas)
+        calorias_ejercicio = numpy.fromiter((fila[4] for fila in filas), dtype=numpy.float64, count=total_filas)
+        calorias = (4*repeticiones*repeticiones*calorias_ejercicio)/segundos
+
+        # Reduccion agrupada por fecha conservando el orden de primera aparicion
+        fechas_unicas, primera_aparicion, grupo = numpy.unique(fechas, return_index=True, return_inverse=True)
+        repeticiones_fecha = numpy.bincount(grupo, weights=repeticiones, minlength=len(fechas_unicas))
+        calorias_fecha = numpy.bincount(grupo, weights=calorias, minlength=len(fechas_unicas))
+
+        resultados = []
+        for indice in numpy.argsort(primera_aparicion, kind='stable'):
+            resultados.append(dict(fecha=str(date.fromordinal(int(fechas_unicas[indice]))),
+                                   repeticiones=self.formatear_numero(float(repeticiones_fecha[indice])),
+                                   calorias=self.formatear_numero(float(calorias_fecha[indice]))))
+        resultados.append(dict(fecha='Total', repeticiones=self.formatear_numero(float(repeticiones.sum())),
+                               calorias=self.formatear_numero(float(calorias.sum()))))
+        return resultados
+
+    def dar_resultados_lote(self, entrenamientos):
+        # Se resuelven todos los ejercicios en una sola consulta en lugar de una por entrenamiento
+        entrenamientos = list(entrenamientos)
+        return self.dar_resultados(entrenamientos, self.dar_calorias_ejercicios(entrenamientos))
+
+    def dar_calorias_ejercicios(self, entrenamientos):
+        id_ejercicios = {entrenamiento.ejercicio for entrenamiento in entrenamientos}
+        if not id_ejercicios:
+            return {}
+        calorias_ejercicios = dict(db.session.query(Ejercicio.id, Ejercicio.calorias)
+                                   .filter(Ejercicio.id.in_(id_ejercicios)).all())
+        if len(calorias_ejercicios) != len(id_ejercicios):
+            abort(404)
+        return calorias_ejercicios
         
-    def calcular_calorias(self, entrenamiento):
-        ejercicio = Ejercicio.query.get_or_404(entrenamiento.ejercicio)
+    def calcular_calorias(self, entrenamiento, calorias_ejercicio=None):
+        if calorias_ejercicio is None:
+            calorias_ejercicio = Ejercicio.query.get_or_404(entrenamiento.ejercicio).calorias
         tiempo_segundos = (entrenamiento.tiempo.hour*60*60) + (entrenamiento.tiempo.minute*60) + entrenamiento.tiempo.second
-        return((4*entrenamiento.repeticiones*entrenamiento.repeticiones*ejercicio.calorias)/tiempo_segundos)
+        return((4*entrenamiento.repeticiones*entrenamiento.repeticiones*calorias_ejercicio)/tiempo_segundos)
         
- 
\ No newline at end of file
+ 
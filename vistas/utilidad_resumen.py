@@ -0,0 +1,208 @@
+from decimal import Decimal
+from itertools import chain
+
+from sqlalchemy import cast, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from modelos import \
+    db, \
+    Ejercicio, \
+    Entrenamiento, \
+    Persona, \
+    Rutina, \
+    ResumenEntrenamiento
+
+
+TIPO_EJERCICIO = 'Ejercicio'
+TIPO_RUTINA = 'Rutina'
+
+entrenamiento_tabla = Entrenamiento.__table__
+ejercicio_tabla = Ejercicio.__table__
+resumen_tabla = ResumenEntrenamiento.__table__
+
+CAMBIOS_PENDIENTES = 'resumen_entrenamiento'
+# Personas cuyos reportes cambian en la transaccion en curso
+PERSONAS_MODIFICADAS = 'personas_modificadas'
+
+
+def filtrar_fechas(consulta, columna, desde=None, hasta=None):
+    # Rango de fechas opcional e inclusivo de los reportes, sobre el resumen o sobre los entrenamientos
+    if desde is not None:
+        consulta = consulta.filter(columna >= desde)
+    if hasta is not None:
+        consulta = consulta.filter(columna <= hasta)
+    return consulta
+
+
+class UtilidadResumen:
+    def recalcular(self, conexion, claves):
+        # Recalcula el resumen de las parejas (persona, fecha) indicadas a partir de los entrenamientos
+        personas = {persona for persona, fecha in claves if persona is not None and fecha is not None}
+        fechas = {fecha for persona, fecha in claves if persona is not None and fecha is not None}
+        if not personas:
+            return
+        conexion.execute(resumen_tabla.delete().where(resumen_tabla.c.persona.in_(personas),
+                                                      resumen_tabla.c.fecha.in_(fechas)))
+        filas = conexion.execute(self.consulta_entrenamientos().where(entrenamiento_tabla.c.persona.in_(personas),
+                                                                      entrenamiento_tabla.c.fecha.in_(fechas)))
+        self.insertar(conexion, self.agregar(filas))
+
+    def reconstruir(self):
+        total = self.reconstruir_tabla(db.session.connection())
+        db.session.commit()
+        return total
+
+    def reconstruir_tabla(self, conexion):
+        conexion.execute(resumen_tabla.delete())
+        filas = conexion.execution_options(stream_results=True).execute(self.consulta_entrenamientos())
+        resumen = self.agregar(filas)
+        self.insertar(conexion, resumen)
+        return len(resumen)
+
+    def consulta_entrenamientos(self):
+        return select(entrenamiento_tabla.c.persona, entrenamiento_tabla.c.fecha, entrenamiento_tabla.c.rutina,
+                      entrenamiento_tabla.c.repeticiones, entrenamiento_tabla.c.tiempo, ejercicio_tabla.c.calorias) \
+            .select_from(entrenamiento_tabla.join(ejercicio_tabla,
+                                                  entrenamiento_tabla.c.ejercicio == ejercicio_tabla.c.id))
+
+    def agregar(self, filas):
+        resumen = {}
+        for fila in filas:
+            if fila.persona is None or fila.fecha is None:
+                continue
+            tipo = TIPO_EJERCICIO if fila.rutina is None else TIPO_RUTINA
+            acumulado = resumen.setdefault((fila.persona, fila.fecha, tipo), [0, 0, 0, 0])
+            # Con Decimal en los valores faltantes la division no produce float al mezclarse con los Numeric
+            repeticiones = fila.repeticiones or Decimal(0)
+            calorias_ejercicio = fila.calorias or Decimal(0)
+            segundos = self.dar_segundos(fila.tiempo)
+            acumulado[0] += repeticiones
+            acumulado[1] += segundos
+            if segundos:
+                acumulado[2] += (4*repeticiones*repeticiones*calorias_ejercicio)/segundos
+            acumulado[3] += repeticiones*calorias_ejercicio
+        return resumen
+
+    def insertar(self, conexion, resumen):
+        if resumen:
+            conexion.execute(resumen_tabla.insert(), [
+                dict(persona=persona, fecha=fecha, tipo=tipo, repeticiones=valores[0], segundos=valores[1],
+                     calorias=valores[2], calorias_consumidas=valores[3])
+                for (persona, fecha, tipo), valores in resumen.items()])
+
+    def dar_segundos(self, tiempo):
+        if tiempo is None:
+            return 0
+        return (tiempo.hour*60*60) + (tiempo.minute*60) + tiempo.second
+
+    def dar_segundos_sql(self, columna):
+        # SQLite guarda los tiempos como texto 'HH:MM:SS.ffffff', se convierten a segundos en la consulta
+        return cast(func.substr(columna, 1, 2), db.Integer)*60*60 + \
+            cast(func.substr(columna, 4, 2), db.Integer)*60 + \
+            cast(func.substr(columna, 7, 2), db.Integer)
+
+    def dar_resultados(self, id_persona, desde=None, hasta=None):
+        # Mismo formato de UtilidadReporte.dar_resultados, leyendo el resumen en lugar de los entrenamientos
+        consulta = db.session.query(ResumenEntrenamiento.fecha,
+                                    func.sum(ResumenEntrenamiento.repeticiones),
+                                    func.sum(ResumenEntrenamiento.calorias)) \
+            .filter(ResumenEntrenamiento.persona == id_persona)
+        consulta = filtrar_fechas(consulta, ResumenEntrenamiento.fecha, desde, hasta)
+        filas = consulta.group_by(ResumenEntrenamiento.fecha).order_by(ResumenEntrenamiento.fecha).all()
+        return self.formatear_resultados(filas)
+
+    def dar_resultados_entrenador(self, id_entrenador, tamano_lote=500):
+        # Totales diarios de todos los clientes del entrenador, ordenados por persona y fecha
+        return db.session.query(ResumenEntrenamiento.persona,
+                                ResumenEntrenamiento.fecha,
+                                func.sum(ResumenEntrenamiento.repeticiones),
+                                func.sum(ResumenEntrenamiento.calorias)) \
+            .join(Persona, Persona.id == ResumenEntrenamiento.persona) \
+            .filter(Persona.entrenador == id_entrenador) \
+            .group_by(ResumenEntrenamiento.persona, ResumenEntrenamiento.fecha) \
+            .order_by(ResumenEntrenamiento.persona, ResumenEntrenamiento.fecha) \
+            .yield_per(tamano_lote)
+
+    def formatear_resultados(self, filas):
+        resultados = []
+        calorias_total = 0
+        repeticiones_total = 0
+        for fecha, repeticiones, calorias in filas:
+            resultados.append(dict(fecha=str(fecha), repeticiones=str(repeticiones), calorias=str(calorias)))
+            calorias_total = calorias_total + calorias
+            repeticiones_total = repeticiones_total + repeticiones
+        resultados.append(dict(fecha='Total', repeticiones=str(repeticiones_total), calorias=str(calorias_total)))
+        return resultados
+
+    def dar_total(self, id_persona):
+        repeticiones, calorias = db.session.query(func.sum(ResumenEntrenamiento.repeticiones),
+                                                  func.sum(ResumenEntrenamiento.calorias)) \
+            .filter(ResumenEntrenamiento.persona == id_persona).one()
+        return dict(fecha='Total', repeticiones=str(repeticiones or 0), calorias=str(calorias or 0))
+
+    def dar_resultados_entrenamientos(self, id_persona, desde=None, hasta=None):
+        # La persona y las fechas van como parametros y recorren la llave primaria (persona, fecha, tipo)
+        consulta = filtrar_fechas(ResumenEntrenamiento.query.filter(ResumenEntrenamiento.persona == id_persona),
+                                  ResumenEntrenamiento.fecha, desde, hasta)
+        filas = consulta.order_by(ResumenEntrenamiento.fecha, ResumenEntrenamiento.tipo).all()
+        return [{
+            'persona': fila.persona,
+            'fecha': str(fila.fecha),
+            'Tipo de Entrenamiento': fila.tipo,
+            'Repeticiones Ejecutadas': self.dar_numero(fila.repeticiones),
+            'Calorias Consumidas': self.dar_numero(fila.calorias_consumidas)
+        } for fila in filas]
+
+    def dar_numero(self, valor):
+        # SQLite entrega los totales enteros como INTEGER y el resto como REAL
+        if valor is None:
+            return None
+        if valor == int(valor):
+            return int(valor)
+        return float(valor)
+
+
+@event.listens_for(Session, 'before_flush')
+def registrar_cambios_resumen(session, flush_context, instances):
+    entrenamientos, anteriores, claves = session.info.setdefault(CAMBIOS_PENDIENTES, ({}, {}, set()))
+    personas_modificadas = session.info.setdefault(PERSONAS_MODIFICADAS, set())
+    for objeto in chain(session.new, session.dirty, session.deleted):
+        if isinstance(objeto, Persona) and inspect(objeto).identity is not None:
+            personas_modificadas.add(inspect(objeto).identity[0])
+        if isinstance(objeto, Entrenamiento):
+            entrenamientos[id(objeto)] = objeto
+        elif isinstance(objeto, (Persona, Ejercicio, Rutina)):
+            # Los entrenamientos agregados o retirados de una coleccion cambian su llave al hacer flush
+            historia = inspect(objeto).attrs.entrenamientos.history
+            for entrenamiento in chain(historia.added or (), historia.deleted or ()):
+                entrenamientos[id(entrenamiento)] = entrenamiento
+            if isinstance(objeto, (Ejercicio, Rutina)) and objeto not in session.new:
+                columna = entrenamiento_tabla.c.ejercicio if isinstance(objeto, Ejercicio) else entrenamiento_tabla.c.rutina
+                if objeto in session.deleted or \
+                        (isinstance(objeto, Ejercicio) and inspect(objeto).attrs.calorias.history.has_changes()):
+                    claves.update(tuple(fila) for fila in session.execute(
+                        select(entrenamiento_tabla.c.persona, entrenamiento_tabla.c.fecha)
+                        .where(columna == objeto.id).distinct()))
+    persistentes = {inspect(entrenamiento).identity[0]: entrenamiento for entrenamiento in entrenamientos.values()
+                    if inspect(entrenamiento).identity is not None}
+    if persistentes:
+        # Llaves anteriores al flush, tal como estan guardadas en la base de datos
+        for id_entrenamiento, persona, fecha in session.execute(
+                select(entrenamiento_tabla.c.id, entrenamiento_tabla.c.persona, entrenamiento_tabla.c.fecha)
+                .where(entrenamiento_tabla.c.id.in_(list(persistentes)))):
+            claves.add((persona, fecha))
+            anteriores[id(persistentes[id_entrenamiento])] = (persona, fecha)
+
+
+@event.listens_for(Session, 'after_flush')
+def actualizar_resumen(session, flush_context):
+    entrenamientos, anteriores, claves = session.info.pop(CAMBIOS_PENDIENTES, ({}, {}, set()))
+    for llave, entrenamiento in entrenamientos.items():
+        # Un atributo que no esta cargado no cambio, por lo que conserva el valor anterior al flush
+        persona, fecha = anteriores.get(llave, (None, None))
+        valores = inspect(entrenamiento).dict
+        claves.add((valores.get('persona', persona), valores.get('fecha', fecha)))
+    session.info.setdefault(PERSONAS_MODIFICADAS, set()).update(
+        persona for persona, fecha in claves if persona is not None)
+    if claves:
+        UtilidadResumen().recalcular(session.connection(), claves)
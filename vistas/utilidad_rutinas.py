@@ -0,0 +1,53 @@
+from itertools import chain
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from modelos import \
+    Ejercicio, \
+    Rutina, \
+    rutinas_ejercicios
+
+
+rutina_tabla = Rutina.__table__
+
+RUTINAS_PENDIENTES = 'rutinas_total_ejercicios'
+
+
+def recalcular_total_ejercicios(conexion, id_rutinas=None):
+    # Recalcula el contador desde rutina_ejercicio; sin ids se recalculan todas las rutinas
+    total = select(func.count()).select_from(rutinas_ejercicios) \
+        .where(rutinas_ejercicios.c.rutina_id == rutina_tabla.c.id).scalar_subquery()
+    sentencia = rutina_tabla.update().values(total_ejercicios=total)
+    if id_rutinas is not None:
+        if not id_rutinas:
+            return
+        sentencia = sentencia.where(rutina_tabla.c.id.in_(sorted(id_rutinas)))
+    conexion.execute(sentencia)
+
+
+@event.listens_for(Session, 'before_flush')
+def registrar_cambios_rutinas(session, flush_context, instances):
+    rutinas, id_rutinas = session.info.setdefault(RUTINAS_PENDIENTES, ({}, set()))
+    for objeto in chain(session.new, session.dirty, session.deleted):
+        if isinstance(objeto, Rutina) and objeto not in session.deleted and \
+                inspect(objeto).attrs.ejercicios.history.has_changes():
+            rutinas[id(objeto)] = objeto
+        elif isinstance(objeto, Ejercicio):
+            # Las rutinas nuevas reciben su id en el flush, por eso se guarda el objeto
+            historia = inspect(objeto).attrs.rutinas.history
+            for rutina in chain(historia.added or (), historia.deleted or ()):
+                rutinas[id(rutina)] = rutina
+            if objeto in session.deleted:
+                # Al borrar el ejercicio el flush retira sus filas de rutina_ejercicio
+                id_rutinas.update(id_rutina for id_rutina, in session.execute(
+                    select(rutinas_ejercicios.c.rutina_id).where(rutinas_ejercicios.c.ejercicio_id == objeto.id)))
+
+
+@event.listens_for(Session, 'after_flush')
+def actualizar_total_ejercicios(session, flush_context):
+    rutinas, id_rutinas = session.info.pop(RUTINAS_PENDIENTES, ({}, set()))
+    # Las rutinas nuevas aun no tienen identidad en after_flush, pero su id ya esta asignado
+    id_rutinas.update(inspect(rutina).dict['id'] for rutina in rutinas.values()
+                      if 'id' in inspect(rutina).dict and rutina not in session.deleted)
+    recalcular_total_ejercicios(session.connection(), id_rutinas)
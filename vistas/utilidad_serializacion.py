@@ -0,0 +1,195 @@
+from copy import copy
+
+from marshmallow import fields
+from marshmallow_sqlalchemy.fields import RelatedList
+from sqlalchemy import inspect, select
+
+from modelos import db
+
+
+# Formato de respuesta con los ejercicios y rutinas una sola vez, referenciados por id
+FORMATO_NORMALIZADO = 'normalizado'
+
+
+def leer_normalizado(argumentos, nombre='formato'):
+    valor = argumentos.get(nombre)
+    if valor is None:
+        return False
+    if valor != FORMATO_NORMALIZADO:
+        raise ValueError(valor)
+    return True
+
+
+def referenciar_ids(entrenamiento):
+    # En el formato normalizado las referencias son texto, igual que las llaves de los mapas en JSON
+    for llave in ('ejercicio', 'rutina'):
+        entrenamiento[llave] = convertir_texto(entrenamiento[llave])
+
+
+def convertir_texto(valor):
+    return None if valor is None else str(valor)
+
+
+def convertir_entero(valor):
+    return None if valor is None else int(valor)
+
+
+def convertir_decimal(valor):
+    return None if valor is None else float(valor)
+
+
+def convertir_booleano(campo):
+    def convertir(valor):
+        if valor is None:
+            return None
+        try:
+            if valor in campo.truthy:
+                return True
+            if valor in campo.falsy:
+                return False
+        except TypeError:
+            pass
+        return bool(valor)
+    return convertir
+
+
+def convertir_fecha(campo):
+    formato = campo.format or campo.DEFAULT_FORMAT
+    funcion = campo.SERIALIZATION_FUNCS.get(formato)
+
+    def convertir(valor):
+        if valor is None:
+            return None
+        return funcion(valor) if funcion else valor.strftime(formato)
+    return convertir
+
+
+def dar_conversor(campo):
+    # Conversor equivalente al _serialize del campo, sin la maquinaria del esquema
+    if type(campo) is fields.String:
+        return convertir_texto
+    if type(campo) is fields.Integer and not campo.as_string:
+        return convertir_entero
+    if type(campo) is fields.Float and not campo.as_string:
+        return convertir_decimal
+    if type(campo) is fields.Boolean:
+        return convertir_booleano(campo)
+    if type(campo) in (fields.Date, fields.Time, fields.DateTime):
+        return convertir_fecha(campo)
+    return lambda valor: campo._serialize(valor, None, None)
+
+
+class SerializadorRapido:
+    # Serializa filas (objetos del ORM o filas de Core) con las mismas llaves, orden y formato del esquema.
+    # Las relaciones se consultan en bloque para toda la lista en lugar de cargarse perezosamente por objeto
+    def __init__(self, schema):
+        self.schema = schema
+        self.mapeador = inspect(schema.opts.model)
+        self.llave = self.mapeador.primary_key[0].key
+        self.campos = []
+        self.relaciones = {}
+        for nombre, campo in schema.dump_fields.items():
+            atributo = campo.attribute or nombre
+            llave = campo.data_key or nombre
+            if isinstance(campo, RelatedList):
+                self.relaciones[llave] = (self.mapeador.relationships[atributo], None)
+                self.campos.append((llave, None, None))
+            elif isinstance(campo, fields.Nested) and campo.many:
+                self.relaciones[llave] = (self.mapeador.relationships[atributo], SerializadorRapido(campo.schema))
+                self.campos.append((llave, None, None))
+            else:
+                self.campos.append((llave, atributo, dar_conversor(campo)))
+
+    def seleccionar(self, nombres):
+        # Serializador limitado a los campos pedidos; las relaciones solo se consultan si estan entre ellos
+        if nombres is None:
+            return self
+        desconocidos = set(nombres) - {llave for llave, atributo, conversor in self.campos}
+        if desconocidos:
+            raise ValueError(', '.join(sorted(desconocidos)))
+        seleccion = copy(self)
+        seleccion.campos = [campo for campo in self.campos if campo[0] in nombres]
+        seleccion.relaciones = {llave: relacion for llave, relacion in self.relaciones.items() if llave in nombres}
+        return seleccion
+
+    def excluir(self, nombres):
+        # Serializador sin los campos indicados, tambien en las relaciones anidadas
+        seleccion = copy(self)
+        seleccion.campos = [campo for campo in self.campos if campo[0] not in nombres]
+        seleccion.relaciones = {llave: (relacion, None if serializador is None else serializador.excluir(nombres))
+                                for llave, (relacion, serializador) in self.relaciones.items() if llave not in nombres}
+        return seleccion
+
+    def referencias(self):
+        # Serializador que entrega los ids de las relaciones anidadas en lugar de los objetos completos
+        seleccion = copy(self)
+        seleccion.relaciones = {llave: (relacion, None) for llave, (relacion, serializador) in self.relaciones.items()}
+        return seleccion
+
+    def columnas(self):
+        # Columnas del modelo que necesitan los campos seleccionados, para usar con load_only
+        atributos = {self.llave} | {atributo for llave, atributo, conversor in self.campos if conversor is not None}
+        return [self.mapeador.attrs[atributo].class_attribute for atributo in atributos
+                if atributo in self.mapeador.column_attrs]
+
+    def tablas(self):
+        # Tablas que se leen para serializar los campos seleccionados
+        tablas = {self.mapeador.local_table.name}
+        for relacion, serializador in self.relaciones.values():
+            if relacion.secondary is not None:
+                tablas.add(relacion.secondary.name)
+            if relacion.secondary is None or serializador is not None:
+                tablas.add(relacion.mapper.local_table.name)
+            if serializador is not None:
+                tablas.update(serializador.tablas())
+        return tablas
+
+    def serializar(self, objeto):
+        return self.serializar_lista([objeto])[0]
+
+    def serializar_lista(self, objetos):
+        objetos = list(objetos)
+        relacionados = {llave: self.consultar_relacion(relacion, serializador, objetos)
+                        for llave, (relacion, serializador) in self.relaciones.items()}
+        resultado = []
+        for objeto in objetos:
+            identificador = getattr(objeto, self.llave)
+            fila = {}
+            for llave, atributo, conversor in self.campos:
+                if conversor is None:
+                    fila[llave] = relacionados[llave].get(identificador, [])
+                else:
+                    fila[llave] = conversor(getattr(objeto, atributo))
+            resultado.append(fila)
+        return resultado
+
+    def consultar_relacion(self, relacion, serializador, objetos):
+        # Una consulta por relacion: (id del padre, id o fila del hijo) ordenado por el id del hijo
+        identificadores = {getattr(objeto, self.llave) for objeto in objetos}
+        if not identificadores:
+            return {}
+        destino = relacion.mapper.local_table
+        llave_destino = relacion.mapper.primary_key[0]
+        if relacion.secondary is None:
+            columna_padre = [remota for local, remota in relacion.local_remote_pairs][0]
+            columna_hijo = llave_destino
+            consulta = select(columna_padre.label('padre'), *destino.c) if serializador \
+                else select(columna_padre.label('padre'), columna_hijo)
+        else:
+            pares = dict(relacion.local_remote_pairs)
+            columna_padre = pares[self.mapeador.primary_key[0]]
+            columna_hijo = pares[llave_destino]
+            if serializador:
+                consulta = select(columna_padre.label('padre'), *destino.c) \
+                    .select_from(relacion.secondary.join(destino, columna_hijo == llave_destino))
+            else:
+                consulta = select(columna_padre.label('padre'), columna_hijo)
+        filas = db.session.execute(consulta.where(columna_padre.in_(identificadores)).order_by(columna_hijo)).all()
+        relacionados = {}
+        if serializador is None:
+            for padre, hijo in filas:
+                relacionados.setdefault(padre, []).append(hijo)
+        else:
+            for fila, serializado in zip(filas, serializador.serializar_lista(filas)):
+                relacionados.setdefault(fila.padre, []).append(serializado)
+        return relacionados
@@ -0,0 +1,59 @@
+from hashlib import sha1
+from itertools import chain
+
+from flask import request
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from werkzeug.http import quote_etag
+
+from modelos import db, VersionTabla
+
+
+version_tabla = VersionTabla.__table__
+
+
+def dar_versiones(tablas):
+    versiones = dict(db.session.execute(select(version_tabla.c.tabla, version_tabla.c.version)
+                                        .where(version_tabla.c.tabla.in_(tablas))).all())
+    return {tabla: versiones.get(tabla, 0) for tabla in tablas}
+
+
+def dar_etag(tablas):
+    # El ETag depende de la ruta con sus parametros y de la version de cada tabla que se serializa
+    versiones = dar_versiones(sorted(tablas))
+    contenido = request.full_path + '|' + ','.join('{}:{}'.format(tabla, versiones[tabla]) for tabla in sorted(tablas))
+    return sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def verificar_etag(tablas):
+    # Retorna los encabezados con el ETag y si la copia del cliente sigue vigente
+    etag = dar_etag(tablas)
+    return {'ETag': quote_etag(etag)}, request.if_none_match.contains_weak(etag)
+
+
+def incrementar_versiones(conexion, tablas):
+    # Se actualiza y solo se inserta la fila de las tablas que aun no tienen version, sin depender del motor
+    for tabla in sorted(tablas):
+        resultado = conexion.execute(version_tabla.update().where(version_tabla.c.tabla == tabla)
+                                     .values(version=version_tabla.c.version + 1))
+        if resultado.rowcount == 0:
+            conexion.execute(version_tabla.insert().values(tabla=tabla, version=1))
+
+
+@event.listens_for(Session, 'after_flush')
+def registrar_versiones(session, flush_context):
+    # En after_flush las listas new, dirty y deleted aun tienen el estado anterior al flush
+    tablas = set()
+    for objeto in chain(session.new, session.dirty, session.deleted):
+        mapeador = inspect(objeto).mapper
+        if mapeador.local_table is version_tabla:
+            continue
+        # Un cambio solo en las colecciones no modifica la fila del objeto
+        if objeto not in session.dirty or session.is_modified(objeto, include_collections=False):
+            tablas.add(mapeador.local_table.name)
+        for relacion in mapeador.relationships:
+            # Las asociaciones muchos a muchos se escriben en la tabla secundaria
+            if relacion.secondary is not None and (objeto in session.deleted or
+                                                   inspect(objeto).attrs[relacion.key].history.has_changes()):
+                tablas.add(relacion.secondary.name)
+    incrementar_versiones(session.connection(), tablas)
@@ -1,12 +1,22 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app, Response, stream_with_context, send_file, abort
 from flask_jwt_extended import jwt_required, create_access_token
 from flask_restful import Resource
+from sqlalchemy import Integer, and_, cast, func, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from datetime import datetime
 from .utilidad_reporte import UtilidadReporte
+from .utilidad_resumen import UtilidadResumen
+from .utilidad_cache import cache_reportes
+from .utilidad_exportacion import gestor_exportaciones, ColaLlena, ExportadorDatos, FORMATOS, PENDIENTE, TABLAS_EXPORTACION, \
+    TERMINADA
+from .utilidad_importacion import ImportadorNDJSON, RECURSOS
+from .utilidad_serializacion import SerializadorRapido, leer_normalizado, referenciar_ids
+from .utilidad_versiones import verificar_etag
+from .utilidad_paginacion import codificar_cursor, decodificar_cursor, leer_campos, leer_fecha, leer_limite, paginar
 import hashlib
 from json import dumps
-from itertools import groupby
+import time
 import re
 
 from modelos import \
@@ -16,7 +26,8 @@ from modelos import \
     Entrenamiento, EntrenamientoSchema, \
     Usuario, UsuarioSchema, \
     Rutina, RutinaSchema, \
-    ReporteGeneralSchema, ReporteDetalladoSchema
+    Exportacion, ExportacionSchema, \
+    ReporteGeneralSchema, ReporteVentanaSchema, ReporteDetalladoSchema
 
 
 ejercicio_schema = EjercicioSchema()
@@ -25,7 +36,18 @@ entrenamiento_schema = EntrenamientoSchema()
 usuario_schema = UsuarioSchema()
 rutina_schema = RutinaSchema()
 reporte_general_schema = ReporteGeneralSchema()
+reporte_ventana_schema = ReporteVentanaSchema()
 reporte_detallado_schema = ReporteDetalladoSchema()
+exportacion_schema = ExportacionSchema()
+
+# Serializadores de los listados: mismo JSON de los esquemas, con las relaciones consultadas en bloque
+ejercicio_serializador = SerializadorRapido(ejercicio_schema)
+persona_serializador = SerializadorRapido(persona_schema)
+entrenamiento_serializador = SerializadorRapido(entrenamiento_schema)
+rutina_serializador = SerializadorRapido(rutina_schema)
+# Formato normalizado: ejercicios solo con sus columnas y rutinas que referencian sus ejercicios por id
+ejercicio_normalizado_serializador = ejercicio_serializador.excluir({'entrenamientos', 'rutinas'})
+rutina_normalizado_serializador = rutina_serializador.excluir({'entrenamientos'}).referencias()
 
 class VistaSignIn(Resource):
 
@@ -100,8 +122,14 @@ class VistaLogIn(Resource):
 class VistaPersonas(Resource):
     @jwt_required()
     def get(self, id_usuario):
-        personas = Persona.query.filter(Persona.entrenador == id_usuario)
-        return [persona_schema.dump(persona) for persona in personas]
+        try:
+            serializador = persona_serializador.seleccionar(leer_campos(request.args))
+            personas, encabezados = paginar(Persona.query.options(load_only(*serializador.columnas()))
+                                            .filter(Persona.entrenador == id_usuario), request.args,
+                                            Persona.id, (Persona.nombre, Persona.apellido))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(personas), 200, encabezados
 
     @jwt_required()
     def post(self, id_usuario):
@@ -144,7 +172,12 @@ class VistaPersonas(Resource):
 class VistaPersona(Resource):
     @jwt_required()
     def get(self, id_persona):
-        return persona_schema.dump(Persona.query.get_or_404(id_persona))
+        try:
+            serializador = persona_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar(Persona.query.options(load_only(*serializador.columnas()))
+                                       .filter(Persona.id == id_persona).first_or_404())
 
     @jwt_required()
     def put(self, id_persona):
@@ -170,19 +203,31 @@ class VistaPersona(Resource):
     @jwt_required()
     def delete(self, id_persona):
         persona = Persona.query.get_or_404(id_persona)
-        if not persona.entrenamientos:
-            db.session.delete(persona)
-            db.session.commit()
-            return '', 204
-        else:
+        tiene_entrenamientos = db.session.query(Entrenamiento.query.filter(Entrenamiento.persona == id_persona)
+                                                .exists()).scalar()
+        if tiene_entrenamientos:
             return 'La persona tiene entrenamientos asociados', 409
+        db.session.delete(persona)
+        db.session.commit()
+        return '', 204
 
 
 class VistaEjercicios(Resource):
     @jwt_required()
     def get(self):
-        ejercicios = Ejercicio.query.all()
-        return [ejercicio_schema.dump(ejercicio) for ejercicio in ejercicios]
+        try:
+            serializador = ejercicio_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        encabezados_etag, vigente = verificar_etag(serializador.tablas())
+        if vigente:
+            return '', 304, encabezados_etag
+        try:
+            ejercicios, encabezados = paginar(Ejercicio.query.options(load_only(*serializador.columnas())),
+                                              request.args, Ejercicio.id, (Ejercicio.nombre,))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(ejercicios), 200, dict(encabezados, **encabezados_etag)
 
     @jwt_required()
     def post(self):
@@ -200,7 +245,12 @@ class VistaEjercicios(Resource):
 class VistaEjercicio(Resource):
     @jwt_required()
     def get(self, id_ejercicio):
-        return ejercicio_schema.dump(Ejercicio.query.get_or_404(id_ejercicio))
+        try:
+            serializador = ejercicio_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar(Ejercicio.query.options(load_only(*serializador.columnas()))
+                                       .filter(Ejercicio.id == id_ejercicio).first_or_404())
 
     @jwt_required()
     def put(self, id_ejercicio):
@@ -226,15 +276,50 @@ class VistaEjercicio(Resource):
 class VistaEntrenamientos(Resource):
     @jwt_required()
     def get(self, id_persona):
-        persona = Persona.query.get_or_404(id_persona)
-        entrenamiento_array = []
-        for entrenamiento in persona.entrenamientos:
-            ejercicio = Ejercicio.query.get_or_404(entrenamiento.ejercicio)
-            entrenamiento_schema_dump = entrenamiento_schema.dump(entrenamiento)
-            if entrenamiento_schema_dump['rutina'] == None:
-              entrenamiento_schema_dump['ejercicio'] = ejercicio_schema.dump(ejercicio)
-              entrenamiento_array.append(entrenamiento_schema_dump)
-        return [entrenamiento for entrenamiento in entrenamiento_array]
+        try:
+            limite = leer_limite(request.args)
+            cursor = request.args.get('cursor')
+            if cursor is not None:
+                fecha_cursor, id_cursor = decodificar_cursor(cursor)
+                fecha_cursor = datetime.strptime(fecha_cursor, '%Y-%m-%d').date()
+            normalizado = leer_normalizado(request.args)
+        except (ValueError, TypeError):
+            return 'Parametros de consulta invalidos', 400
+
+        # Solo los entrenamientos libres, paginados por (fecha, id)
+        consulta = Entrenamiento.query.filter(Entrenamiento.persona == id_persona, Entrenamiento.rutina.is_(None))
+        if cursor is not None:
+            consulta = consulta.filter(or_(Entrenamiento.fecha > fecha_cursor,
+                                           and_(Entrenamiento.fecha == fecha_cursor, Entrenamiento.id > id_cursor)))
+        consulta = consulta.order_by(Entrenamiento.fecha, Entrenamiento.id)
+        if limite is not None:
+            consulta = consulta.limit(limite + 1)
+        entrenamientos = consulta.all()
+        if not entrenamientos:
+            Persona.query.get_or_404(id_persona)
+
+        encabezados = {}
+        if limite is not None and len(entrenamientos) > limite:
+            entrenamientos = entrenamientos[:limite]
+            encabezados['X-Siguiente-Cursor'] = codificar_cursor(
+                [str(entrenamientos[-1].fecha), entrenamientos[-1].id])
+
+        # Cada ejercicio se consulta y serializa una sola vez
+        serializador_ejercicio = ejercicio_normalizado_serializador if normalizado else ejercicio_serializador
+        ejercicios = Ejercicio.query.filter(Ejercicio.id.in_({entrenamiento.ejercicio for entrenamiento in entrenamientos}))
+        ejercicios = {int(ejercicio['id']): ejercicio for ejercicio in serializador_ejercicio.serializar_lista(ejercicios)}
+        entrenamiento_array = entrenamiento_serializador.serializar_lista(entrenamientos)
+        for entrenamiento_schema_dump in entrenamiento_array:
+            if entrenamiento_schema_dump['ejercicio'] not in ejercicios:
+                abort(404)
+            if normalizado:
+                referenciar_ids(entrenamiento_schema_dump)
+            else:
+                entrenamiento_schema_dump['ejercicio'] = ejercicios[entrenamiento_schema_dump['ejercicio']]
+        if normalizado:
+            return {"entrenamientos": entrenamiento_array,
+                    "ejercicios": {ejercicio['id']: ejercicio for ejercicio in ejercicios.values()}}, 200, encabezados
+        return entrenamiento_array, 200, encabezados
 
     @jwt_required()
     def post(self, id_persona):
@@ -281,8 +366,23 @@ class VistaReporte(Resource):
 
     @jwt_required()
     def get(self, id_persona):
-        reporte = []
-        reporte_entrenamiento = []
+        # Sin parametros se entrega el historial completo y la respuesta se guarda en cache
+        recurso = 'reporte:' + current_app.config.get('REPORTE_MOTOR', '')
+        if not request.args:
+            reporte_persona_schema, generacion = cache_reportes.obtener(id_persona, recurso)
+            if reporte_persona_schema is not None:
+                return reporte_persona_schema
+
+        try:
+            desde = leer_fecha(request.args, 'desde')
+            hasta = leer_fecha(request.args, 'hasta')
+            limite = leer_limite(request.args)
+            cursor = request.args.get('cursor')
+            if cursor is not None:
+                cursor = datetime.strptime(decodificar_cursor(cursor)[0], '%Y-%m-%d').date()
+        except (ValueError, IndexError, TypeError):
+            return 'Parametros de consulta invalidos', 400
+
         utilidad = UtilidadReporte()
         data_persona = Persona.query.get_or_404(id_persona)
         imc_calculado = utilidad.calcular_imc(
@@ -292,66 +392,110 @@ class VistaReporte(Resource):
 
         reporte_persona = dict(persona=data_persona, imc=imc_calculado,
                                clasificacion_imc=clasificacion_imc_calculado)
-        reporte_persona_schema = reporte_general_schema.dump(reporte_persona)
+        if desde is None and hasta is None and limite is None and cursor is None:
+            reporte_persona_schema = reporte_general_schema.dump(reporte_persona)
+        else:
+            reporte_persona_schema = reporte_ventana_schema.dump(reporte_persona)
+
+        desde, hasta, siguiente = utilidad.dar_ventana(id_persona, desde, hasta, limite, cursor)
+        reporte_persona_schema['resultados'] = utilidad.dar_resultados_persona(
+            data_persona, desde, hasta)
+        if request.args.get('total') == 'completo':
+            reporte_persona_schema['resultados'][-1] = utilidad.dar_total_persona(data_persona)
+        encabezados = {}
+        if siguiente is not None:
+            encabezados['X-Siguiente-Cursor'] = codificar_cursor([str(siguiente)])
+
+        if not request.args:
+            cache_reportes.guardar(id_persona, recurso, reporte_persona_schema, generacion)
+        return reporte_persona_schema, 200, encabezados
 
-        for entrenamiento in data_persona.entrenamientos:
-            data_entrenamiento = dict(
-                fecha=entrenamiento.fecha, repeticiones=entrenamiento.repeticiones, calorias=1)
-            reporte_entrenamiento.append(
-                reporte_detallado_schema.dump(data_entrenamiento))
 
-        reporte_persona_schema['resultados'] = utilidad.dar_resultados(
-            data_persona.entrenamientos)
+class VistaReportesEntrenador(Resource):
 
+    @jwt_required()
+    def get(self, id_usuario):
+        utilidad = UtilidadReporte()
+        reportes = (self.armar_reporte(*reporte) for reporte in utilidad.dar_reportes_entrenador(id_usuario))
+        if request.args.get('stream') in ('1', 'true'):
+            return Response(stream_with_context(dumps(reporte) + '\n' for reporte in reportes),
+                            mimetype='application/x-ndjson')
+        return [reporte for reporte in reportes]
+
+    def armar_reporte(self, persona, imc, clasificacion_imc, resultados):
+        reporte_persona_schema = reporte_general_schema.dump(
+            dict(persona=persona, imc=imc, clasificacion_imc=clasificacion_imc))
+        reporte_persona_schema['resultados'] = resultados
         return reporte_persona_schema
 
 
 class VistaEntrenadores(Resource):
     @jwt_required()
     def get(self):
-        entrenadores = [usuario_schema.dump(
-            usuario) for usuario in Usuario.query.filter_by(rol="ENT").all()]
-        entrenadores_list = [val['id'] for val in entrenadores]
-        return [persona_schema.dump(persona) for persona in Persona.query.filter(Persona.usuario.in_(entrenadores_list)).all()]
+        # Un solo JOIN con usuario, sobre los indices de usuario.rol y persona.usuario
+        try:
+            serializador = persona_serializador.seleccionar(leer_campos(request.args))
+            personas, encabezados = paginar(Persona.query.options(load_only(*serializador.columnas()))
+                                            .join(Usuario, Persona.usuario == Usuario.id)
+                                            .filter(Usuario.rol == "ENT"), request.args,
+                                            Persona.id, (Persona.nombre, Persona.apellido))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(personas), 200, encabezados
 
 
 class VistaEntrenador(Resource):
     @jwt_required()
     def delete(self, id_usuario):
-        personas = Persona.query.filter_by(entrenador=id_usuario).all()
-        if len(personas) == 0:
-             # Se elimina la persona
-            persona = Persona.query.filter_by(usuario=id_usuario).first()
-            db.session.delete(persona)
-            db.session.commit()
-            # Se elimina el usuario
-            usuario = Usuario.query.get_or_404(id_usuario)
-            db.session.delete(usuario)
-            db.session.commit()
-            return '', 204
-        else:
+        usuario = Usuario.query.get_or_404(id_usuario)
+        # Basta con saber si existe un cliente, sin cargar la lista
+        tiene_clientes = db.session.query(Persona.query.filter(Persona.entrenador == id_usuario).exists()).scalar()
+        if tiene_clientes:
             return 'El entrenador tienen clientes asociados', 409
+        # La persona y el usuario se eliminan en la misma transaccion
+        persona = Persona.query.filter_by(usuario=id_usuario).first()
+        if persona is not None:
+            db.session.delete(persona)
+        db.session.delete(usuario)
+        db.session.commit()
+        return '', 204
 
 
 class VistaRutinas(Resource):
     @jwt_required()
     def get(self):
-        rutinas = Rutina.query.all()
-        return [rutina_schema.dump(rutina) for rutina in rutinas]
+        try:
+            serializador = rutina_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        encabezados_etag, vigente = verificar_etag(serializador.tablas())
+        if vigente:
+            return '', 304, encabezados_etag
+        try:
+            rutinas, encabezados = paginar(Rutina.query.options(load_only(*serializador.columnas())),
+                                           request.args, Rutina.id, (Rutina.nombre,))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(rutinas), 200, dict(encabezados, **encabezados_etag)
         
 
     @jwt_required()
     def post(self):
-        rutinas_creadas = Rutina.query.all()
         nueva_rutina = Rutina(
             nombre=request.json["nombre"],
             descripcion=request.json["descripcion"],
         )
-        for rutina in rutinas_creadas:
-            if rutina.nombre.lower() == nueva_rutina.nombre.lower():
-                return "La Rutina ya existe", 409 
+        # Consulta sobre el indice unico del nombre normalizado; el indice resuelve las creaciones concurrentes
+        existe = db.session.query(Rutina.query.filter(Rutina.nombre_normalizado == nueva_rutina.nombre_normalizado)
+                                  .exists()).scalar()
+        if existe:
+            return "La Rutina ya existe", 409
         db.session.add(nueva_rutina)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return "La Rutina ya existe", 409
         return rutina_schema.dump(nueva_rutina)
             
         
@@ -359,22 +503,35 @@ class VistaRutinas(Resource):
     
 class VistaRutina(Resource):
     @jwt_required()
-    def get(self, id_rutina):        
-        return rutina_schema.dump(Rutina.query.get_or_404(id_rutina))
+    def get(self, id_rutina):
+        try:
+            serializador = rutina_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        encabezados_etag, vigente = verificar_etag(serializador.tablas())
+        if vigente:
+            return '', 304, encabezados_etag
+        return serializador.serializar(Rutina.query.options(load_only(*serializador.columnas()))
+                                       .filter(Rutina.id == id_rutina).first_or_404()), 200, encabezados_etag
 
 class VistaRutinaDiferente(Resource):
     @jwt_required()
     def get(self, id_rutina):
-        ejerciciosDisponibles = []
-        ejerciciosRutina = rutina_schema.dump(Rutina.query.get_or_404(id_rutina))
-        ejerciciosRutinaString = dumps(ejerciciosRutina)
-        ejercicios = Ejercicio.query.all()
-        lista_ejercicios = [ejercicio_schema.dump(ejercicio) for ejercicio in ejercicios]
-        for ejercicio in lista_ejercicios:
-            nombreEjercicio = ejercicio['nombre']
-            if not nombreEjercicio in ejerciciosRutinaString:
-              ejerciciosDisponibles.append(ejercicio)
-        return ejerciciosDisponibles       
+        Rutina.query.get_or_404(id_rutina)
+        try:
+            serializador = ejercicio_serializador.seleccionar(leer_campos(request.args))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        # Anti-join por id: ejercicios del catalogo sin fila en rutina_ejercicio para la rutina
+        asignado = db.session.query(rutinas_ejercicios) \
+            .filter(rutinas_ejercicios.c.rutina_id == id_rutina, rutinas_ejercicios.c.ejercicio_id == Ejercicio.id) \
+            .exists()
+        consulta = Ejercicio.query.options(load_only(*serializador.columnas())).filter(~asignado)
+        try:
+            ejercicios, encabezados = paginar(consulta, request.args, Ejercicio.id, (Ejercicio.nombre,))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(ejercicios), 200, encabezados
 
  
 class VistaRutinaEjercicio(Resource):    
@@ -389,101 +546,263 @@ class VistaRutinaEjercicio(Resource):
 class VistaRutinasEntrenamiento(Resource):    
     @jwt_required()
     def get(self):        
-        sql_rutinas = db.session.execute('SELECT Q1.ID FROM RUTINA AS Q1, (SELECT RUTINA_ID, COUNT(RUTINA_ID) AS TOTAL_EJERCICIOS FROM RUTINA_EJERCICIO GROUP BY RUTINA_ID) \
-                                          AS Q2 WHERE Q1.ID=Q2.RUTINA_ID AND Q2.TOTAL_EJERCICIOS>=3')                 
-              
-        id_rutinas = sql_rutinas.scalars().all()  
-        rutinas = db.session.query(Rutina).all()
-        rutinasEntrenamiento = []
-        for rutina in rutinas:
-            if rutina.id in id_rutinas:
-                rutinasEntrenamiento.append(rutina)
-
-        return [rutina_schema.dump(rutina) for rutina in rutinasEntrenamiento]
+        # Rutinas con al menos tres ejercicios, por el contador indexado; los ejercicios de la pagina
+        # se cargan en bloque con una sola consulta del serializador
+        try:
+            serializador = rutina_serializador.seleccionar(leer_campos(request.args))
+            rutinas, encabezados = paginar(Rutina.query.options(load_only(*serializador.columnas()))
+                                           .filter(Rutina.total_ejercicios >= 3), request.args,
+                                           Rutina.id, (Rutina.nombre,))
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        return serializador.serializar_lista(rutinas), 200, encabezados
     
 
     @jwt_required()
     def post(self):
-        idRutina = request.json["idRutina"]
-        fecha = datetime.strptime(request.json["fecha"], '%Y-%m-%d').date()
-        idPersona = request.json["idPersona"]
-        entrenamientos = request.json["entrenamientos"]
-        
-        for entrenamiento in entrenamientos:
-            repeticiones = entrenamiento['repeticiones']            
-            nuevo_entrenamiento = Entrenamiento(
-                tiempo=datetime.strptime(
-                    entrenamiento["tiempo"], '%H:%M:%S').time(),
-                repeticiones=entrenamiento["repeticiones"], 
-                fecha=fecha,
-                ejercicio=entrenamiento["ejercicio"],
-                persona=idPersona,
-                rutina=idRutina                
-            )
-            db.session.add(nuevo_entrenamiento)
-            db.session.commit()
-        
-        data =  "Se realiza la creación exitosa"
-        # Creating a dictionary
-        response = {"mensaje": "proceso exitoso"}
-        return response, 200
-
+        # Se valida toda la sesion antes de escribir, para no dejarla a medias
+        try:
+            idRutina = int(request.json["idRutina"])
+            fecha = datetime.strptime(request.json["fecha"], '%Y-%m-%d').date()
+            idPersona = int(request.json["idPersona"])
+            entrenamientos = request.json["entrenamientos"]
+            if not isinstance(entrenamientos, list) or not entrenamientos:
+                raise ValueError(entrenamientos)
+        except (KeyError, TypeError, ValueError):
+            return {"mensaje": "Sesion de entrenamiento invalida"}, 400
+
+        tiempos = {}
+        errores = []
+        nuevos_entrenamientos = []
+        for indice, entrenamiento in enumerate(entrenamientos):
+            try:
+                # Cada tiempo distinto se interpreta una sola vez
+                if entrenamiento["tiempo"] not in tiempos:
+                    tiempos[entrenamiento["tiempo"]] = datetime.strptime(entrenamiento["tiempo"], '%H:%M:%S').time()
+                nuevos_entrenamientos.append(Entrenamiento(
+                    tiempo=tiempos[entrenamiento["tiempo"]],
+                    repeticiones=float(entrenamiento["repeticiones"]),
+                    fecha=fecha,
+                    ejercicio=int(entrenamiento["ejercicio"]),
+                    persona=idPersona,
+                    rutina=idRutina
+                ))
+            except (KeyError, TypeError, ValueError) as error:
+                errores.append({"indice": indice, "error": "Valor invalido: {}".format(error)})
+        if not errores:
+            id_ejercicios = {entrenamiento.ejercicio for entrenamiento in nuevos_entrenamientos}
+            existentes = {id_ejercicio for id_ejercicio, in db.session.query(Ejercicio.id).filter(Ejercicio.id.in_(id_ejercicios))}
+            errores = [{"indice": indice, "error": "El ejercicio {} no existe".format(entrenamiento.ejercicio)}
+                       for indice, entrenamiento in enumerate(nuevos_entrenamientos) if entrenamiento.ejercicio not in existentes]
+        if errores:
+            return {"mensaje": "Sesion de entrenamiento invalida", "errores": errores}, 400
+
+        # Una sola transaccion para toda la sesion
+        db.session.add_all(nuevos_entrenamientos)
+        db.session.flush()
+        ids = [entrenamiento.id for entrenamiento in nuevos_entrenamientos]
+        db.session.commit()
+        return {"mensaje": "proceso exitoso", "ids": ids}, 200
 
 
 class VistaRutinaEntrenamientoPersona(Resource):
     @jwt_required()
     def get(self,id_persona):
-        persona = Persona.query.get_or_404(id_persona)
-        entrenamientorutina_array = []
-        for entrenamiento in persona.entrenamientos:
-            ejercicio = Ejercicio.query.get_or_404(entrenamiento.ejercicio)
-            entrenamiento_schema_dump = entrenamiento_schema.dump(entrenamiento)
-            if entrenamiento_schema_dump['rutina'] != None:
-              entrenamiento_schema_dump['ejercicio'] = ejercicio_schema.dump(ejercicio)
-              entrenamientorutina_array.append(entrenamiento_schema_dump)
-        
+        try:
+            limite = leer_limite(request.args)
+            cursor = request.args.get('cursor')
+            if cursor is not None:
+                fecha_cursor, rutina_cursor = decodificar_cursor(cursor)
+                fecha_cursor = datetime.strptime(fecha_cursor, '%Y-%m-%d').date()
+            normalizado = leer_normalizado(request.args)
+        except (ValueError, TypeError):
+            return 'Parametros de consulta invalidos', 400
+
+        # Cada sesion (fecha, rutina) se agrupa y totaliza en la base de datos, con el tiempo en segundos.
+        # Las repeticiones se truncan por entrenamiento antes de sumarlas, igual que int(float(r)) por fila
+        consulta = db.session.query(Entrenamiento.fecha, Entrenamiento.rutina,
+                                    func.sum(cast(Entrenamiento.repeticiones, Integer)),
+                                    func.sum(UtilidadResumen().dar_segundos_sql(Entrenamiento.tiempo))) \
+            .filter(Entrenamiento.persona == id_persona, Entrenamiento.rutina.isnot(None))
+        if cursor is not None:
+            consulta = consulta.filter(or_(Entrenamiento.fecha > fecha_cursor,
+                                           and_(Entrenamiento.fecha == fecha_cursor, Entrenamiento.rutina > rutina_cursor)))
+        consulta = consulta.group_by(Entrenamiento.fecha, Entrenamiento.rutina) \
+            .order_by(Entrenamiento.fecha, Entrenamiento.rutina)
+        if limite is not None:
+            consulta = consulta.limit(limite + 1)
+        sesiones = consulta.all()
+        if not sesiones:
+            Persona.query.get_or_404(id_persona)
+            return {"sesiones": [], "rutinas": {}, "ejercicios": {}} if normalizado else []
+
+        encabezados = {}
+        if limite is not None and len(sesiones) > limite:
+            sesiones = sesiones[:limite]
+            encabezados['X-Siguiente-Cursor'] = codificar_cursor([str(sesiones[-1][0]), sesiones[-1][1]])
+
+        # Los entrenamientos, ejercicios y rutinas de la pagina se consultan y serializan una sola vez
+        fechas = {fecha for fecha, rutina, repeticiones, segundos in sesiones}
+        id_rutinas = {rutina for fecha, rutina, repeticiones, segundos in sesiones}
+        entrenamientos = {}
+        for entrenamiento in Entrenamiento.query.filter(Entrenamiento.persona == id_persona,
+                                                        Entrenamiento.fecha.in_(fechas),
+                                                        Entrenamiento.rutina.in_(id_rutinas)) \
+                .order_by(Entrenamiento.id):
+            entrenamientos.setdefault((entrenamiento.fecha, entrenamiento.rutina), []).append(entrenamiento)
+        serializador_rutina = rutina_normalizado_serializador if normalizado else rutina_serializador
+        rutinas = {int(rutina['id']): rutina
+                   for rutina in serializador_rutina.serializar_lista(Rutina.query.filter(Rutina.id.in_(id_rutinas)))}
+        id_ejercicios = {entrenamiento.ejercicio for grupo in entrenamientos.values() for entrenamiento in grupo}
+        if normalizado:
+            id_ejercicios.update(id_ejercicio for rutina in rutinas.values() for id_ejercicio in rutina['ejercicios'])
+            for rutina in rutinas.values():
+                rutina['ejercicios'] = [str(id_ejercicio) for id_ejercicio in rutina['ejercicios']]
+        serializador_ejercicio = ejercicio_normalizado_serializador if normalizado else ejercicio_serializador
+        ejercicios = Ejercicio.query.filter(Ejercicio.id.in_(id_ejercicios))
+        ejercicios = {int(ejercicio['id']): ejercicio for ejercicio in serializador_ejercicio.serializar_lista(ejercicios)}
+
         result = []
-        key_function = lambda x: (x["fecha"], x["rutina"], x["persona"])
-        entrenamientorutina_array.sort(key = key_function)
-        for group, entrenamientos in groupby(entrenamientorutina_array, key_function):
-                user = {
-                        "fecha": group[0],
-                        "rutina": rutina_schema.dump(Rutina.query.get_or_404(group[1])),
-                        "persona": group[2],
-                        "repeticionesTotales": 0,
-                        "tiempoTotal": "00:00:00",
-                        "entrenamientos": []
-                }
-                ttoal = [0,0,0]
-                for entrenamiento in entrenamientos:
-                    user["repeticionesTotales"] += int(float(entrenamiento["repeticiones"]))
-                    arr = entrenamiento["tiempo"].split(':')
-                    ttoal[0] += int(arr[0])
-                    ttoal[1] += int(arr[1])
-                    if(ttoal[1] > 60):
-                        ttoal[0] += int(ttoal[1] / 60)
-                        ttoal[1] = int(ttoal[1] % 60)
-                    ttoal[2] += int(arr[2])
-                    if(ttoal[2] > 60):
-                        ttoal[1] += int(ttoal[2] / 60)
-                        ttoal[2] = int(ttoal[2] % 60)
-                    user["entrenamientos"].append(entrenamiento)
-                user["tiempoTotal"] = str(datetime.strptime(":".join(str(n) for n in ttoal), '%H:%M:%S').time())
-                result.append(user)
-        return [entrenamientoRutina for entrenamientoRutina in result]
-   
+        for fecha, id_rutina, repeticiones, segundos in sesiones:
+            if id_rutina not in rutinas:
+                abort(404)
+            segundos = int(segundos or 0)
+            sesion = {
+                "fecha": str(fecha),
+                "rutina": str(id_rutina) if normalizado else rutinas[id_rutina],
+                "persona": id_persona,
+                "repeticionesTotales": int(repeticiones or 0),
+                "segundosTotales": segundos,
+                # Las horas no se limitan a 24 para las sesiones largas
+                "tiempoTotal": "{:02d}:{:02d}:{:02d}".format(segundos // 3600, segundos // 60 % 60, segundos % 60),
+                "entrenamientos": []
+            }
+            for entrenamiento_schema_dump in entrenamiento_serializador.serializar_lista(
+                    entrenamientos.get((fecha, id_rutina), [])):
+                if entrenamiento_schema_dump['ejercicio'] not in ejercicios:
+                    abort(404)
+                if normalizado:
+                    referenciar_ids(entrenamiento_schema_dump)
+                else:
+                    entrenamiento_schema_dump['ejercicio'] = ejercicios[entrenamiento_schema_dump['ejercicio']]
+                sesion["entrenamientos"].append(entrenamiento_schema_dump)
+            result.append(sesion)
+        if normalizado:
+            return {"sesiones": result,
+                    "rutinas": {rutina['id']: rutina for rutina in rutinas.values()},
+                    "ejercicios": {ejercicio['id']: ejercicio for ejercicio in ejercicios.values()}}, 200, encabezados
+        return result, 200, encabezados
 
 
 class VistaResultadosEntrenamientos(Resource):
     @jwt_required()
     def get(self, id_persona):
-        sql_resultados = db.session.execute("SELECT T1.persona, T1.fecha, T1.[Tipo de Entrenamiento], SUM(repeticiones) AS [Repeticiones Ejecutadas], SUM(T1.[Total Calorias]) AS [Calorias Consumidas] \
-                                            FROM (SELECT ENTR.persona, ENTR.fecha, 'Ejercicio' AS [Tipo de Entrenamiento], ENTR.repeticiones, EJER.calorias AS calorias_por_repeticion, ENTR.repeticiones*EJER.calorias AS [Total Calorias] \
-                                            FROM ENTRENAMIENTO AS ENTR, EJERCICIO AS EJER WHERE ENTR.RUTINA IS NULL AND ENTR.EJERCICIO=EJER.ID) AS T1 GROUP BY T1.Fecha, T1.[Tipo de Entrenamiento] HAVING persona="+str(id_persona)+" " \
-                                            "UNION SELECT T1.persona, T1.fecha, T1.[Tipo de Entrenamiento], SUM(repeticiones) AS [Repeticiones Ejecutadas], SUM(T1.[Total Calorias]) AS [Calorias Consumidas] \
-                                            FROM (SELECT ENTR.persona, ENTR.fecha, 'Rutina' AS [Tipo de Entrenamiento], ENTR.repeticiones, EJER.calorias AS calorias_por_repeticion, ENTR.repeticiones*EJER.calorias AS [Total Calorias] \
-                                            FROM ENTRENAMIENTO AS ENTR, EJERCICIO AS EJER WHERE ENTR.RUTINA IS NOT NULL AND ENTR.EJERCICIO=EJER.ID) AS T1 GROUP BY T1.Fecha, T1.[Tipo de Entrenamiento] HAVING persona="+str(id_persona)+" ORDER BY fecha, [Tipo de Entrenamiento]")
-        
-        
-        return jsonify([dict(registro) for registro in sql_resultados])
-    
+        if request.args:
+            try:
+                desde = leer_fecha(request.args, 'desde')
+                hasta = leer_fecha(request.args, 'hasta')
+            except ValueError:
+                return 'Parametros de consulta invalidos', 400
+            return jsonify(UtilidadResumen().dar_resultados_entrenamientos(id_persona, desde, hasta))
+
+        resultados, generacion = cache_reportes.obtener(id_persona, 'resultados')
+        if resultados is None:
+            resultados = UtilidadResumen().dar_resultados_entrenamientos(id_persona)
+            cache_reportes.guardar(id_persona, 'resultados', resultados, generacion)
+        return jsonify(resultados)
+
+
+class VistaExportaciones(Resource):
+    @jwt_required()
+    def post(self):
+        formato = request.json.get("formato", "csv")
+        id_persona = request.json.get("persona")
+        id_entrenador = request.json.get("entrenador")
+        if formato not in FORMATOS or (id_persona is None) == (id_entrenador is None):
+            return 'Solicitud de exportacion invalida', 400
+        nueva_exportacion = Exportacion(
+            estado=PENDIENTE,
+            formato=formato,
+            persona=id_persona,
+            entrenador=id_entrenador,
+            creada=datetime.now()
+        )
+        db.session.add(nueva_exportacion)
+        db.session.commit()
+        try:
+            gestor_exportaciones.encolar(current_app._get_current_object(), nueva_exportacion.id)
+        except ColaLlena:
+            db.session.delete(nueva_exportacion)
+            db.session.commit()
+            return 'La cola de exportaciones esta llena', 503
+        return exportacion_schema.dump(nueva_exportacion), 202
+
+
+class VistaExportacion(Resource):
+    @jwt_required()
+    def get(self, id_exportacion):
+        return exportacion_schema.dump(Exportacion.query.get_or_404(id_exportacion))
+
+
+class VistaExportarDatos(Resource):
+    @jwt_required()
+    def get(self, tabla=None):
+        formato = request.args.get('formato', 'ndjson')
+        try:
+            tamano_lote = min(leer_limite(request.args, 'lote') or current_app.config['EXPORTACION_LOTE'],
+                              current_app.config['EXPORTACION_LOTE_MAXIMO'])
+        except ValueError:
+            return 'Parametros de consulta invalidos', 400
+        if tabla is not None and tabla not in TABLAS_EXPORTACION:
+            return 'Tabla no encontrada', 404
+        # El CSV tiene un encabezado por tabla, por eso se exporta una tabla a la vez
+        if formato not in FORMATOS or (formato == 'csv' and tabla is None):
+            return 'Parametros de consulta invalidos', 400
+        exportador = ExportadorDatos(formato, None if tabla is None else [tabla], tamano_lote)
+
+        def generar():
+            inicio = time.monotonic()
+            yield from exportador.generar()
+            duracion = time.monotonic() - inicio
+            current_app.logger.info('Exportacion de %s: %d filas en %.2f s (%.0f filas/s)', ', '.join(exportador.tablas),
+                                    exportador.filas, duracion, exportador.filas / duracion if duracion else 0)
+
+        tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(generar()), mimetype=tipo)
+
+
+class VistaArchivoExportacion(Resource):
+    @jwt_required()
+    def get(self, id_exportacion):
+        exportacion = Exportacion.query.get_or_404(id_exportacion)
+        if exportacion.estado != TERMINADA:
+            return 'La exportacion no ha terminado', 409
+        tipo = 'text/csv' if exportacion.formato == 'csv' else 'application/x-ndjson'
+        return send_file(exportacion.archivo, mimetype=tipo, as_attachment=True,
+                         attachment_filename='exportacion_{}.{}'.format(exportacion.id, exportacion.formato))
+
+
+class VistaCacheReportes(Resource):
+    @jwt_required()
+    def get(self):
+        return cache_reportes.dar_estadisticas()
+
+
+class VistaImportacion(Resource):
+    @jwt_required()
+    def post(self, recurso):
+        if recurso not in RECURSOS:
+            return 'Recurso no soportado', 404
+        try:
+            tamano_lote = min(leer_limite(request.args, 'lote') or current_app.config['IMPORTACION_LOTE'],
+                              current_app.config['IMPORTACION_LOTE_MAXIMO'])
+            parametros = {}
+            if recurso == 'personas':
+                parametros['entrenador'] = int(request.args['entrenador'])
+        except (KeyError, ValueError):
+            return 'Parametros de consulta invalidos', 400
+        # El cuerpo se lee como flujo, una linea NDJSON a la vez
+        importador = ImportadorNDJSON(recurso, parametros, tamano_lote,
+                                      current_app.config['IMPORTACION_ERRORES_MAXIMOS'],
+                                      current_app.config['IMPORTACION_LINEA_MAXIMA'])
+        return importador.importar(request.stream), 200